@@ -1,5 +1,20 @@
-from bot.app import main
+import sys
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if sys.argv[1:2] == ["simulate"]:
+        from bot.simulate import main
+
+        main(sys.argv[2:])
+    elif sys.argv[1:2] == ["loadtest"]:
+        from bot.loadtest import main
+
+        main(sys.argv[2:])
+    elif sys.argv[1:2] == ["replay"]:
+        from bot.replay import main
+
+        main(sys.argv[2:])
+    else:
+        from bot.app import main
+
+        main()
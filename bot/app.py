@@ -1,9 +1,11 @@
-import sqlite3
+import asyncio
+from functools import partial
 
 from telegram.ext import Application, CallbackQueryHandler, CommandHandler, MessageHandler, filters
 
-from .db import init_db
-from .events import ensure_chat_event_schedule
+from .clicks import drain_clicks
+from .concurrency import KeyedUpdateProcessor
+from .events import start_events, stop_events
 from .handlers import (
     beat,
     buy_boost,
@@ -12,19 +14,86 @@ from .handlers import (
     handle_aliases,
     handle_event_click,
     leaderboard,
+    rank,
     rep_balance,
     shop,
     start,
 )
-from .settings import DB_PATH, TOKEN
+from .lifecycle import configure_logging
+from .membership import flush_group_members, warm_membership_cache
+from .metrics import (
+    PENDING_UPDATES,
+    InstrumentedStorage,
+    instrument_handlers,
+    start_metrics_server,
+    stop_metrics_server,
+)
+from .outbound import outbox
+from .ranks import load_power_index
+from .recorder import RecordingQueue, recorder
+from .settings import (
+    BOT_API_URL,
+    MEMBERSHIP_FLUSH_SECONDS,
+    RECORD_DIR,
+    STORAGE_ENGINE,
+    TOKEN,
+    UPDATE_CONCURRENCY,
+    WEBHOOK_MODE,
+    WORKER_PROCESSES,
+    WRITE_BEHIND,
+)
+from .storage import Storage, create_storage, get_storage, set_storage
+from .userstate import WriteBehindStorage
+from .webhook import run_webhook, update_backlog
+from .workers import run_workers
 
 
-def main() -> None:
-    if not TOKEN:
-        raise RuntimeError("TELEGRAM_BOT_TOKEN is not set")
-    init_db()
+async def post_init(application: Application) -> None:
+    await get_storage().start()
+    await warm_membership_cache()
+    await load_power_index()
+    application.job_queue.run_repeating(
+        flush_group_members,
+        MEMBERSHIP_FLUSH_SECONDS,
+        name="flush_group_members",
+    )
+    await start_events(application.bot)
+    PENDING_UPDATES.set_function(partial(update_backlog, application))
+    await start_metrics_server()
+
+
+async def post_stop(application: Application) -> None:
+    # Runs while the bot can still make requests: pending click summaries and
+    # queued messages go out before the HTTP client is shut down.
+    await stop_events()
+    await drain_clicks()
+    await outbox.stop()
+
 
-    application = Application.builder().token(TOKEN).build()
+async def post_shutdown(application: Application) -> None:
+    await flush_group_members()
+    await get_storage().close()
+    await recorder.stop()
+    await stop_metrics_server()
+
+
+def build_application(with_updater: bool = True) -> Application:
+    builder = (
+        Application.builder()
+        .token(TOKEN)
+        .base_url(BOT_API_URL)
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+    )
+    if not with_updater:
+        builder = builder.updater(None)
+    if RECORD_DIR:
+        recorder.start(RECORD_DIR)
+        builder = builder.update_queue(RecordingQueue(recorder))
+    if UPDATE_CONCURRENCY > 1:
+        builder = builder.concurrent_updates(KeyedUpdateProcessor(UPDATE_CONCURRENCY))
+    application = builder.build()
 
     application.add_handler(CommandHandler(["start", "help"], start))
     application.add_handler(CommandHandler(["beat", "hit"], beat))
@@ -34,12 +103,33 @@ def main() -> None:
     application.add_handler(CommandHandler(["event"], event_time))
     application.add_handler(CommandHandler(["top", "leaderboard"], leaderboard))
     application.add_handler(CommandHandler(["global", "all", "globaltop"], global_leaderboard))
+    application.add_handler(CommandHandler(["rank"], rank))
     application.add_handler(CallbackQueryHandler(handle_event_click))
     application.add_handler(MessageHandler(filters.TEXT, handle_aliases))
+    instrument_handlers(application)
+    return application
+
+
+def configure_storage(timings: dict[str, list[float]] | None = None) -> Storage:
+    storage = create_storage()
+    if WRITE_BEHIND:
+        storage = WriteBehindStorage(storage)
+    return InstrumentedStorage(storage, timings)
 
-    with sqlite3.connect(DB_PATH) as conn:
-        chat_rows = conn.execute("SELECT chat_id FROM chat_events").fetchall()
-    for (chat_id,) in chat_rows:
-        ensure_chat_event_schedule(int(chat_id), application.job_queue)
 
-    application.run_polling()
+def main() -> None:
+    if not TOKEN:
+        raise RuntimeError("TELEGRAM_BOT_TOKEN is not set")
+    if WORKER_PROCESSES > 1 and (WRITE_BEHIND or STORAGE_ENGINE != "sqlite"):
+        raise RuntimeError("VITYA_WORKERS needs the sqlite engine without write-behind")
+    configure_logging()
+    storage = configure_storage()
+    set_storage(storage)
+    storage.initialize()
+
+    if WORKER_PROCESSES > 1:
+        asyncio.run(run_workers(WORKER_PROCESSES, partial(build_application, with_updater=False)))
+    elif WEBHOOK_MODE:
+        asyncio.run(run_webhook(build_application(with_updater=False)))
+    else:
+        build_application().run_polling()
@@ -0,0 +1,207 @@
+import asyncio
+import html
+import logging
+import time
+from dataclasses import dataclass, field
+
+from telegram import Bot
+from telegram.constants import ParseMode
+
+from .cooldowns import set_ready_at
+from .leaderboards import record_power, record_profile
+from .metrics import ACTIVE_EVENTS
+from .models import EventSpec
+from .outbound import PRIORITY_EVENT, edit_message_text, send_message
+from .profiles import profile_changed, remember_profile
+from .ranks import index_power
+from .settings import (
+    EVENT_CLICK_FLUSH_SECONDS,
+    EVENT_CLICK_MAX_ATTEMPTS,
+    EVENT_SUMMARY_MAX_LINES,
+)
+from .storage import get_storage
+from .utils import format_cooldown, get_event_spec, get_user_display, roll_outcome
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PendingClick:
+    user_id: int
+    username: str | None
+    first_name: str | None
+    store_profile: bool
+    attempts: int = 0
+
+
+@dataclass
+class ActiveEvent:
+    event_id: int
+    chat_id: int
+    spec: EventSpec
+    end_ts: int
+    clicked: set[int] = field(default_factory=set)
+    pending: list[PendingClick] = field(default_factory=list)
+    lines: list[str] = field(default_factory=list)
+    summary_message_id: int | None = None
+    flusher: asyncio.Task | None = None
+
+
+_events: dict[int, ActiveEvent] = {}
+
+
+def register_event(event_id: int, chat_id: int, spec: EventSpec, end_ts: int) -> None:
+    _events[event_id] = ActiveEvent(event_id, chat_id, spec, end_ts)
+
+
+async def drain_clicks() -> None:
+    flushers = [event.flusher for event in _events.values() if event.flusher is not None]
+    await asyncio.gather(*flushers, return_exceptions=True)
+
+
+def active_event_count() -> int:
+    now = time.time()
+    return sum(1 for event in _events.values() if event.end_ts > now)
+
+
+ACTIVE_EVENTS.set_function(active_event_count)
+
+
+def forget_events(event_ids: list[int]) -> None:
+    for event_id in event_ids:
+        _events.pop(event_id, None)
+
+
+async def _load_event(event_id: int) -> ActiveEvent | None:
+    event = _events.get(event_id)
+    if event is not None:
+        return event
+    row = await get_storage().get_event_with_clicks(event_id)
+    if row is None:
+        return None
+    chat_id, event_type, end_ts, clicked = row
+    loaded = ActiveEvent(event_id, chat_id, get_event_spec(event_type), end_ts, clicked=clicked)
+    return _events.setdefault(event_id, loaded)
+
+
+async def submit_click(
+    bot: Bot,
+    event_id: int,
+    user_id: int,
+    username: str | None,
+    first_name: str | None,
+) -> str:
+    event = await _load_event(event_id)
+    if event is None or int(time.time()) > event.end_ts:
+        return "expired"
+    if user_id in event.clicked:
+        return "duplicate"
+    event.clicked.add(user_id)
+    event.pending.append(
+        PendingClick(user_id, username, first_name, profile_changed(user_id, username, first_name))
+    )
+    if event.flusher is None or event.flusher.done():
+        event.flusher = asyncio.create_task(_flush_clicks(bot, event))
+    return "accepted"
+
+
+async def _flush_clicks(bot: Bot, event: ActiveEvent) -> None:
+    while event.pending:
+        await asyncio.sleep(EVENT_CLICK_FLUSH_SECONDS)
+        batch, event.pending = event.pending, []
+        if await _apply_batch(event, batch):
+            await _publish_summary(bot, event)
+
+
+def _requeue_clicks(event: ActiveEvent, batch: list[PendingClick]) -> None:
+    # Failed clicks go back to the front of the queue. After
+    # EVENT_CLICK_MAX_ATTEMPTS they are given up on, and the users may click
+    # again since nothing was stored for them.
+    retry = []
+    for click in batch:
+        click.attempts += 1
+        if click.attempts < EVENT_CLICK_MAX_ATTEMPTS:
+            retry.append(click)
+        else:
+            event.clicked.discard(click.user_id)
+    event.pending[:0] = retry
+    dropped = len(batch) - len(retry)
+    if dropped:
+        logger.error("Dropped %d clicks for event %s", dropped, event.event_id)
+
+
+async def _apply_batch(event: ActiveEvent, batch: list[PendingClick]) -> bool:
+    spec = event.spec
+    outcomes = {}
+    clicks = []
+    for click in batch:
+        power_delta = None
+        if spec.event_type != "time":
+            outcome, roll = roll_outcome()
+            power_delta = int(round(roll * spec.power_multiplier))
+            outcomes[click.user_id] = outcome
+        clicks.append(
+            (click.user_id, click.username, click.first_name, click.store_profile, power_delta)
+        )
+    now_ts = int(time.time())
+    try:
+        results = await get_storage().apply_event_clicks(
+            event.event_id, clicks, spec.cooldown_multiplier, now_ts
+        )
+    except Exception:
+        logger.exception("Failed to apply %d clicks for event %s", len(batch), event.event_id)
+        _requeue_clicks(event, batch)
+        return False
+    for click, (power_delta, new_total, new_remaining) in zip(batch, results):
+        if click.store_profile:
+            remember_profile(click.user_id, click.username, click.first_name)
+            record_profile(click.user_id, click.username, click.first_name)
+        display = html.escape(get_user_display(click.username, click.first_name, click.user_id))
+        if new_total is None:
+            set_ready_at(click.user_id, now_ts + new_remaining)
+            event.lines.append(
+                f"⏩ {display}: кулдаун теперь {format_cooldown(new_remaining)}"
+            )
+            continue
+        record_power(click.user_id, new_total, click.username, click.first_name)
+        index_power(click.user_id, new_total)
+        event.lines.append(
+            f"💥 <b>{display}</b>: {outcomes[click.user_id].name}, "
+            f"сила <b>{power_delta}</b>, мощь <b>{new_total}</b>"
+        )
+    return True
+
+
+def _summary_text(event: ActiveEvent) -> str:
+    lines = [f"🎯 <b>{event.spec.title}</b> — участники ({len(event.lines)}):"]
+    lines.extend(event.lines[:EVENT_SUMMARY_MAX_LINES])
+    hidden = len(event.lines) - EVENT_SUMMARY_MAX_LINES
+    if hidden > 0:
+        lines.append(f"…и ещё {hidden}")
+    return "\n".join(lines)
+
+
+async def _publish_summary(bot: Bot, event: ActiveEvent) -> None:
+    text = _summary_text(event)
+    try:
+        if event.summary_message_id is None:
+            message = await send_message(
+                bot,
+                chat_id=event.chat_id,
+                text=text,
+                priority=PRIORITY_EVENT,
+                parse_mode=ParseMode.HTML,
+            )
+            event.summary_message_id = message.message_id
+        else:
+            await edit_message_text(
+                bot,
+                chat_id=event.chat_id,
+                message_id=event.summary_message_id,
+                text=text,
+                priority=PRIORITY_EVENT,
+                coalesce_key=("event_summary", event.event_id),
+                parse_mode=ParseMode.HTML,
+            )
+    except Exception:
+        logger.exception("Failed to publish summary for event %s", event.event_id)
@@ -0,0 +1,87 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Hashable
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from .settings import UPDATE_MAX_ADMITTED
+
+
+class _KeyedLock:
+    __slots__ = ("lock", "holders")
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        self.holders = 0
+
+
+class KeyedLocks:
+    def __init__(self) -> None:
+        self._locks: dict[Hashable, _KeyedLock] = {}
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    @asynccontextmanager
+    async def hold(self, key: Hashable) -> AsyncIterator[None]:
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = _KeyedLock()
+        entry.holders += 1
+        try:
+            async with entry.lock:
+                yield
+        finally:
+            entry.holders -= 1
+            if not entry.holders:
+                del self._locks[key]
+
+
+def _update_keys(update: object) -> list[Hashable]:
+    keys: list[Hashable] = []
+    if isinstance(update, Update):
+        if update.effective_chat is not None:
+            keys.append(("chat", update.effective_chat.id))
+        if update.effective_user is not None:
+            keys.append(("user", update.effective_user.id))
+    return keys
+
+
+class KeyedUpdateProcessor(BaseUpdateProcessor):
+    # Updates from different chats and users run in parallel, while updates
+    # sharing a chat or a user run one at a time in arrival order. Locks are
+    # always taken chat first, then user, so two updates never wait on each
+    # other in a cycle. PTB acquires its own semaphore before calling
+    # do_process_update, so that one only bounds admitted updates; the real
+    # ceiling is applied after the keyed locks, and updates queued behind one
+    # busy chat do not occupy worker slots.
+    def __init__(self, max_concurrent: int) -> None:
+        super().__init__(max(UPDATE_MAX_ADMITTED, max_concurrent))
+        self._workers = asyncio.Semaphore(max_concurrent)
+        self._locks = KeyedLocks()
+        self.pending = 0
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        self.pending += 1
+        try:
+            async with self._hold(_update_keys(update)):
+                async with self._workers:
+                    await coroutine
+        finally:
+            self.pending -= 1
+
+    @asynccontextmanager
+    async def _hold(self, keys: list[Hashable]) -> AsyncIterator[None]:
+        if not keys:
+            yield
+            return
+        async with self._locks.hold(keys[0]):
+            async with self._hold(keys[1:]):
+                yield
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
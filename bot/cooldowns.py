@@ -0,0 +1,63 @@
+import time
+from collections import OrderedDict
+
+from .settings import (
+    COOLDOWN_CACHE_SIZE,
+    EARLY_REPLY_BURST,
+    EARLY_REPLY_REFILL_SECONDS,
+)
+from .storage import get_storage
+
+_ready_at: OrderedDict[int, int] = OrderedDict()
+_reply_buckets: OrderedDict[int, tuple[float, float]] = OrderedDict()
+# In worker mode other processes change cooldowns too (beats and time events
+# in the chats they own), so a cached deadline may be later than the real
+# one. It then only decides when to look, and the database has the last word.
+_shared = False
+
+
+def set_shared_cooldowns(shared: bool) -> None:
+    global _shared
+    _shared = shared
+
+
+def cooldown_remaining(user_id: int, now_ts: int) -> int:
+    ready_at = _ready_at.get(user_id)
+    if ready_at is None:
+        return 0
+    if ready_at <= now_ts:
+        del _ready_at[user_id]
+        return 0
+    return ready_at - now_ts
+
+
+async def check_cooldown(user_id: int, now_ts: int) -> int:
+    remaining = cooldown_remaining(user_id, now_ts)
+    if remaining == 0 or not _shared:
+        return remaining
+    _power, last_hit_ts, _respect, _power_x, _cooldown_x, seconds = (
+        await get_storage().get_user_state(user_id)
+    )
+    set_ready_at(user_id, last_hit_ts + seconds)
+    return cooldown_remaining(user_id, now_ts)
+
+
+def set_ready_at(user_id: int, ready_at: int) -> None:
+    _ready_at[user_id] = ready_at
+    _ready_at.move_to_end(user_id)
+    if len(_ready_at) > COOLDOWN_CACHE_SIZE:
+        _ready_at.popitem(last=False)
+
+
+def allow_early_reply(user_id: int) -> bool:
+    now = time.monotonic()
+    tokens, updated = _reply_buckets.pop(user_id, (float(EARLY_REPLY_BURST), now))
+    tokens = min(float(EARLY_REPLY_BURST), tokens + (now - updated) / EARLY_REPLY_REFILL_SECONDS)
+    allowed = tokens >= 1.0
+    if allowed:
+        tokens -= 1.0
+    if tokens < EARLY_REPLY_BURST:
+        _reply_buckets[user_id] = (tokens, now)
+        if len(_reply_buckets) > COOLDOWN_CACHE_SIZE:
+            _reply_buckets.popitem(last=False)
+    return allowed
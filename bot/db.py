@@ -1,10 +1,155 @@
+import asyncio
+import queue
 import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable
 
-from .settings import COOLDOWN_SECONDS, DB_PATH
+from .metrics import DB_COMMIT_BATCH, DB_COMMIT_SECONDS, DB_WRITE_QUEUE
+from .models import BeatResult, BoardRow, UserRow
+from .settings import (
+    COOLDOWN_SECONDS,
+    DB_BUSY_TIMEOUT_SECONDS,
+    DB_CACHE_SIZE_KIB,
+    DB_GROUP_COMMIT_MAX_BATCH,
+    DB_GROUP_COMMIT_SECONDS,
+    DB_MMAP_SIZE,
+    DB_PATH,
+    DB_READER_THREADS,
+)
+
+# Reads run on a small pool of threads with one long-lived connection each.
+# Writes are queued to a single writer thread that commits them in groups:
+# everything that arrives within DB_GROUP_COMMIT_SECONDS shares one transaction.
+_local = threading.local()
+_readers = ThreadPoolExecutor(max_workers=DB_READER_THREADS, thread_name_prefix="db-reader")
+_write_queue: queue.Queue = queue.Queue()
+_writer_thread: threading.Thread | None = None
+_writer_lock = threading.Lock()
+DB_WRITE_QUEUE.set_function(_write_queue.qsize)
+
+
+def _open_connection() -> sqlite3.Connection:
+    conn = sqlite3.connect(
+        DB_PATH,
+        timeout=DB_BUSY_TIMEOUT_SECONDS,
+        isolation_level=None,
+    )
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute(f"PRAGMA mmap_size = {int(DB_MMAP_SIZE)}")
+    conn.execute(f"PRAGMA cache_size = -{int(DB_CACHE_SIZE_KIB)}")
+    return conn
+
+
+def _connection() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = _open_connection()
+        _local.conn = conn
+    return conn
+
+
+def _resolve(future: asyncio.Future, result: Any, exc: BaseException | None) -> None:
+    if future.done():
+        return
+    if exc is not None:
+        future.set_exception(exc)
+    else:
+        future.set_result(result)
+
+
+def _commit_batch(conn: sqlite3.Connection, batch: list[tuple]) -> None:
+    results: list[tuple[Any, BaseException | None]] = []
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        for func, args, _loop, _future in batch:
+            conn.execute("SAVEPOINT write_op")
+            try:
+                results.append((func(conn, *args), None))
+            except Exception as exc:
+                conn.execute("ROLLBACK TO write_op")
+                results.append((None, exc))
+            conn.execute("RELEASE write_op")
+        conn.execute("COMMIT")
+    except Exception as exc:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        results = [(None, exc)] * len(batch)
+    for (_func, _args, loop, future), (result, exc) in zip(batch, results):
+        try:
+            loop.call_soon_threadsafe(_resolve, future, result, exc)
+        except RuntimeError:
+            pass
+
+
+def _writer_loop() -> None:
+    conn = _open_connection()
+    running = True
+    while running:
+        item = _write_queue.get()
+        if item is None:
+            break
+        batch = [item]
+        deadline = time.monotonic() + DB_GROUP_COMMIT_SECONDS
+        while len(batch) < DB_GROUP_COMMIT_MAX_BATCH:
+            timeout = deadline - time.monotonic()
+            try:
+                if timeout > 0:
+                    item = _write_queue.get(timeout=timeout)
+                else:
+                    item = _write_queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                running = False
+                break
+            batch.append(item)
+        started = time.perf_counter()
+        _commit_batch(conn, batch)
+        DB_COMMIT_SECONDS.observe(time.perf_counter() - started)
+        DB_COMMIT_BATCH.observe(len(batch))
+    conn.close()
+
+
+def _ensure_writer() -> None:
+    global _writer_thread
+    with _writer_lock:
+        if _writer_thread is None or not _writer_thread.is_alive():
+            _writer_thread = threading.Thread(target=_writer_loop, name="db-writer", daemon=True)
+            _writer_thread.start()
+
+
+def _run_read(func: Callable[..., Any], args: tuple) -> Any:
+    return func(_connection(), *args)
+
+
+async def _write(func: Callable[..., Any], *args: Any) -> Any:
+    _ensure_writer()
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    _write_queue.put((func, args, loop, future))
+    return await future
+
+
+async def _read(func: Callable[..., Any], *args: Any) -> Any:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_readers, _run_read, func, args)
+
+
+async def close_db() -> None:
+    global _writer_thread
+    with _writer_lock:
+        thread, _writer_thread = _writer_thread, None
+    if thread is not None:
+        _write_queue.put(None)
+        await asyncio.to_thread(thread.join)
 
 
 def init_db() -> None:
     with sqlite3.connect(DB_PATH) as conn:
+        conn.execute("PRAGMA journal_mode = WAL")
         conn.execute(
             """
             CREATE TABLE IF NOT EXISTS users (
@@ -55,6 +200,33 @@ def init_db() -> None:
             """
         )
         ensure_user_columns(conn)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_users_power ON users (power)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_events_end_ts ON events (end_ts)")
+        # Every insert, and every change of power or name, stamps the row with
+        # the next change number so other processes can read just what changed.
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_users_changed_seq ON users (changed_seq)")
+        conn.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS users_inserted AFTER INSERT ON users
+            BEGIN
+                UPDATE users SET changed_seq = (SELECT MAX(changed_seq) FROM users) + 1
+                WHERE user_id = NEW.user_id;
+            END
+            """
+        )
+        conn.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS users_changed
+            AFTER UPDATE OF power, username, first_name ON users
+            WHEN OLD.power IS NOT NEW.power
+                OR OLD.username IS NOT NEW.username
+                OR OLD.first_name IS NOT NEW.first_name
+            BEGIN
+                UPDATE users SET changed_seq = (SELECT MAX(changed_seq) FROM users) + 1
+                WHERE user_id = NEW.user_id;
+            END
+            """
+        )
 
 
 def ensure_user_columns(conn: sqlite3.Connection) -> None:
@@ -74,138 +246,658 @@ def ensure_user_columns(conn: sqlite3.Connection) -> None:
             "ALTER TABLE users ADD COLUMN cooldown_seconds INTEGER NOT NULL DEFAULT "
             f"{COOLDOWN_SECONDS}"
         )
+    if "changed_seq" not in existing:
+        conn.execute("ALTER TABLE users ADD COLUMN changed_seq INTEGER NOT NULL DEFAULT 0")
 
 
-def upsert_user(user_id: int, username: str | None, first_name: str | None) -> None:
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute(
-            """
-            INSERT INTO users (user_id, username, first_name)
-            VALUES (?, ?, ?)
-            ON CONFLICT(user_id) DO UPDATE SET
-                username = excluded.username,
-                first_name = excluded.first_name
-            """,
-            (user_id, username, first_name),
-        )
+def _upsert_user(
+    conn: sqlite3.Connection,
+    user_id: int,
+    username: str | None,
+    first_name: str | None,
+) -> None:
+    conn.execute(
+        """
+        INSERT INTO users (user_id, username, first_name)
+        VALUES (?, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET
+            username = excluded.username,
+            first_name = excluded.first_name
+        """,
+        (user_id, username, first_name),
+    )
 
 
-def get_user_state(user_id: int) -> tuple[int, int, int, float, float, int]:
-    with sqlite3.connect(DB_PATH) as conn:
-        row = conn.execute(
-            """
-            SELECT power, last_hit_ts, respect_points,
-                   pending_power_multiplier, pending_cooldown_multiplier, cooldown_seconds
-            FROM users
-            WHERE user_id = ?
-            """,
-            (user_id,),
-        ).fetchone()
-        if row is None:
-            return 0, 0, 0, 1.0, 1.0, COOLDOWN_SECONDS
-        return (
-            int(row[0]),
-            int(row[1]),
-            int(row[2]),
-            float(row[3]),
-            float(row[4]),
-            int(row[5]),
+async def upsert_user(user_id: int, username: str | None, first_name: str | None) -> None:
+    await _write(_upsert_user, user_id, username, first_name)
+
+
+def _get_user_state(
+    conn: sqlite3.Connection,
+    user_id: int,
+) -> tuple[int, int, int, float, float, int]:
+    row = conn.execute(
+        """
+        SELECT power, last_hit_ts, respect_points,
+               pending_power_multiplier, pending_cooldown_multiplier, cooldown_seconds
+        FROM users
+        WHERE user_id = ?
+        """,
+        (user_id,),
+    ).fetchone()
+    if row is None:
+        return 0, 0, 0, 1.0, 1.0, COOLDOWN_SECONDS
+    return (
+        int(row[0]),
+        int(row[1]),
+        int(row[2]),
+        float(row[3]),
+        float(row[4]),
+        int(row[5]),
+    )
+
+
+async def get_user_state(user_id: int) -> tuple[int, int, int, float, float, int]:
+    return await _read(_get_user_state, user_id)
+
+
+def _get_user_row(conn: sqlite3.Connection, user_id: int) -> UserRow | None:
+    row = conn.execute(
+        """
+        SELECT user_id, username, first_name, power, last_hit_ts, respect_points,
+               pending_power_multiplier, pending_cooldown_multiplier, cooldown_seconds
+        FROM users
+        WHERE user_id = ?
+        """,
+        (user_id,),
+    ).fetchone()
+    return None if row is None else tuple(row)
+
+
+async def get_user_row(user_id: int) -> UserRow | None:
+    return await _read(_get_user_row, user_id)
+
+
+def _save_user_rows(conn: sqlite3.Connection, rows: list[UserRow]) -> None:
+    conn.executemany(
+        """
+        INSERT INTO users (
+            user_id, username, first_name, power, last_hit_ts, respect_points,
+            pending_power_multiplier, pending_cooldown_multiplier, cooldown_seconds
         )
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET
+            username = excluded.username,
+            first_name = excluded.first_name,
+            power = excluded.power,
+            last_hit_ts = excluded.last_hit_ts,
+            respect_points = excluded.respect_points,
+            pending_power_multiplier = excluded.pending_power_multiplier,
+            pending_cooldown_multiplier = excluded.pending_cooldown_multiplier,
+            cooldown_seconds = excluded.cooldown_seconds
+        """,
+        rows,
+    )
+
+
+async def save_user_rows(rows: list[UserRow]) -> None:
+    await _write(_save_user_rows, rows)
+
+
+def _get_power(conn: sqlite3.Connection, user_id: int, default: int) -> int:
+    row = conn.execute(
+        "SELECT power FROM users WHERE user_id = ?",
+        (user_id,),
+    ).fetchone()
+    return int(row[0]) if row else default
 
 
-def update_user_after_beat(
+def _perform_beat(
+    conn: sqlite3.Connection,
     user_id: int,
-    delta: int,
+    username: str | None,
+    first_name: str | None,
+    group_id: int | None,
+    roll: int,
+    now_ts: int,
+    store_profile: bool,
+) -> BeatResult:
+    if store_profile:
+        _upsert_user(conn, user_id, username, first_name)
+    if group_id is not None:
+        _upsert_group_member(conn, group_id, user_id)
+    row = conn.execute(
+        """
+        SELECT last_hit_ts, cooldown_seconds,
+               pending_power_multiplier, pending_cooldown_multiplier
+        FROM users
+        WHERE user_id = ?
+        """,
+        (user_id,),
+    ).fetchone()
+    if row is None:
+        _upsert_user(conn, user_id, username, first_name)
+        row = (0, COOLDOWN_SECONDS, 1.0, 1.0)
+    last_hit_ts, cooldown_seconds, power_multiplier, cooldown_multiplier = row
+    remaining = int(last_hit_ts) + int(cooldown_seconds) - now_ts
+    if remaining > 0:
+        return BeatResult(remaining_cooldown=remaining, ready_at=now_ts + remaining)
+    power_multiplier = float(power_multiplier)
+    cooldown_multiplier = float(cooldown_multiplier)
+    power_delta = roll
+    if power_multiplier != 1.0:
+        power_delta = int(round(roll * power_multiplier))
+    next_cooldown_seconds = int(COOLDOWN_SECONDS * cooldown_multiplier)
+    rows = conn.execute(
+        """
+        UPDATE users
+        SET power = power + ?, last_hit_ts = ?
+            , cooldown_seconds = ?
+            , respect_points = respect_points + 1
+            , pending_power_multiplier = 1.0
+            , pending_cooldown_multiplier = 1.0
+        WHERE user_id = ? AND last_hit_ts + cooldown_seconds <= ?
+        RETURNING power
+        """,
+        (
+            power_delta,
+            now_ts,
+            next_cooldown_seconds,
+            user_id,
+            now_ts,
+        ),
+    ).fetchall()
+    if not rows:
+        remaining = max(remaining, 1)
+        return BeatResult(remaining_cooldown=remaining, ready_at=now_ts + remaining)
+    return BeatResult(
+        remaining_cooldown=0,
+        ready_at=now_ts + next_cooldown_seconds,
+        power_delta=power_delta,
+        new_total=int(rows[0][0]),
+        power_multiplier=power_multiplier,
+        cooldown_multiplier=cooldown_multiplier,
+    )
+
+
+async def perform_beat(
+    user_id: int,
+    username: str | None,
+    first_name: str | None,
+    group_id: int | None,
+    roll: int,
     now_ts: int,
-    cooldown_seconds: int,
+    store_profile: bool = True,
+) -> BeatResult:
+    return await _write(
+        _perform_beat, user_id, username, first_name, group_id, roll, now_ts, store_profile
+    )
+
+
+def _update_user_power_only(
+    conn: sqlite3.Connection,
+    user_id: int,
+    delta: int,
     respect_delta: int,
 ) -> int:
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute(
-            """
-            UPDATE users
-            SET power = power + ?, last_hit_ts = ?
-                , cooldown_seconds = ?
-                , respect_points = respect_points + ?
-                , pending_power_multiplier = 1.0
-                , pending_cooldown_multiplier = 1.0
-            WHERE user_id = ?
-            """,
-            (delta, now_ts, cooldown_seconds, respect_delta, user_id),
+    conn.execute(
+        """
+        UPDATE users
+        SET power = power + ?, respect_points = respect_points + ?
+        WHERE user_id = ?
+        """,
+        (delta, respect_delta, user_id),
+    )
+    return _get_power(conn, user_id, delta)
+
+
+def _update_user_cooldown(conn: sqlite3.Connection, user_id: int, last_hit_ts: int) -> None:
+    conn.execute(
+        "UPDATE users SET last_hit_ts = ? WHERE user_id = ?",
+        (last_hit_ts, user_id),
+    )
+
+
+_BOOST_COLUMNS = {
+    "vodka": "pending_power_multiplier",
+    "time": "pending_cooldown_multiplier",
+}
+
+
+def _buy_boost(
+    conn: sqlite3.Connection,
+    user_id: int,
+    boost: str,
+    cost: int,
+    multiplier: float,
+) -> str:
+    # One guarded UPDATE, so two purchases racing in different worker
+    # processes can neither both spend the respect nor overwrite each other.
+    column = _BOOST_COLUMNS[boost]
+    cursor = conn.execute(
+        f"""
+        UPDATE users
+        SET respect_points = respect_points - ?, {column} = ?
+        WHERE user_id = ? AND respect_points >= ? AND {column} = 1.0
+        """,
+        (cost, multiplier, user_id, cost),
+    )
+    if cursor.rowcount:
+        return "bought"
+    row = conn.execute(f"SELECT {column} FROM users WHERE user_id = ?", (user_id,)).fetchone()
+    return "active" if row is not None and row[0] != 1.0 else "poor"
+
+
+async def buy_boost(user_id: int, boost: str, cost: int, multiplier: float) -> str:
+    return await _write(_buy_boost, user_id, boost, cost, multiplier)
+
+
+def _upsert_group_member(conn: sqlite3.Connection, group_id: int, user_id: int) -> None:
+    conn.execute(
+        """
+        INSERT INTO group_members (group_id, user_id)
+        VALUES (?, ?)
+        ON CONFLICT(group_id, user_id) DO NOTHING
+        """,
+        (group_id, user_id),
+    )
+
+
+def _insert_group_members(conn: sqlite3.Connection, members: list[tuple[int, int]]) -> None:
+    conn.executemany(
+        """
+        INSERT INTO group_members (group_id, user_id)
+        VALUES (?, ?)
+        ON CONFLICT(group_id, user_id) DO NOTHING
+        """,
+        members,
+    )
+
+
+async def insert_group_members(members: list[tuple[int, int]]) -> None:
+    await _write(_insert_group_members, members)
+
+
+def _get_group_memberships(conn: sqlite3.Connection, limit: int) -> list[tuple[int, int]]:
+    return conn.execute(
+        "SELECT group_id, user_id FROM group_members LIMIT ?",
+        (limit,),
+    ).fetchall()
+
+
+async def get_group_memberships(limit: int) -> list[tuple[int, int]]:
+    return await _read(_get_group_memberships, limit)
+
+
+def _get_group_board(
+    conn: sqlite3.Connection,
+    group_id: int,
+    limit: int,
+) -> tuple[list[tuple[int, int, str | None, str | None]], set[int]]:
+    rows = conn.execute(
+        """
+        SELECT u.power, u.user_id, u.username, u.first_name
+        FROM group_members gm
+        JOIN users u ON u.user_id = gm.user_id
+        WHERE gm.group_id = ?
+        ORDER BY u.power DESC
+        LIMIT ?
+        """,
+        (group_id, limit),
+    ).fetchall()
+    member_ids = {
+        int(row[0])
+        for row in conn.execute(
+            "SELECT user_id FROM group_members WHERE group_id = ?",
+            (group_id,),
         )
-        row = conn.execute(
-            "SELECT power FROM users WHERE user_id = ?",
-            (user_id,),
-        ).fetchone()
-        return int(row[0]) if row else delta
+    }
+    return rows, member_ids
 
 
-def update_user_power_only(user_id: int, delta: int, respect_delta: int) -> int:
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute(
-            """
-            UPDATE users
-            SET power = power + ?, respect_points = respect_points + ?
-            WHERE user_id = ?
-            """,
-            (delta, respect_delta, user_id),
+async def get_group_board(
+    group_id: int,
+    limit: int,
+) -> tuple[list[tuple[int, int, str | None, str | None]], set[int]]:
+    return await _read(_get_group_board, group_id, limit)
+
+
+def _get_global_leaderboard(
+    conn: sqlite3.Connection,
+    limit: int,
+) -> list[tuple[int, int, str | None, str | None]]:
+    return conn.execute(
+        """
+        SELECT power, user_id, username, first_name
+        FROM users
+        ORDER BY power DESC
+        LIMIT ?
+        """,
+        (limit,),
+    ).fetchall()
+
+
+async def get_global_leaderboard(limit: int = 10) -> list[tuple[int, int, str | None, str | None]]:
+    return await _read(_get_global_leaderboard, limit)
+
+
+def _get_user_powers(conn: sqlite3.Connection) -> list[tuple[int, int]]:
+    return conn.execute("SELECT user_id, power FROM users").fetchall()
+
+
+async def get_user_powers() -> list[tuple[int, int]]:
+    return await _read(_get_user_powers)
+
+
+def _get_user_changes(
+    conn: sqlite3.Connection,
+    since: int,
+    limit: int,
+) -> tuple[int, list[BoardRow]]:
+    latest = int(conn.execute("SELECT COALESCE(MAX(changed_seq), 0) FROM users").fetchone()[0])
+    rows = conn.execute(
+        """
+        SELECT power, user_id, username, first_name
+        FROM users
+        WHERE changed_seq > ? AND changed_seq <= ?
+        ORDER BY changed_seq
+        LIMIT ?
+        """,
+        (since, latest, limit),
+    ).fetchall()
+    return latest, [tuple(row) for row in rows]
+
+
+async def get_user_changes(since: int, limit: int) -> tuple[int, list[BoardRow]]:
+    return await _read(_get_user_changes, since, limit)
+
+
+def _get_group_member_ids(conn: sqlite3.Connection, group_id: int) -> list[int]:
+    return [
+        int(row[0])
+        for row in conn.execute(
+            "SELECT user_id FROM group_members WHERE group_id = ?",
+            (group_id,),
         )
-        row = conn.execute(
-            "SELECT power FROM users WHERE user_id = ?",
-            (user_id,),
-        ).fetchone()
-        return int(row[0]) if row else delta
+    ]
 
 
-def update_user_cooldown(user_id: int, last_hit_ts: int) -> None:
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute(
-            "UPDATE users SET last_hit_ts = ? WHERE user_id = ?",
-            (last_hit_ts, user_id),
+async def get_group_member_ids(group_id: int) -> list[int]:
+    return await _read(_get_group_member_ids, group_id)
+
+
+def _get_chat_event_schedules(
+    conn: sqlite3.Connection,
+    after_chat_id: int | None,
+    limit: int,
+) -> list[tuple[int, int]]:
+    if after_chat_id is None:
+        return conn.execute(
+            "SELECT chat_id, next_event_ts FROM chat_events ORDER BY chat_id LIMIT ?",
+            (limit,),
+        ).fetchall()
+    return conn.execute(
+        """
+        SELECT chat_id, next_event_ts
+        FROM chat_events
+        WHERE chat_id > ?
+        ORDER BY chat_id
+        LIMIT ?
+        """,
+        (after_chat_id, limit),
+    ).fetchall()
+
+
+async def iter_chat_event_schedules(chunk_size: int) -> AsyncIterator[list[tuple[int, int]]]:
+    after_chat_id = None
+    while True:
+        rows = await _read(_get_chat_event_schedules, after_chat_id, chunk_size)
+        if not rows:
+            return
+        yield rows
+        if len(rows) < chunk_size:
+            return
+        after_chat_id = rows[-1][0]
+
+
+def _get_next_event_ts(conn: sqlite3.Connection, chat_id: int) -> int | None:
+    row = conn.execute(
+        "SELECT next_event_ts FROM chat_events WHERE chat_id = ?",
+        (chat_id,),
+    ).fetchone()
+    return int(row[0]) if row else None
+
+
+async def get_next_event_ts(chat_id: int) -> int | None:
+    return await _read(_get_next_event_ts, chat_id)
+
+
+def _ensure_chat_event_row(conn: sqlite3.Connection, chat_id: int, next_event_ts: int) -> int:
+    conn.execute(
+        """
+        INSERT INTO chat_events (chat_id, next_event_ts)
+        VALUES (?, ?)
+        ON CONFLICT(chat_id) DO NOTHING
+        """,
+        (chat_id, next_event_ts),
+    )
+    return _get_next_event_ts(conn, chat_id) or next_event_ts
+
+
+async def ensure_chat_event_row(chat_id: int, next_event_ts: int) -> int:
+    return await _write(_ensure_chat_event_row, chat_id, next_event_ts)
+
+
+def _set_next_event_ts(conn: sqlite3.Connection, chat_id: int, next_event_ts: int) -> None:
+    conn.execute(
+        "UPDATE chat_events SET next_event_ts = ? WHERE chat_id = ?",
+        (next_event_ts, chat_id),
+    )
+
+
+def _create_event(
+    conn: sqlite3.Connection,
+    chat_id: int,
+    event_type: str,
+    start_ts: int,
+    end_ts: int,
+) -> int:
+    cursor = conn.execute(
+        """
+        INSERT INTO events (chat_id, event_type, start_ts, end_ts)
+        VALUES (?, ?, ?, ?)
+        """,
+        (chat_id, event_type, start_ts, end_ts),
+    )
+    return int(cursor.lastrowid)
+
+
+def _start_event(
+    conn: sqlite3.Connection,
+    chat_id: int,
+    event_type: str,
+    start_ts: int,
+    end_ts: int,
+    next_event_ts: int,
+) -> int:
+    _set_next_event_ts(conn, chat_id, next_event_ts)
+    return _create_event(conn, chat_id, event_type, start_ts, end_ts)
+
+
+async def start_event(
+    chat_id: int,
+    event_type: str,
+    start_ts: int,
+    end_ts: int,
+    next_event_ts: int,
+) -> int:
+    return await _write(_start_event, chat_id, event_type, start_ts, end_ts, next_event_ts)
+
+
+def _set_event_message(conn: sqlite3.Connection, event_id: int, message_id: int) -> bool:
+    cursor = conn.execute(
+        "UPDATE events SET message_id = ? WHERE id = ?",
+        (message_id, event_id),
+    )
+    return cursor.rowcount > 0
+
+
+async def set_event_message(event_id: int, message_id: int) -> bool:
+    return await _write(_set_event_message, event_id, message_id)
+
+
+def _get_event_with_clicks(
+    conn: sqlite3.Connection,
+    event_id: int,
+) -> tuple[int, str, int, set[int]] | None:
+    row = conn.execute(
+        "SELECT chat_id, event_type, end_ts FROM events WHERE id = ?",
+        (event_id,),
+    ).fetchone()
+    if row is None:
+        return None
+    clicked = {
+        int(click[0])
+        for click in conn.execute(
+            "SELECT user_id FROM event_clicks WHERE event_id = ?",
+            (event_id,),
         )
+    }
+    return int(row[0]), str(row[1]), int(row[2]), clicked
 
 
-def update_user_pending_boost(
-    user_id: int,
-    power_multiplier: float,
+async def get_event_with_clicks(event_id: int) -> tuple[int, str, int, set[int]] | None:
+    return await _read(_get_event_with_clicks, event_id)
+
+
+def _apply_event_clicks(
+    conn: sqlite3.Connection,
+    event_id: int,
+    clicks: list[tuple[int, str | None, str | None, bool, int | None]],
     cooldown_multiplier: float,
-) -> None:
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute(
-            """
-            UPDATE users
-            SET pending_power_multiplier = ?, pending_cooldown_multiplier = ?
-            WHERE user_id = ?
-            """,
-            (power_multiplier, cooldown_multiplier, user_id),
-        )
+    now_ts: int,
+) -> list[tuple[int | None, int | None, int | None]]:
+    event_exists = conn.execute("SELECT 1 FROM events WHERE id = ?", (event_id,)).fetchone()
+    results = []
+    for user_id, username, first_name, store_profile, power_delta in clicks:
+        if store_profile:
+            _upsert_user(conn, user_id, username, first_name)
+        if event_exists:
+            conn.execute(
+                "INSERT OR IGNORE INTO event_clicks (event_id, user_id) VALUES (?, ?)",
+                (event_id, user_id),
+            )
+        if power_delta is not None:
+            new_total = _update_user_power_only(conn, user_id, power_delta, 1)
+            results.append((power_delta, new_total, None))
+            continue
+        _power, last_hit_ts, _respect, _ppm, _pcm, cooldown_seconds = _get_user_state(conn, user_id)
+        remaining = max(cooldown_seconds - (now_ts - last_hit_ts), 0)
+        new_remaining = int(remaining * cooldown_multiplier)
+        if remaining > 0:
+            _update_user_cooldown(conn, user_id, now_ts - (cooldown_seconds - new_remaining))
+        results.append((None, None, new_remaining))
+    return results
 
 
-def spend_respect_points(user_id: int, amount: int) -> bool:
-    with sqlite3.connect(DB_PATH) as conn:
-        row = conn.execute(
-            "SELECT respect_points FROM users WHERE user_id = ?",
-            (user_id,),
-        ).fetchone()
-        if row is None:
-            return False
-        current = int(row[0])
-        if current < amount:
-            return False
-        conn.execute(
-            "UPDATE users SET respect_points = respect_points - ? WHERE user_id = ?",
-            (amount, user_id),
-        )
-        return True
+async def apply_event_clicks(
+    event_id: int,
+    clicks: list[tuple[int, str | None, str | None, bool, int | None]],
+    cooldown_multiplier: float,
+    now_ts: int,
+) -> list[tuple[int | None, int | None, int | None]]:
+    return await _write(_apply_event_clicks, event_id, clicks, cooldown_multiplier, now_ts)
 
 
-def upsert_group_member(group_id: int, user_id: int) -> None:
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute(
+def _record_event_clicks(conn: sqlite3.Connection, event_id: int, user_ids: list[int]) -> None:
+    if conn.execute("SELECT 1 FROM events WHERE id = ?", (event_id,)).fetchone() is None:
+        return
+    conn.executemany(
+        "INSERT OR IGNORE INTO event_clicks (event_id, user_id) VALUES (?, ?)",
+        [(event_id, user_id) for user_id in user_ids],
+    )
+
+
+async def record_event_clicks(event_id: int, user_ids: list[int]) -> None:
+    await _write(_record_event_clicks, event_id, user_ids)
+
+
+def _pop_expired_events(
+    conn: sqlite3.Connection,
+    now_ts: int,
+    limit: int,
+    partition: tuple[int, int] | None,
+) -> list[tuple[int, int, int | None]]:
+    if partition is None:
+        rows = conn.execute(
             """
-            INSERT INTO group_members (group_id, user_id)
-            VALUES (?, ?)
-            ON CONFLICT(group_id, user_id) DO NOTHING
+            DELETE FROM events
+            WHERE id IN (
+                SELECT id FROM events WHERE end_ts <= ? ORDER BY end_ts LIMIT ?
+            )
+            RETURNING id, chat_id, message_id
             """,
-            (group_id, user_id),
-        )
\ No newline at end of file
+            (now_ts, limit),
+        ).fetchall()
+    else:
+        index, count = partition
+        rows = conn.execute(
+            """
+            DELETE FROM events
+            WHERE id IN (
+                SELECT id FROM events
+                WHERE end_ts <= ? AND abs(chat_id) % ? = ?
+                ORDER BY end_ts
+                LIMIT ?
+            )
+            RETURNING id, chat_id, message_id
+            """,
+            (now_ts, count, index, limit),
+        ).fetchall()
+    conn.executemany(
+        "DELETE FROM event_clicks WHERE event_id = ?",
+        [(row[0],) for row in rows],
+    )
+    return [(int(row[0]), int(row[1]), None if row[2] is None else int(row[2])) for row in rows]
+
+
+async def pop_expired_events(
+    now_ts: int,
+    limit: int,
+    partition: tuple[int, int] | None = None,
+) -> list[tuple[int, int, int | None]]:
+    return await _write(_pop_expired_events, now_ts, limit, partition)
+
+
+class SqliteStorage:
+    def initialize(self) -> None:
+        init_db()
+
+    async def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        await close_db()
+
+    upsert_user = staticmethod(upsert_user)
+    get_user_state = staticmethod(get_user_state)
+    get_user_row = staticmethod(get_user_row)
+    save_user_rows = staticmethod(save_user_rows)
+    perform_beat = staticmethod(perform_beat)
+    buy_boost = staticmethod(buy_boost)
+    insert_group_members = staticmethod(insert_group_members)
+    get_group_memberships = staticmethod(get_group_memberships)
+    get_group_board = staticmethod(get_group_board)
+    get_global_leaderboard = staticmethod(get_global_leaderboard)
+    get_user_powers = staticmethod(get_user_powers)
+    get_user_changes = staticmethod(get_user_changes)
+    get_group_member_ids = staticmethod(get_group_member_ids)
+    iter_chat_event_schedules = staticmethod(iter_chat_event_schedules)
+    get_next_event_ts = staticmethod(get_next_event_ts)
+    ensure_chat_event_row = staticmethod(ensure_chat_event_row)
+    start_event = staticmethod(start_event)
+    set_event_message = staticmethod(set_event_message)
+    get_event_with_clicks = staticmethod(get_event_with_clicks)
+    record_event_clicks = staticmethod(record_event_clicks)
+    apply_event_clicks = staticmethod(apply_event_clicks)
+    pop_expired_events = staticmethod(pop_expired_events)
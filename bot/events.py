@@ -1,96 +1,136 @@
-import sqlite3
+import asyncio
+import logging
 import time
+import zlib
 
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import ContextTypes
+from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup
 
-from .settings import DB_PATH, EVENT_DURATION_SECONDS, EVENT_INTERVAL_SECONDS
-from .utils import select_random_event
+from .clicks import forget_events, register_event
+from .outbound import PRIORITY_EVENT, delete_message, send_message
+from .scheduler import EventScheduler
+from .settings import (
+    EVENT_DURATION_SECONDS,
+    EVENT_FIRE_BURST,
+    EVENT_INTERVAL_SECONDS,
+    EVENT_MAX_FIRES_PER_SECOND,
+    EVENT_RESTORE_CHUNK_SIZE,
+    EVENT_SWEEP_BATCH,
+    EVENT_SWEEP_SECONDS,
+)
+from .storage import get_storage
+from .utils import partition_of, select_random_event
 
+logger = logging.getLogger(__name__)
 
-def ensure_chat_event_schedule(chat_id: int, job_queue) -> None:
-    if job_queue is None:
-        return
-    job_name = f"event_{chat_id}"
-    if job_queue.get_jobs_by_name(job_name):
-        return
-    now_ts = int(time.time())
-    with sqlite3.connect(DB_PATH) as conn:
-        row = conn.execute(
-            "SELECT next_event_ts FROM chat_events WHERE chat_id = ?",
-            (chat_id,),
-        ).fetchone()
-        if row is None:
-            next_event_ts = now_ts + EVENT_INTERVAL_SECONDS
-            conn.execute(
-                "INSERT INTO chat_events (chat_id, next_event_ts) VALUES (?, ?)",
-                (chat_id, next_event_ts),
-            )
-        else:
-            next_event_ts = int(row[0])
-    delay = max(next_event_ts - now_ts, 1)
-    job_queue.run_once(
-        trigger_event,
-        delay,
-        data={"chat_id": chat_id},
-        name=job_name,
+scheduler = EventScheduler(max_rate=EVENT_MAX_FIRES_PER_SECOND, burst=EVENT_FIRE_BURST)
+_bot: Bot | None = None
+_restore_task: asyncio.Task | None = None
+_partition: tuple[int, int] | None = None
+
+
+def set_partition(index: int, count: int) -> None:
+    global _partition
+    _partition = (index, count)
+
+
+def owns_chat(chat_id: int) -> bool:
+    return _partition is None or partition_of(chat_id, _partition[1]) == _partition[0]
+
+
+def next_event_slot(chat_id: int, earliest_ts: int) -> int:
+    # Each chat fires on its own deterministic phase within the interval, so
+    # chats seen at the same moment do not fire together.
+    phase = zlib.crc32(str(chat_id).encode()) % EVENT_INTERVAL_SECONDS
+    slots = -(-(earliest_ts - phase) // EVENT_INTERVAL_SECONDS)
+    return phase + slots * EVENT_INTERVAL_SECONDS
+
+
+def _schedule_chat_event(chat_id: int, next_event_ts: int) -> None:
+    when = max(next_event_ts, time.time() + 1)
+    scheduler.schedule(("event", chat_id), when, trigger_event, chat_id)
+
+
+async def restore_event_schedules() -> None:
+    started = time.perf_counter()
+    restored = 0
+    async for rows in get_storage().iter_chat_event_schedules(EVENT_RESTORE_CHUNK_SIZE):
+        earliest = time.time() + 1
+        restored += scheduler.schedule_many(
+            (("event", chat_id), max(next_event_ts, earliest), trigger_event, (chat_id,))
+            for chat_id, next_event_ts in rows
+            if owns_chat(chat_id) and not scheduler.has(("event", chat_id))
+        )
+    logger.info(
+        "Restored %d chat event schedules in %.3fs",
+        restored,
+        time.perf_counter() - started,
     )
 
 
-async def trigger_event(context: ContextTypes.DEFAULT_TYPE) -> None:
-    job = context.job
-    if job is None or job.data is None:
+async def start_events(bot: Bot) -> None:
+    global _bot, _restore_task
+    _bot = bot
+    scheduler.start()
+    scheduler.schedule(("sweep",), time.time(), sweep_expired_events)
+    _restore_task = asyncio.create_task(restore_event_schedules(), name="restore-event-schedules")
+
+
+async def stop_events() -> None:
+    if _restore_task is not None and not _restore_task.done():
+        _restore_task.cancel()
+    await scheduler.stop()
+
+
+async def ensure_chat_event_schedule(chat_id: int) -> None:
+    if _bot is None or not owns_chat(chat_id) or scheduler.has(("event", chat_id)):
         return
-    chat_id = int(job.data["chat_id"])
+    now_ts = int(time.time())
+    first_event_ts = next_event_slot(chat_id, now_ts + EVENT_INTERVAL_SECONDS // 2)
+    next_event_ts = await get_storage().ensure_chat_event_row(chat_id, first_event_ts)
+    if not scheduler.has(("event", chat_id)):
+        _schedule_chat_event(chat_id, next_event_ts)
+
+
+async def trigger_event(chat_id: int) -> None:
     spec = select_random_event()
     now_ts = int(time.time())
     end_ts = now_ts + EVENT_DURATION_SECONDS
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.execute(
-            """
-            INSERT INTO events (chat_id, event_type, start_ts, end_ts)
-            VALUES (?, ?, ?, ?)
-            """,
-            (chat_id, spec.event_type, now_ts, end_ts),
-        )
-        event_id = cursor.lastrowid
+    next_event_ts = next_event_slot(chat_id, now_ts + EVENT_INTERVAL_SECONDS // 2)
+    event_id = await get_storage().start_event(
+        chat_id, spec.event_type, now_ts, end_ts, next_event_ts
+    )
+    _schedule_chat_event(chat_id, next_event_ts)
+    register_event(event_id, chat_id, spec, end_ts)
     keyboard = InlineKeyboardMarkup(
         [[InlineKeyboardButton(spec.button_text, callback_data=f"event:{event_id}")]]
     )
     text = f"{spec.title}\n{spec.description}\nИвент активен 5 минут!"
-    message = await context.bot.send_message(chat_id=chat_id, text=text, reply_markup=keyboard)
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute(
-            "UPDATE events SET message_id = ? WHERE id = ?",
-            (message.message_id, event_id),
-        )
-    cleanup_name = f"event_cleanup_{event_id}"
-    context.job_queue.run_once(
-        cleanup_event,
-        EVENT_DURATION_SECONDS,
-        data={"chat_id": chat_id, "event_id": event_id, "message_id": message.message_id},
-        name=cleanup_name,
+    message = await send_message(
+        _bot,
+        chat_id=chat_id,
+        text=text,
+        priority=PRIORITY_EVENT,
+        reply_markup=keyboard,
     )
-    next_event_ts = now_ts + EVENT_INTERVAL_SECONDS
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute(
-            "UPDATE chat_events SET next_event_ts = ? WHERE chat_id = ?",
-            (next_event_ts, chat_id),
-        )
-    ensure_chat_event_schedule(chat_id, context.job_queue)
+    # Replies go first, so in a busy chat the announcement can be delivered
+    # after the sweep already ended the event; its button would never work.
+    if not await get_storage().set_event_message(event_id, message.message_id):
+        delete_message(_bot, chat_id, message.message_id)
 
 
-async def cleanup_event(context: ContextTypes.DEFAULT_TYPE) -> None:
-    job = context.job
-    if job is None or job.data is None:
-        return
-    chat_id = int(job.data["chat_id"])
-    event_id = int(job.data["event_id"])
-    message_id = int(job.data["message_id"])
+async def sweep_expired_events() -> None:
+    # Expired events live only in the database, so a restart never orphans them:
+    # the first sweep after startup picks up everything that expired meanwhile.
     try:
-        await context.bot.delete_message(chat_id=chat_id, message_id=message_id)
-    except Exception:
-        pass
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute("DELETE FROM events WHERE id = ?", (event_id,))
-        conn.execute("DELETE FROM event_clicks WHERE event_id = ?", (event_id,))
+        while True:
+            expired = await get_storage().pop_expired_events(
+                int(time.time()), EVENT_SWEEP_BATCH, _partition
+            )
+            forget_events([event_id for event_id, _chat_id, _message_id in expired])
+            for _event_id, chat_id, message_id in expired:
+                if message_id is not None:
+                    delete_message(_bot, chat_id, message_id)
+            if len(expired) < EVENT_SWEEP_BATCH:
+                break
+    finally:
+        scheduler.schedule(("sweep",), time.time() + EVENT_SWEEP_SECONDS, sweep_expired_events)
@@ -0,0 +1,47 @@
+from typing import Iterable
+
+
+class GroupRegistry:
+    # Members of the groups held by an in-memory cache (leaderboards, rank
+    # indexes), so power changes reach exactly the cached groups of a user. A
+    # cache claims a group when it loads it and releases it on eviction; the
+    # members are forgotten once no cache holds the group.
+    def __init__(self) -> None:
+        self._holders: dict[int, set[str]] = {}
+        self._members: dict[int, set[int]] = {}
+        self._user_groups: dict[int, set[int]] = {}
+
+    def claim(self, group_id: int, holder: str, member_ids: Iterable[int]) -> None:
+        self._holders.setdefault(group_id, set()).add(holder)
+        self._members.setdefault(group_id, set())
+        for user_id in member_ids:
+            self.add(group_id, user_id)
+
+    def release(self, group_id: int, holder: str) -> None:
+        holders = self._holders.get(group_id)
+        if holders is None:
+            return
+        holders.discard(holder)
+        if holders:
+            return
+        del self._holders[group_id]
+        for user_id in self._members.pop(group_id):
+            groups = self._user_groups[user_id]
+            groups.discard(group_id)
+            if not groups:
+                del self._user_groups[user_id]
+
+    def add(self, group_id: int, user_id: int) -> None:
+        members = self._members.get(group_id)
+        if members is not None and user_id not in members:
+            members.add(user_id)
+            self._user_groups.setdefault(user_id, set()).add(group_id)
+
+    def members(self, group_id: int) -> set[int]:
+        return self._members.get(group_id, set())
+
+    def groups_of(self, user_id: int) -> set[int]:
+        return self._user_groups.get(user_id, set())
+
+
+group_members = GroupRegistry()
@@ -1,34 +1,38 @@
-import sqlite3
 import time
 
 from telegram import Update
 from telegram.constants import ChatType, ParseMode
 from telegram.ext import ContextTypes
 
-from .db import (
-    get_user_state,
-    spend_respect_points,
-    update_user_after_beat,
-    update_user_cooldown,
-    update_user_pending_boost,
-    update_user_power_only,
-    upsert_group_member,
-    upsert_user,
-)
+from .clicks import submit_click
+from .cooldowns import allow_early_reply, check_cooldown, set_ready_at
 from .events import ensure_chat_event_schedule
+from .leaderboards import (
+    global_leaderboard_text,
+    group_leaderboard_text,
+    post_leaderboard,
+    record_power,
+    record_profile,
+)
+from .membership import flush_chat_members, note_group_member, remember_group_member
+from .outbound import send_message
+from .profiles import profile_changed, remember_profile, sync_user
+from .ranks import group_rank, index_group_member, index_power, power_index
 from .settings import (
     BEAT_ALIASES,
     BOOST_COSTS,
-    DB_PATH,
     GLOBAL_ALIASES,
+    RANK_ALIASES,
+    TIME_BOOST_COOLDOWN_MULTIPLIER,
     TOP_ALIASES,
-    COOLDOWN_SECONDS,
+    VODKA_BOOST_POWER_MULTIPLIER,
 )
+from .storage import get_storage
 from .utils import (
     extract_command,
     format_cooldown,
-    get_event_spec,
     get_user_display,
+    outcome_message,
     roll_outcome,
 )
 
@@ -36,9 +40,9 @@ from .utils import (
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if update.effective_user is None or update.effective_chat is None:
         return
-    upsert_user(update.effective_user.id, update.effective_user.username, update.effective_user.first_name)
+    await sync_user(update.effective_user.id, update.effective_user.username, update.effective_user.first_name)
     if update.effective_chat.type in (ChatType.GROUP, ChatType.SUPERGROUP):
-        ensure_chat_event_schedule(update.effective_chat.id, context.application.job_queue)
+        await ensure_chat_event_schedule(update.effective_chat.id)
     message = (
         "🥊 <b>Команды:</b>\n"
         "• /beat или /удар - ударить (раз в 24 часа)\n"
@@ -48,138 +52,161 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         "• /event - время до следующего ивента\n"
         "• /top или /топ - лидерборд в чате\n"
         "• /global или /общий - общий лидерборд\n"
+        "• /rank или /место - твоё место в рейтинге\n"
     )
-    await context.bot.send_message(
+    send_message(
+        context.bot,
         chat_id=update.effective_chat.id,
         text=message,
         parse_mode=ParseMode.HTML,
     )
 
 
+async def send_too_early(
+    context: ContextTypes.DEFAULT_TYPE,
+    chat_id: int,
+    user_id: int,
+    remaining: int,
+) -> None:
+    if not allow_early_reply(user_id):
+        return
+    send_message(
+        context.bot,
+        chat_id=chat_id,
+        text=(
+            "⏳ <b>Рано!</b>\n"
+            f"Кулдаун ещё: {format_cooldown(remaining)}.\n"
+            "Попробуй позже."
+        ),
+        parse_mode=ParseMode.HTML,
+    )
+
+
 async def beat(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if update.effective_user is None or update.effective_chat is None:
         return
 
     user = update.effective_user
     chat = update.effective_chat
-    upsert_user(user.id, user.username, user.first_name)
-    (
-        _total_power,
-        last_hit_ts,
-        _respect_points,
-        pending_power_multiplier,
-        pending_cooldown_multiplier,
-        cooldown_seconds,
-    ) = get_user_state(user.id)
+    is_group = chat.type in (ChatType.GROUP, ChatType.SUPERGROUP)
     now_ts = int(time.time())
-    elapsed = now_ts - last_hit_ts
+    remaining = await check_cooldown(user.id, now_ts)
+    if remaining > 0:
+        if is_group:
+            note_group_member(chat.id, user.id)
+        await send_too_early(context, chat.id, user.id, remaining)
+        return
 
-    if elapsed < cooldown_seconds:
-        remaining = cooldown_seconds - elapsed
-        await context.bot.send_message(
-            chat_id=chat.id,
-            text=(
-                "⏳ <b>Рано!</b>\n"
-                f"Кулдаун ещё: {format_cooldown(remaining)}.\n"
-                "Попробуй позже."
-            ),
-            parse_mode=ParseMode.HTML,
-        )
+    store_profile = profile_changed(user.id, user.username, user.first_name)
+    outcome, roll = roll_outcome()
+    result = await get_storage().perform_beat(
+        user.id,
+        user.username,
+        user.first_name,
+        chat.id if is_group else None,
+        roll,
+        now_ts,
+        store_profile,
+    )
+    if store_profile:
+        remember_profile(user.id, user.username, user.first_name)
+        record_profile(user.id, user.username, user.first_name)
+    set_ready_at(user.id, result.ready_at)
+
+    if result.remaining_cooldown > 0:
+        await send_too_early(context, chat.id, user.id, result.remaining_cooldown)
         return
 
-    outcome, power_delta = roll_outcome()
+    power_delta = result.power_delta
+    new_total = result.new_total
     boost_applied = []
-    if pending_power_multiplier != 1.0:
-        power_delta = int(round(power_delta * pending_power_multiplier))
-        boost_applied.append(f"мощь x{pending_power_multiplier:g}")
-    next_cooldown_seconds = int(COOLDOWN_SECONDS * pending_cooldown_multiplier)
-    if pending_cooldown_multiplier != 1.0:
-        boost_applied.append(f"кулдаун x{pending_cooldown_multiplier:g}")
-    new_total = update_user_after_beat(user.id, power_delta, now_ts, next_cooldown_seconds, 1)
-    if chat.type in (ChatType.GROUP, ChatType.SUPERGROUP):
-        upsert_group_member(chat.id, user.id)
-        ensure_chat_event_schedule(chat.id, context.application.job_queue)
+    if result.power_multiplier != 1.0:
+        boost_applied.append(f"мощь x{result.power_multiplier:g}")
+    if result.cooldown_multiplier != 1.0:
+        boost_applied.append(f"кулдаун x{result.cooldown_multiplier:g}")
+    if is_group:
+        remember_group_member(chat.id, user.id)
+        index_group_member(chat.id, user.id)
+        await ensure_chat_event_schedule(chat.id)
+    record_power(user.id, new_total, user.username, user.first_name)
+    index_power(user.id, new_total)
 
     display = get_user_display(user.username, user.first_name, user.id)
     boost_line = ""
     if boost_applied:
         boost_line = "\nБусты: " + ", ".join(boost_applied)
     result_text = (
-        f"💥 <b>{display}</b> {outcome.message()}\n"
+        f"💥 <b>{display}</b> {outcome_message(outcome)}\n"
         f"🥋 Техника: {outcome.name}\n"
         f"⚡ Сила удара: <b>{power_delta}</b>\n"
         f"🏆 Твоя мощь теперь: <b>{new_total}</b>"
         f"{boost_line}"
     )
-    await context.bot.send_message(
+    send_message(
+        context.bot,
         chat_id=chat.id,
         text=result_text,
         parse_mode=ParseMode.HTML,
     )
 
 
-def format_leaderboard(
-    rows: list[tuple[int, int, str | None, str | None]],
-    title: str,
-) -> str:
-    lines = [f"<b>{title}</b>"]
-    if not rows:
-        return "\n".join(lines + ["Пока никого нет."])
-    for idx, (power, user_id, username, first_name) in enumerate(rows, start=1):
-        name = get_user_display(username, first_name, user_id)
-        lines.append(f"{idx}. {name}: {power}")
-    return "\n".join(lines)
-
-
 async def leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if update.effective_chat is None:
         return
     chat = update.effective_chat
     if chat.type not in (ChatType.GROUP, ChatType.SUPERGROUP):
-        await context.bot.send_message(
+        send_message(
+            context.bot,
             chat_id=chat.id,
             text="Команда работает только в группах. Используйте /global.",
         )
         return
     if update.effective_user is not None:
-        upsert_group_member(chat.id, update.effective_user.id)
-        ensure_chat_event_schedule(chat.id, context.application.job_queue)
-
-    with sqlite3.connect(DB_PATH) as conn:
-        rows = conn.execute(
-            """
-            SELECT u.power, u.user_id, u.username, u.first_name
-            FROM group_members gm
-            JOIN users u ON u.user_id = gm.user_id
-            WHERE gm.group_id = ?
-            ORDER BY u.power DESC
-            LIMIT 10
-            """,
-            (chat.id,),
-        ).fetchall()
-
-    message = format_leaderboard(rows, "Лидерборд чата (общая мощь)")
-    await context.bot.send_message(chat_id=chat.id, text=message, parse_mode=ParseMode.HTML)
+        note_group_member(chat.id, update.effective_user.id)
+        await ensure_chat_event_schedule(chat.id)
+    await flush_chat_members(chat.id)
+
+    message = await group_leaderboard_text(chat.id, "Лидерборд чата (общая мощь)")
+    post_leaderboard(context.bot, chat.id, "leaderboard", message)
 
 
 async def global_leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if update.effective_chat is None:
         return
 
-    with sqlite3.connect(DB_PATH) as conn:
-        rows = conn.execute(
-            """
-            SELECT power, user_id, username, first_name
-            FROM users
-            ORDER BY power DESC
-            LIMIT 10
-            """
-        ).fetchall()
-
-    message = format_leaderboard(rows, "Глобальный лидерборд")
-    await context.bot.send_message(
-        chat_id=update.effective_chat.id,
-        text=message,
+    message = await global_leaderboard_text("Глобальный лидерборд")
+    post_leaderboard(context.bot, update.effective_chat.id, "global_leaderboard", message)
+
+
+def format_rank_line(label: str, rank: int, total: int, gap: int | None) -> str:
+    if gap is None:
+        return f"{label}: <b>#{rank}</b> из {total} — ты лидер!"
+    return f"{label}: <b>#{rank}</b> из {total}, до следующего места: {gap}"
+
+
+async def rank(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if update.effective_user is None or update.effective_chat is None:
+        return
+    user = update.effective_user
+    chat = update.effective_chat
+    await sync_user(user.id, user.username, user.first_name)
+    power, global_rank, global_total, next_power = power_index.rank(user.id)
+    gap = None if next_power is None else next_power - power
+    lines = [
+        "🏅 <b>Твоё место</b>",
+        f"Мощь: <b>{power}</b>",
+        format_rank_line("В мире", global_rank, global_total, gap),
+    ]
+    if chat.type in (ChatType.GROUP, ChatType.SUPERGROUP):
+        note_group_member(chat.id, user.id)
+        await flush_chat_members(chat.id)
+        group_place, members, next_group_power = await group_rank(chat.id, user.id)
+        group_gap = None if next_group_power is None else next_group_power - power
+        lines.append(format_rank_line("В чате", group_place, members, group_gap))
+    send_message(
+        context.bot,
+        chat_id=chat.id,
+        text="\n".join(lines),
         parse_mode=ParseMode.HTML,
     )
 
@@ -187,7 +214,7 @@ async def global_leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE)
 async def rep_balance(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if update.effective_user is None or update.effective_chat is None:
         return
-    upsert_user(update.effective_user.id, update.effective_user.username, update.effective_user.first_name)
+    await sync_user(update.effective_user.id, update.effective_user.username, update.effective_user.first_name)
     (
         _power,
         _last_hit_ts,
@@ -195,7 +222,7 @@ async def rep_balance(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         pending_power_multiplier,
         pending_cooldown_multiplier,
         _cooldown_seconds,
-    ) = get_user_state(update.effective_user.id)
+    ) = await get_storage().get_user_state(update.effective_user.id)
     boosts = []
     if pending_power_multiplier != 1.0:
         boosts.append(f"мощь x{pending_power_multiplier:g}")
@@ -208,7 +235,8 @@ async def rep_balance(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         f"Активные бусты: {boosts_text}\n"
         "Зарабатывай респект, чтобы покупать бусты в /shop."
     )
-    await context.bot.send_message(
+    send_message(
+        context.bot,
         chat_id=update.effective_chat.id,
         text=message,
         parse_mode=ParseMode.HTML,
@@ -224,7 +252,8 @@ async def shop(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         f"• time — в 2 раза меньше кулдаун после следующего удара (стоимость {BOOST_COSTS['time']} респекта)\n"
         "Купить: /buy &lt;vodka|time&gt;"
     )
-    await context.bot.send_message(
+    send_message(
+        context.bot,
         chat_id=update.effective_chat.id,
         text=message,
         parse_mode=ParseMode.HTML,
@@ -234,54 +263,43 @@ async def shop(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 async def buy_boost(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if update.effective_user is None or update.effective_chat is None:
         return
-    upsert_user(update.effective_user.id, update.effective_user.username, update.effective_user.first_name)
+    await sync_user(update.effective_user.id, update.effective_user.username, update.effective_user.first_name)
     if not context.args:
-        await context.bot.send_message(
+        send_message(
+            context.bot,
             chat_id=update.effective_chat.id,
             text="Укажи буст: /buy <vodka|time>",
         )
         return
     boost_name = context.args[0].lower()
     if boost_name not in BOOST_COSTS:
-        await context.bot.send_message(
+        send_message(
+            context.bot,
             chat_id=update.effective_chat.id,
             text="Неизвестный буст. Доступно: vodka, time.",
         )
         return
-    (
-        _power,
-        _last_hit_ts,
-        _respect_points,
-        pending_power_multiplier,
-        pending_cooldown_multiplier,
-        _cooldown_seconds,
-    ) = get_user_state(update.effective_user.id)
-    if boost_name == "vodka" and pending_power_multiplier != 1.0:
-        await context.bot.send_message(
-            chat_id=update.effective_chat.id,
-            text="У тебя уже есть активный буст на мощь.",
-        )
-        return
-    if boost_name == "time" and pending_cooldown_multiplier != 1.0:
-        await context.bot.send_message(
-            chat_id=update.effective_chat.id,
-            text="У тебя уже есть активный буст на кулдаун.",
-        )
-        return
-    cost = BOOST_COSTS[boost_name]
-    if not spend_respect_points(update.effective_user.id, cost):
-        await context.bot.send_message(
-            chat_id=update.effective_chat.id,
-            text="Не хватает респекта.",
-        )
-        return
     if boost_name == "vodka":
-        update_user_pending_boost(update.effective_user.id, 2.0, pending_cooldown_multiplier)
+        multiplier = VODKA_BOOST_POWER_MULTIPLIER
+    else:
+        multiplier = TIME_BOOST_COOLDOWN_MULTIPLIER
+    status = await get_storage().buy_boost(
+        update.effective_user.id,
+        boost_name,
+        BOOST_COSTS[boost_name],
+        multiplier,
+    )
+    if status == "active" and boost_name == "vodka":
+        text = "У тебя уже есть активный буст на мощь."
+    elif status == "active":
+        text = "У тебя уже есть активный буст на кулдаун."
+    elif status == "poor":
+        text = "Не хватает респекта."
+    elif boost_name == "vodka":
         text = "✅ Буст x2 к мощности куплен. Сработает на следующем ударе."
     else:
-        update_user_pending_boost(update.effective_user.id, pending_power_multiplier, 0.5)
         text = "✅ Буст на половинный кулдаун куплен. Сработает на следующем ударе."
-    await context.bot.send_message(chat_id=update.effective_chat.id, text=text)
+    send_message(context.bot, chat_id=update.effective_chat.id, text=text)
 
 
 async def event_time(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -289,23 +307,21 @@ async def event_time(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
         return
     chat = update.effective_chat
     if chat.type not in (ChatType.GROUP, ChatType.SUPERGROUP):
-        await context.bot.send_message(
+        send_message(
+            context.bot,
             chat_id=chat.id,
             text="Ивенты работают только в групповых чатах.",
         )
         return
-    ensure_chat_event_schedule(chat.id, context.application.job_queue)
+    await ensure_chat_event_schedule(chat.id)
     now_ts = int(time.time())
-    with sqlite3.connect(DB_PATH) as conn:
-        row = conn.execute(
-            "SELECT next_event_ts FROM chat_events WHERE chat_id = ?",
-            (chat.id,),
-        ).fetchone()
-    if row is None:
-        await context.bot.send_message(chat_id=chat.id, text="Пока нет расписания ивентов.")
+    next_event_ts = await get_storage().get_next_event_ts(chat.id)
+    if next_event_ts is None:
+        send_message(context.bot, chat_id=chat.id, text="Пока нет расписания ивентов.")
         return
-    remaining = max(int(row[0]) - now_ts, 0)
-    await context.bot.send_message(
+    remaining = max(next_event_ts - now_ts, 0)
+    send_message(
+        context.bot,
         chat_id=chat.id,
         text=f"⏱️ До следующего ивента: {format_cooldown(remaining)}",
     )
@@ -316,7 +332,7 @@ async def handle_aliases(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return
     if update.effective_chat and update.effective_user:
         if update.effective_chat.type in (ChatType.GROUP, ChatType.SUPERGROUP):
-            upsert_group_member(update.effective_chat.id, update.effective_user.id)
+            note_group_member(update.effective_chat.id, update.effective_user.id)
     command = extract_command(update.message.text)
     if command is None:
         return
@@ -327,6 +343,8 @@ async def handle_aliases(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         await leaderboard(update, context)
     elif command in GLOBAL_ALIASES:
         await global_leaderboard(update, context)
+    elif command in RANK_ALIASES:
+        await rank(update, context)
 
 
 async def handle_event_click(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -338,66 +356,10 @@ async def handle_event_click(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return
     event_id = int(data.split(":", 1)[1])
     user = update.effective_user
-    upsert_user(user.id, user.username, user.first_name)
-    with sqlite3.connect(DB_PATH) as conn:
-        event_row = conn.execute(
-            "SELECT chat_id, event_type, end_ts FROM events WHERE id = ?",
-            (event_id,),
-        ).fetchone()
-        if event_row is None:
-            await query.answer("Ивент уже закончился.", show_alert=True)
-            return
-        chat_id, event_type, end_ts = int(event_row[0]), str(event_row[1]), int(event_row[2])
-        if int(time.time()) > end_ts:
-            await query.answer("Ивент уже закончился.", show_alert=True)
-            return
-        try:
-            conn.execute(
-                "INSERT INTO event_clicks (event_id, user_id) VALUES (?, ?)",
-                (event_id, user.id),
-            )
-        except sqlite3.IntegrityError:
-            await query.answer("Ты уже участвовал.", show_alert=True)
-            return
-    spec = get_event_spec(event_type)
-    display = get_user_display(user.username, user.first_name, user.id)
-    if spec.event_type == "time":
-        (
-            _power,
-            last_hit_ts,
-            _respect,
-            _pending_power_multiplier,
-            _pending_cooldown_multiplier,
-            cooldown_seconds,
-        ) = get_user_state(user.id)
-        now_ts = int(time.time())
-        elapsed = now_ts - last_hit_ts
-        remaining = max(cooldown_seconds - elapsed, 0)
-        new_remaining = int(remaining * spec.cooldown_multiplier)
-        new_last_hit_ts = now_ts - (cooldown_seconds - new_remaining)
-        if remaining > 0:
-            update_user_cooldown(user.id, new_last_hit_ts)
-        message = (
-            f"⏩ {display} воспользовался ивентом.\n"
-            f"Оставшийся кулдаун уменьшен: {format_cooldown(new_remaining)}."
-        )
-        await context.bot.send_message(chat_id=chat_id, text=message)
-        await query.answer("Кулдаун ускорен!")
-        return
-
-    outcome, power_delta = roll_outcome()
-    power_delta = int(round(power_delta * spec.power_multiplier))
-    new_total = update_user_power_only(user.id, power_delta, 1)
-    result_text = (
-        f"🎉 <b>{display}</b> {outcome.message()}\n"
-        f"🥋 Техника: {outcome.name}\n"
-        f"🎯 Ивент: {spec.title}\n"
-        f"⚡ Сила удара: <b>{power_delta}</b>\n"
-        f"🏆 Твоя мощь теперь: <b>{new_total}</b>"
-    )
-    await context.bot.send_message(
-        chat_id=chat_id,
-        text=result_text,
-        parse_mode=ParseMode.HTML,
-    )
-    await query.answer("Готово!")
+    status = await submit_click(context.bot, event_id, user.id, user.username, user.first_name)
+    if status == "expired":
+        await query.answer("Ивент уже закончился.", show_alert=True)
+    elif status == "duplicate":
+        await query.answer("Ты уже участвовал.", show_alert=True)
+    else:
+        await query.answer("Принято! Результат появится в сводке ивента.")
@@ -0,0 +1,298 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+
+from telegram import Bot
+from telegram.constants import ParseMode
+from telegram.error import BadRequest
+
+from .groups import group_members
+from .outbound import edit_message_text, send_message
+from .settings import (
+    LEADERBOARD_CANDIDATES,
+    LEADERBOARD_EDIT_WINDOW_SECONDS,
+    LEADERBOARD_GROUP_CACHE_SIZE,
+    LEADERBOARD_POSTS_CACHE_SIZE,
+    LEADERBOARD_SIZE,
+)
+from .storage import get_storage
+from .utils import get_user_display
+
+Row = tuple[int, int, str | None, str | None]
+
+
+def format_leaderboard(rows: list[Row], title: str) -> str:
+    lines = [f"<b>{title}</b>"]
+    if not rows:
+        return "\n".join(lines + ["Пока никого нет."])
+    for idx, (power, user_id, username, first_name) in enumerate(rows, start=1):
+        name = get_user_display(username, first_name, user_id)
+        lines.append(f"{idx}. {name}: {power}")
+    return "\n".join(lines)
+
+
+class Leaderboard:
+    # Keeps the top LEADERBOARD_CANDIDATES users. Every user outside `entries`
+    # has power <= `floor`; floor is None when `entries` holds everybody.
+    def __init__(self) -> None:
+        self.entries: dict[int, tuple[int, str | None, str | None]] = {}
+        self.floor: int | None = None
+        self.loaded = False
+        self.version = 0
+        self._rendered: tuple[int, str, str] | None = None
+
+    def load(self, rows: list[Row]) -> None:
+        self.entries = {
+            user_id: (power, username, first_name) for power, user_id, username, first_name in rows
+        }
+        self.floor = rows[-1][0] if len(rows) >= LEADERBOARD_CANDIDATES else None
+        self.loaded = True
+        self.version += 1
+
+    def invalidate(self) -> None:
+        self.loaded = False
+        self.version += 1
+
+    def update_power(
+        self,
+        user_id: int,
+        power: int,
+        username: str | None,
+        first_name: str | None,
+    ) -> None:
+        if not self.loaded:
+            return
+        if self.floor is not None and power < self.floor:
+            if self.entries.pop(user_id, None) is not None:
+                self.version += 1
+            return
+        if user_id in self.entries or self.floor is None or power > self.floor:
+            self.entries[user_id] = (power, username, first_name)
+            self.version += 1
+            while len(self.entries) > LEADERBOARD_CANDIDATES:
+                lowest = min(self.entries, key=lambda key: self.entries[key][0])
+                dropped = self.entries.pop(lowest)[0]
+                self.floor = dropped if self.floor is None else max(self.floor, dropped)
+
+    def update_profile(self, user_id: int, username: str | None, first_name: str | None) -> None:
+        if not self.loaded:
+            return
+        entry = self.entries.get(user_id)
+        if entry is not None:
+            self.entries[user_id] = (entry[0], username, first_name)
+            self.version += 1
+        elif self.floor is None:
+            self.invalidate()
+
+    def top(self) -> list[Row] | None:
+        if not self.loaded:
+            return None
+        if self.floor is not None and len(self.entries) < LEADERBOARD_SIZE:
+            return None
+        ranked = sorted(self.entries.items(), key=lambda item: item[1][0], reverse=True)
+        return [
+            (power, user_id, username, first_name)
+            for user_id, (power, username, first_name) in ranked[:LEADERBOARD_SIZE]
+        ]
+
+    def render(self, title: str) -> str | None:
+        if self._rendered is not None and self._rendered[:2] == (self.version, title):
+            return self._rendered[2]
+        rows = self.top()
+        if rows is None:
+            return None
+        text = format_leaderboard(rows, title)
+        self._rendered = (self.version, title, text)
+        return text
+
+
+_global_board = Leaderboard()
+_group_boards: OrderedDict[int, Leaderboard] = OrderedDict()
+# Recent changes, replayed onto boards whose rows were loaded while they happened.
+_changes: deque[tuple[int, int, int | None, str | None, str | None]] = deque(maxlen=10_000)
+_change_seq = 0
+# With write-behind storage the database lags memory; loads replay every
+# change after the last one known to be saved instead of only new ones.
+_durable_seq: int | None = None
+
+
+def change_seq() -> int:
+    return _change_seq
+
+
+def mark_durable(seq: int) -> None:
+    global _durable_seq
+    _durable_seq = seq if _durable_seq is None else max(_durable_seq, seq)
+
+
+def _load_seq() -> int:
+    return _change_seq if _durable_seq is None else _durable_seq
+
+
+def _log_change(
+    user_id: int,
+    power: int | None,
+    username: str | None,
+    first_name: str | None,
+) -> None:
+    global _change_seq
+    _change_seq += 1
+    _changes.append((_change_seq, user_id, power, username, first_name))
+
+
+def _replay_changes(board: Leaderboard, since: int, member_ids: set[int] | None) -> bool:
+    if _change_seq == since:
+        return True
+    if not _changes or _changes[0][0] > since + 1:
+        return False
+    for seq, user_id, power, username, first_name in _changes:
+        if seq <= since or (member_ids is not None and user_id not in member_ids):
+            continue
+        if power is None:
+            board.update_profile(user_id, username, first_name)
+        else:
+            board.update_power(user_id, power, username, first_name)
+    return board.loaded
+
+
+def _drop_group_board(group_id: int) -> None:
+    if _group_boards.pop(group_id, None) is not None:
+        group_members.release(group_id, "leaderboard")
+
+
+async def global_leaderboard_text(title: str) -> str:
+    text = _global_board.render(title)
+    if text is not None:
+        return text
+    since = _load_seq()
+    rows = await get_storage().get_global_leaderboard(LEADERBOARD_CANDIDATES)
+    _global_board.load(rows)
+    if not _replay_changes(_global_board, since, None):
+        _global_board.invalidate()
+        return format_leaderboard(rows[:LEADERBOARD_SIZE], title)
+    return _global_board.render(title) or format_leaderboard(rows[:LEADERBOARD_SIZE], title)
+
+
+async def group_leaderboard_text(group_id: int, title: str) -> str:
+    board = _group_boards.get(group_id)
+    if board is not None:
+        _group_boards.move_to_end(group_id)
+        text = board.render(title)
+        if text is not None:
+            return text
+    since = _load_seq()
+    rows, member_ids = await get_storage().get_group_board(group_id, LEADERBOARD_CANDIDATES)
+    _drop_group_board(group_id)
+    board = Leaderboard()
+    board.load(rows)
+    if not _replay_changes(board, since, member_ids):
+        return format_leaderboard(rows[:LEADERBOARD_SIZE], title)
+    _group_boards[group_id] = board
+    group_members.claim(group_id, "leaderboard", member_ids)
+    if len(_group_boards) > LEADERBOARD_GROUP_CACHE_SIZE:
+        _drop_group_board(next(iter(_group_boards)))
+    return board.render(title) or format_leaderboard(rows[:LEADERBOARD_SIZE], title)
+
+
+def invalidate_group(group_id: int) -> None:
+    board = _group_boards.get(group_id)
+    if board is not None:
+        board.invalidate()
+
+
+def invalidate_all() -> None:
+    # Other worker processes write to the same database; drop everything we
+    # hold so the next request reloads it.
+    _global_board.invalidate()
+    for board in _group_boards.values():
+        board.invalidate()
+
+
+def record_power(user_id: int, power: int, username: str | None, first_name: str | None) -> None:
+    _log_change(user_id, power, username, first_name)
+    _global_board.update_power(user_id, power, username, first_name)
+    for group_id in group_members.groups_of(user_id):
+        board = _group_boards.get(group_id)
+        if board is not None:
+            board.update_power(user_id, power, username, first_name)
+
+
+def record_profile(user_id: int, username: str | None, first_name: str | None) -> None:
+    _log_change(user_id, None, username, first_name)
+    _global_board.update_profile(user_id, username, first_name)
+    for group_id in group_members.groups_of(user_id):
+        board = _group_boards.get(group_id)
+        if board is not None:
+            board.update_profile(user_id, username, first_name)
+
+
+@dataclass
+class PostedBoard:
+    text: str
+    posted_at: float
+    message_id: int | None = None
+
+
+_posted: OrderedDict[tuple[str, int], PostedBoard] = OrderedDict()
+
+
+def _forget_post(key: tuple[str, int], post: PostedBoard) -> None:
+    if _posted.get(key) is post:
+        del _posted[key]
+
+
+def _on_sent(key: tuple[str, int], post: PostedBoard, future: asyncio.Future) -> None:
+    if future.cancelled() or future.exception() is not None:
+        _forget_post(key, post)
+    else:
+        post.message_id = future.result().message_id
+
+
+def _on_edited(key: tuple[str, int], post: PostedBoard, future: asyncio.Future) -> None:
+    if future.cancelled():
+        _forget_post(key, post)
+        return
+    exc = future.exception()
+    if exc is not None and not (isinstance(exc, BadRequest) and "not modified" in str(exc)):
+        # Most likely the message was deleted; the next request posts a fresh one.
+        _forget_post(key, post)
+
+
+def post_leaderboard(bot: Bot, chat_id: int, kind: str, text: str) -> None:
+    # A board posted less than LEADERBOARD_EDIT_WINDOW_SECONDS ago is edited in
+    # place, or left alone when its text has not changed. The window counts
+    # from the original post so we never edit a message long scrolled away.
+    key = (kind, chat_id)
+    now = time.monotonic()
+    post = _posted.get(key)
+    if post is not None and now - post.posted_at < LEADERBOARD_EDIT_WINDOW_SECONDS:
+        _posted.move_to_end(key)
+        if post.text == text:
+            return
+        post.text = text
+        if post.message_id is not None:
+            future = edit_message_text(
+                bot,
+                chat_id=chat_id,
+                message_id=post.message_id,
+                text=text,
+                coalesce_key=key,
+                parse_mode=ParseMode.HTML,
+            )
+            future.add_done_callback(lambda done: _on_edited(key, post, done))
+            return
+    else:
+        post = PostedBoard(text, now)
+        _posted[key] = post
+        _posted.move_to_end(key)
+        if len(_posted) > LEADERBOARD_POSTS_CACHE_SIZE:
+            _posted.popitem(last=False)
+    future = send_message(
+        bot,
+        chat_id=chat_id,
+        text=text,
+        coalesce_key=key,
+        parse_mode=ParseMode.HTML,
+    )
+    future.add_done_callback(lambda done: _on_sent(key, post, done))
@@ -0,0 +1,43 @@
+import asyncio
+import logging
+import signal
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from telegram.ext import Application
+
+
+def configure_logging(process_name: str = "main") -> None:
+    logging.basicConfig(
+        format=f"%(asctime)s {process_name} %(name)s %(levelname)s %(message)s",
+        level=logging.INFO,
+    )
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+def stop_event(signals: tuple[int, ...] = (signal.SIGINT, signal.SIGTERM)) -> asyncio.Event:
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in signals:
+        loop.add_signal_handler(sig, stopping.set)
+    return stopping
+
+
+@asynccontextmanager
+async def running(application: Application) -> AsyncIterator[Application]:
+    # The same start/stop sequence as Application.run_polling, for run modes
+    # that feed application.update_queue themselves.
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        yield application
+    finally:
+        if application.running:
+            await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
@@ -0,0 +1,483 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import tempfile
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, AsyncIterator, Awaitable, Callable
+from urllib.parse import parse_qs
+
+from telegram import Update
+from telegram.ext import Application, TypeHandler
+
+from .web import HttpServer, Request, Response
+
+# Runs the real Application from app.py against a local fake Bot API and feeds
+# it updates; replay.py drives the same harness with recorded traffic.
+# Settings are read from the environment when bot modules are first imported,
+# so everything that pulls in settings.py is imported only after run_harness()
+# has pointed the bot at the fake API and a scratch database.
+
+TOKEN = "1000:loadtest"
+BOT_USER = {"id": 1000, "is_bot": True, "first_name": "Vitya", "username": "vitya_bot"}
+DEFAULT_MIX = "beat=35,alias=15,top=15,global=10,click=25"
+ALIAS_TEXTS = ("удар", "бей", "топ", "лидерборд", "общий", "место")
+THROTTLED_METHODS = {"sendMessage", "editMessageText", "deleteMessage"}
+TIMED_STORAGE_SKIP = {"start", "close"}
+
+
+class FakeBotApi:
+    # Answers Bot API calls the way Telegram does, records them, and can
+    # answer a share of message calls with 429 to exercise retries.
+    def __init__(self, throttle: float, latency: float, seed: int | None) -> None:
+        self.calls: Counter[str] = Counter()
+        self.throttled = 0
+        self.live_events: dict[int, int] = {}
+        self._throttle = throttle
+        self._latency = latency
+        self._rng = random.Random(seed)
+        self._message_ids = 0
+        self._server = HttpServer(
+            {f"/bot{TOKEN}/{method}": self._handler(method) for method in _API_METHODS},
+            max_connections=1024,
+            max_body_bytes=1024 * 1024,
+            idle_timeout=60.0,
+        )
+
+    async def start(self) -> str:
+        await self._server.start("127.0.0.1", 0)
+        return f"http://127.0.0.1:{self._server.port}/bot"
+
+    async def stop(self) -> None:
+        await self._server.stop()
+
+    def _handler(self, method: str):
+        async def handle(request: Request) -> Response:
+            self.calls[method] += 1
+            if self._latency:
+                await asyncio.sleep(self._latency)
+            params = {key: values[-1] for key, values in parse_qs(request.body.decode()).items()}
+            if method in THROTTLED_METHODS and self._rng.random() < self._throttle:
+                self.throttled += 1
+                return _api_reply(
+                    {
+                        "ok": False,
+                        "error_code": 429,
+                        "description": "Too Many Requests: retry after 1",
+                        "parameters": {"retry_after": 1},
+                    },
+                    429,
+                )
+            return _api_reply({"ok": True, "result": self._result(method, params)})
+
+        return handle
+
+    def _result(self, method: str, params: dict[str, str]) -> Any:
+        if method == "getMe":
+            return BOT_USER
+        if method not in ("sendMessage", "editMessageText"):
+            return True
+        chat_id = int(params["chat_id"])
+        if "message_id" in params:
+            message_id = int(params["message_id"])
+        else:
+            self._message_ids += 1
+            message_id = self._message_ids
+        markup = json.loads(params.get("reply_markup", "{}"))
+        for row in markup.get("inline_keyboard", ()):
+            for button in row:
+                data = button.get("callback_data", "")
+                if data.startswith("event:"):
+                    self.live_events[chat_id] = int(data.split(":", 1)[1])
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": _chat(chat_id),
+            "from": BOT_USER,
+            "text": params.get("text", ""),
+        }
+
+
+_API_METHODS = (
+    "getMe",
+    "sendMessage",
+    "editMessageText",
+    "deleteMessage",
+    "answerCallbackQuery",
+)
+
+
+def _api_reply(payload: dict[str, Any], status: int = 200) -> Response:
+    return Response(status, json.dumps(payload).encode(), "application/json")
+
+
+def _chat(chat_id: int) -> dict[str, Any]:
+    if chat_id < 0:
+        return {"id": chat_id, "type": "supergroup", "title": f"Chat {-chat_id}"}
+    return {"id": chat_id, "type": "private", "first_name": f"User {chat_id}"}
+
+
+class LoadGenerator:
+    # Users each belong to one group chat and sometimes write to the bot in
+    # private. Button clicks come from members of chats where the fake API
+    # saw an event posted, and turn into /beat while there is none.
+    def __init__(
+        self,
+        api: FakeBotApi,
+        users: int,
+        chats: int,
+        private_share: float,
+        mix: dict[str, float],
+        seed: int | None,
+    ) -> None:
+        self._api = api
+        self._users = users
+        self._chats = chats
+        self._private_share = private_share
+        self._kinds = list(mix)
+        self._weights = list(mix.values())
+        self._rng = random.Random(seed)
+        self._update_id = 0
+        self.kinds: Counter[str] = Counter()
+
+    def group_chat(self, user_id: int) -> int:
+        return -(user_id % self._chats) - 1
+
+    def next_update(self) -> dict[str, Any]:
+        self._update_id += 1
+        kind = self._rng.choices(self._kinds, self._weights)[0]
+        if kind == "click" and self._api.live_events:
+            chat_id, event_id = self._rng.choice(list(self._api.live_events.items()))
+            slot = -chat_id - 1
+            user_id = self._rng.choice(range(slot or self._chats, self._users + 1, self._chats))
+            self.kinds[kind] += 1
+            return self._callback(user_id, chat_id, event_id)
+        if kind == "click":
+            kind = "beat"
+        user_id = self._rng.randrange(self._users) + 1
+        chat_id = self.group_chat(user_id)
+        if self._rng.random() < self._private_share:
+            chat_id = user_id
+        self.kinds[kind] += 1
+        if kind == "alias":
+            return self._message(user_id, chat_id, self._rng.choice(ALIAS_TEXTS))
+        return self._message(user_id, chat_id, f"/{kind}", command=True)
+
+    def _user(self, user_id: int) -> dict[str, Any]:
+        return {
+            "id": user_id,
+            "is_bot": False,
+            "first_name": f"User {user_id}",
+            "username": f"user{user_id}",
+        }
+
+    def _message(
+        self,
+        user_id: int,
+        chat_id: int,
+        text: str,
+        command: bool = False,
+    ) -> dict[str, Any]:
+        message = {
+            "message_id": self._update_id,
+            "date": int(time.time()),
+            "chat": _chat(chat_id),
+            "from": self._user(user_id),
+            "text": text,
+        }
+        if command:
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text)}]
+        return {"update_id": self._update_id, "message": message}
+
+    def _callback(self, user_id: int, chat_id: int, event_id: int) -> dict[str, Any]:
+        return {
+            "update_id": self._update_id,
+            "callback_query": {
+                "id": str(self._update_id),
+                "from": self._user(user_id),
+                "chat_instance": str(chat_id),
+                "data": f"event:{event_id}",
+                "message": {
+                    "message_id": 1,
+                    "date": int(time.time()),
+                    "chat": _chat(chat_id),
+                    "from": BOT_USER,
+                    "text": "event",
+                },
+            },
+        }
+
+
+def _parse_mix(value: str) -> dict[str, float]:
+    mix = {}
+    for part in value.split(","):
+        kind, _, weight = part.partition("=")
+        kind = kind.strip()
+        if kind not in ("beat", "alias", "top", "global", "rank", "click"):
+            raise argparse.ArgumentTypeError(f"unknown update kind: {kind}")
+        mix[kind] = float(weight)
+    return mix
+
+
+def _percentiles(values: list[float]) -> dict[int, float]:
+    ordered = sorted(values)
+    if not ordered:
+        return {50: 0.0, 95: 0.0, 99: 0.0}
+    return {
+        point: ordered[min(len(ordered) - 1, int(len(ordered) * point / 100))]
+        for point in (50, 95, 99)
+    }
+
+
+def _latency_line(label: str, values: list[float]) -> str:
+    marks = _percentiles(values)
+    return (
+        f"{label:<26} p50={marks[50] * 1000:.2f}ms p95={marks[95] * 1000:.2f}ms "
+        f"p99={marks[99] * 1000:.2f}ms"
+    )
+
+
+class Probe:
+    # Times every update from the moment it is queued until the handlers in
+    # group 0 are done with it; handler time starts when processing begins.
+    def __init__(self) -> None:
+        self.sent = 0
+        self.latencies: list[float] = []
+        self.handler_times: list[float] = []
+        self.errors: list[BaseException] = []
+        self.began = time.perf_counter()
+        self.finished = self.began
+        self._enqueued: dict[int, float] = {}
+        self._started: dict[int, float] = {}
+
+    @property
+    def completed(self) -> int:
+        return len(self.latencies)
+
+    @property
+    def elapsed(self) -> float:
+        return self.finished - self.began
+
+    @property
+    def throughput(self) -> float:
+        return self.completed / self.elapsed if self.elapsed > 0 else 0.0
+
+    def attach(self, application: Application) -> None:
+        application.add_handler(TypeHandler(Update, self._handler_started), group=-1)
+        application.add_handler(TypeHandler(Update, self._handler_finished), group=1)
+        application.add_error_handler(self._on_error)
+
+    def start(self) -> None:
+        self.began = self.finished = time.perf_counter()
+
+    def submit(self, application: Application, data: dict[str, Any]) -> None:
+        update = Update.de_json(data, application.bot)
+        if update is None:
+            return
+        self._enqueued[update.update_id] = time.perf_counter()
+        application.update_queue.put_nowait(update)
+        self.sent += 1
+
+    async def drain(self, timeout: float) -> None:
+        deadline = time.perf_counter() + timeout
+        while self._enqueued and time.perf_counter() < deadline:
+            await asyncio.sleep(0.01)
+        self.finished = time.perf_counter()
+
+    async def _handler_started(self, update: Update, context: Any) -> None:
+        self._started[update.update_id] = time.perf_counter()
+
+    async def _handler_finished(self, update: Update, context: Any) -> None:
+        now = time.perf_counter()
+        enqueued = self._enqueued.pop(update.update_id, None)
+        if enqueued is not None:
+            self.latencies.append(now - enqueued)
+            self.handler_times.append(now - self._started.pop(update.update_id))
+
+    async def _on_error(self, update: object, context: Any) -> None:
+        self.errors.append(context.error)
+
+
+@dataclass
+class Harness:
+    application: Application
+    storage_timings: dict[str, list[float]]
+    probe: Probe
+
+
+@asynccontextmanager
+async def running_bot(api: FakeBotApi, outbound_rate: float) -> AsyncIterator[Harness]:
+    os.environ["VITYA_BOT_API_URL"] = await api.start()
+    try:
+        from .app import build_application, configure_storage
+        from .lifecycle import running
+        from .outbound import outbox
+        from .settings import BOT_API_URL
+        from .storage import set_storage
+
+        if BOT_API_URL != os.environ["VITYA_BOT_API_URL"]:
+            raise RuntimeError("Bot settings were loaded before the harness configured them")
+        # The storage metrics wrapper keeps raw durations for the report.
+        storage_timings: dict[str, list[float]] = {}
+        storage = configure_storage(storage_timings)
+        set_storage(storage)
+        storage.initialize()
+        application = build_application(with_updater=False)
+        # The fake API has no global limit; per-chat limits still apply.
+        outbox.set_global_rate(outbound_rate, max(1, int(outbound_rate)))
+        probe = Probe()
+        probe.attach(application)
+        async with running(application):
+            yield Harness(application, storage_timings, probe)
+    finally:
+        await api.stop()
+
+
+def format_report(harness: Harness, api: FakeBotApi, offered: str) -> str:
+    probe = harness.probe
+    timings = {
+        name: values
+        for name, values in harness.storage_timings.items()
+        if name not in TIMED_STORAGE_SKIP
+    }
+    db_calls = [value for values in timings.values() for value in values]
+    lines = [
+        f"{probe.sent} updates offered {offered}, {probe.completed} handled in "
+        f"{probe.elapsed:.2f}s ({probe.throughput:.0f} updates/s), {len(probe.errors)} errors",
+        _latency_line("latency", probe.latencies),
+        _latency_line("handler", probe.handler_times),
+        _latency_line("db", db_calls) + f" calls={len(db_calls)} total={sum(db_calls):.2f}s",
+    ]
+    slowest = sorted(timings.items(), key=lambda item: sum(item[1]), reverse=True)
+    for name, values in slowest[:5]:
+        lines.append(_latency_line(f"  {name}", values) + f" calls={len(values)}")
+    lines.append(
+        "bot api: "
+        + ", ".join(f"{method} {count}" for method, count in sorted(api.calls.items()))
+        + f", 429 injected {api.throttled}"
+    )
+    return "\n".join(lines)
+
+
+def check_gates(probe: Probe, args: argparse.Namespace) -> list[str]:
+    failures = []
+    if probe.errors:
+        failures.append(f"{len(probe.errors)} handler errors: {probe.errors[0]!r}")
+    if probe.completed < probe.sent:
+        failures.append(f"{probe.sent - probe.completed} updates were not handled")
+    p99 = _percentiles(probe.latencies)[99] * 1000
+    if args.max_p99_ms is not None and p99 > args.max_p99_ms:
+        failures.append(f"p99 latency {p99:.1f}ms is above {args.max_p99_ms:g}ms")
+    if args.min_throughput is not None and probe.throughput < args.min_throughput:
+        failures.append(
+            f"throughput {probe.throughput:.0f}/s is below {args.min_throughput:g}/s"
+        )
+    return failures
+
+
+def add_harness_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--throttle", type=float, default=0.0, help="share of 429 answers")
+    parser.add_argument("--api-latency-ms", type=float, default=0.0)
+    parser.add_argument(
+        "--outbound-rate", type=float, default=1000.0, help="global messages per second"
+    )
+    parser.add_argument("--storage", choices=("sqlite", "memory"), default="sqlite")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--write-behind", action="store_true")
+    parser.add_argument("--drain-timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--max-p99-ms", type=float, default=None)
+    parser.add_argument("--min-throughput", type=float, default=None)
+
+
+def run_harness(
+    parser: argparse.ArgumentParser,
+    args: argparse.Namespace,
+    drive: Callable[[FakeBotApi], Awaitable[list[str]]],
+    db_path: str | None = None,
+) -> None:
+    # Points the bot at a scratch database (or the given copy), runs drive()
+    # and exits non-zero when it reports failed gates.
+    scratch = tempfile.mkdtemp(prefix="vitya-harness-")
+    os.environ.update(
+        TELEGRAM_BOT_TOKEN=TOKEN,
+        VITYA_DB_PATH=db_path or os.path.join(scratch, "harness.sqlite"),
+        VITYA_STORAGE=args.storage,
+        VITYA_CONCURRENT_UPDATES=str(args.concurrency),
+        VITYA_WRITE_BEHIND="1" if args.write_behind else "0",
+        VITYA_WORKERS="1",
+        VITYA_RNG_SEED=str(args.seed),
+        VITYA_RECORD_DIR="",
+    )
+    logging.basicConfig(format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    # Injected 429s are counted in the report instead.
+    logging.getLogger("bot.outbound").setLevel(logging.ERROR)
+    api = FakeBotApi(args.throttle, args.api_latency_ms / 1000, args.seed)
+    try:
+        failures = asyncio.run(drive(api))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    if failures:
+        parser.exit(1, "".join(f"FAIL: {failure}\n" for failure in failures))
+
+
+async def _load(args: argparse.Namespace, api: FakeBotApi) -> list[str]:
+    generator = LoadGenerator(
+        api, args.users, args.chats, args.private_share, args.mix, args.seed
+    )
+    rng = random.Random(args.seed)
+    total = int(args.rate * args.duration)
+    event_tasks = set()
+    async with running_bot(api, args.outbound_rate) as harness:
+        from .events import trigger_event
+
+        probe = harness.probe
+        probe.start()
+        next_event = probe.began
+        while probe.sent < total:
+            now = time.perf_counter()
+            if args.event_every and now >= next_event:
+                chat_id = generator.group_chat(rng.randrange(args.users) + 1)
+                task = asyncio.create_task(trigger_event(chat_id))
+                event_tasks.add(task)
+                task.add_done_callback(event_tasks.discard)
+                next_event += args.event_every
+            due = min(total, int((now - probe.began) * args.rate) + 1)
+            while probe.sent < due:
+                probe.submit(harness.application, generator.next_update())
+            await asyncio.sleep(0.001)
+        await probe.drain(args.drain_timeout)
+        await asyncio.gather(*event_tasks, return_exceptions=True)
+    print(format_report(harness, api, f"at {args.rate:g}/s"))
+    print("mix: " + ", ".join(f"{kind} {count}" for kind, count in generator.kinds.most_common()))
+    return check_gates(probe, args)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="bot.py loadtest",
+        description="Drive the bot with synthetic updates against a local fake Bot API.",
+    )
+    parser.add_argument("--rate", type=float, default=300.0, help="updates per second")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of load")
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--chats", type=int, default=2_000)
+    parser.add_argument("--private-share", type=float, default=0.1)
+    parser.add_argument("--mix", type=_parse_mix, default=_parse_mix(DEFAULT_MIX))
+    parser.add_argument(
+        "--event-every", type=float, default=0.5, help="seconds between forced events"
+    )
+    add_harness_arguments(parser)
+    args = parser.parse_args(argv)
+    run_harness(parser, args, partial(_load, args))
+
+
+if __name__ == "__main__":
+    main()
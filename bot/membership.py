@@ -0,0 +1,61 @@
+from collections import OrderedDict
+
+from telegram.ext import ContextTypes
+
+from .leaderboards import invalidate_group
+from .ranks import index_group_member
+from .settings import MEMBERSHIP_CACHE_SIZE
+from .storage import get_storage
+
+_seen: OrderedDict[tuple[int, int], None] = OrderedDict()
+_pending: dict[int, set[int]] = {}
+
+
+def remember_group_member(group_id: int, user_id: int) -> bool:
+    key = (group_id, user_id)
+    if key in _seen:
+        _seen.move_to_end(key)
+        return False
+    _seen[key] = None
+    if len(_seen) > MEMBERSHIP_CACHE_SIZE:
+        _seen.popitem(last=False)
+    return True
+
+
+def note_group_member(group_id: int, user_id: int) -> None:
+    if remember_group_member(group_id, user_id):
+        _pending.setdefault(group_id, set()).add(user_id)
+
+
+async def _insert_group_members(batch: list[tuple[int, int]]) -> None:
+    try:
+        await get_storage().insert_group_members(batch)
+    except Exception:
+        for group_id, user_id in batch:
+            _pending.setdefault(group_id, set()).add(user_id)
+        raise
+    for group_id, user_id in batch:
+        index_group_member(group_id, user_id)
+    for group_id in {group_id for group_id, _user_id in batch}:
+        invalidate_group(group_id)
+
+
+async def flush_group_members(context: ContextTypes.DEFAULT_TYPE | None = None) -> None:
+    if not _pending:
+        return
+    batch = [(group_id, user_id) for group_id, user_ids in _pending.items() for user_id in user_ids]
+    _pending.clear()
+    await _insert_group_members(batch)
+
+
+async def flush_chat_members(group_id: int) -> None:
+    # /top and /rank need only their own chat on disk; a repeated command by a
+    # known member finds nothing pending and stays free of queries.
+    user_ids = _pending.pop(group_id, None)
+    if user_ids:
+        await _insert_group_members([(group_id, user_id) for user_id in user_ids])
+
+
+async def warm_membership_cache() -> None:
+    for group_id, user_id in await get_storage().get_group_memberships(MEMBERSHIP_CACHE_SIZE):
+        remember_group_member(group_id, user_id)
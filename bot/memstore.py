@@ -0,0 +1,233 @@
+import heapq
+import itertools
+from typing import AsyncIterator
+
+from .models import BeatResult, BoardRow, ClickResult, EventClick, UserRecord, UserRow, UserState
+
+
+class MemoryStorage:
+    # Keeps everything in dicts and never touches the disk. It mirrors the
+    # SQLite engine's behaviour, including the no-op updates for unknown
+    # users, so handler logic can be benchmarked and tested without I/O.
+    def __init__(self) -> None:
+        self._users: dict[int, UserRecord] = {}
+        self._groups: dict[int, set[int]] = {}
+        self._chat_events: dict[int, int] = {}
+        self._events: dict[int, list] = {}
+        self._clicks: dict[int, set[int]] = {}
+        self._event_ids = itertools.count(1)
+        # user_id -> change number, oldest first, like changed_seq in SQLite.
+        self._changed: dict[int, int] = {}
+        self._change_seq = 0
+
+    def initialize(self) -> None:
+        pass
+
+    async def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    def _mark_changed(self, user_id: int) -> None:
+        self._change_seq += 1
+        self._changed.pop(user_id, None)
+        self._changed[user_id] = self._change_seq
+
+    def _upsert(self, user_id: int, username: str | None, first_name: str | None) -> UserRecord:
+        record = self._users.get(user_id)
+        if record is None:
+            record = self._users[user_id] = UserRecord()
+            self._mark_changed(user_id)
+        elif (record.username, record.first_name) != (username, first_name):
+            self._mark_changed(user_id)
+        record.set_profile(username, first_name)
+        return record
+
+    async def upsert_user(self, user_id: int, username: str | None, first_name: str | None) -> None:
+        self._upsert(user_id, username, first_name)
+
+    async def get_user_state(self, user_id: int) -> UserState:
+        record = self._users.get(user_id)
+        return (record or UserRecord()).state()
+
+    async def get_user_row(self, user_id: int) -> UserRow | None:
+        record = self._users.get(user_id)
+        return None if record is None else record.row(user_id)
+
+    async def save_user_rows(self, rows: list[UserRow]) -> None:
+        for user_id, *fields in rows:
+            old_row = self._board_row(user_id) if user_id in self._users else None
+            self._users[user_id] = UserRecord(*fields)
+            if self._board_row(user_id) != old_row:
+                self._mark_changed(user_id)
+
+    async def perform_beat(
+        self,
+        user_id: int,
+        username: str | None,
+        first_name: str | None,
+        group_id: int | None,
+        roll: int,
+        now_ts: int,
+        store_profile: bool = True,
+    ) -> BeatResult:
+        record = self._users.get(user_id)
+        if store_profile or record is None:
+            record = self._upsert(user_id, username, first_name)
+        if group_id is not None:
+            self._groups.setdefault(group_id, set()).add(user_id)
+        power = record.power
+        result = record.beat(roll, now_ts)
+        if record.power != power:
+            self._mark_changed(user_id)
+        return result
+
+    async def buy_boost(self, user_id: int, boost: str, cost: int, multiplier: float) -> str:
+        record = self._users.get(user_id)
+        if record is None:
+            return "poor"
+        return record.buy_boost(boost, cost, multiplier)
+
+    async def insert_group_members(self, members: list[tuple[int, int]]) -> None:
+        for group_id, user_id in members:
+            self._groups.setdefault(group_id, set()).add(user_id)
+
+    async def get_group_memberships(self, limit: int) -> list[tuple[int, int]]:
+        pairs = (
+            (group_id, user_id)
+            for group_id, user_ids in self._groups.items()
+            for user_id in user_ids
+        )
+        return list(itertools.islice(pairs, limit))
+
+    def _board_row(self, user_id: int) -> BoardRow:
+        record = self._users[user_id]
+        return record.power, user_id, record.username, record.first_name
+
+    async def get_group_board(self, group_id: int, limit: int) -> tuple[list[BoardRow], set[int]]:
+        member_ids = set(self._groups.get(group_id, ()))
+        rows = heapq.nlargest(
+            limit,
+            (self._board_row(user_id) for user_id in member_ids if user_id in self._users),
+            key=lambda row: row[0],
+        )
+        return rows, member_ids
+
+    async def get_global_leaderboard(self, limit: int = 10) -> list[BoardRow]:
+        return heapq.nlargest(
+            limit,
+            (self._board_row(user_id) for user_id in self._users),
+            key=lambda row: row[0],
+        )
+
+    async def get_user_powers(self) -> list[tuple[int, int]]:
+        return [(user_id, record.power) for user_id, record in self._users.items()]
+
+    async def get_user_changes(self, since: int, limit: int) -> tuple[int, list[BoardRow]]:
+        changed = []
+        for user_id, seq in reversed(self._changed.items()):
+            if seq <= since:
+                break
+            changed.append(user_id)
+        changed.reverse()
+        return self._change_seq, [self._board_row(user_id) for user_id in changed[:limit]]
+
+    async def get_group_member_ids(self, group_id: int) -> list[int]:
+        return list(self._groups.get(group_id, ()))
+
+    async def iter_chat_event_schedules(
+        self,
+        chunk_size: int,
+    ) -> AsyncIterator[list[tuple[int, int]]]:
+        rows = sorted(self._chat_events.items())
+        for start in range(0, len(rows), chunk_size):
+            yield rows[start:start + chunk_size]
+
+    async def get_next_event_ts(self, chat_id: int) -> int | None:
+        return self._chat_events.get(chat_id)
+
+    async def ensure_chat_event_row(self, chat_id: int, next_event_ts: int) -> int:
+        return self._chat_events.setdefault(chat_id, next_event_ts)
+
+    async def start_event(
+        self,
+        chat_id: int,
+        event_type: str,
+        start_ts: int,
+        end_ts: int,
+        next_event_ts: int,
+    ) -> int:
+        if chat_id in self._chat_events:
+            self._chat_events[chat_id] = next_event_ts
+        event_id = next(self._event_ids)
+        self._events[event_id] = [chat_id, event_type, start_ts, end_ts, None]
+        return event_id
+
+    async def set_event_message(self, event_id: int, message_id: int) -> bool:
+        event = self._events.get(event_id)
+        if event is None:
+            return False
+        event[4] = message_id
+        return True
+
+    async def get_event_with_clicks(self, event_id: int) -> tuple[int, str, int, set[int]] | None:
+        event = self._events.get(event_id)
+        if event is None:
+            return None
+        return event[0], event[1], event[3], set(self._clicks.get(event_id, ()))
+
+    async def record_event_clicks(self, event_id: int, user_ids: list[int]) -> None:
+        if event_id in self._events:
+            self._clicks.setdefault(event_id, set()).update(user_ids)
+
+    async def apply_event_clicks(
+        self,
+        event_id: int,
+        clicks: list[EventClick],
+        cooldown_multiplier: float,
+        now_ts: int,
+    ) -> list[ClickResult]:
+        await self.record_event_clicks(event_id, [click[0] for click in clicks])
+        results: list[ClickResult] = []
+        for user_id, username, first_name, store_profile, power_delta in clicks:
+            record = self._users.get(user_id)
+            if store_profile:
+                record = self._upsert(user_id, username, first_name)
+            if power_delta is not None:
+                if record is None:
+                    results.append((power_delta, power_delta, None))
+                    continue
+                record.power += power_delta
+                record.respect_points += 1
+                if power_delta:
+                    self._mark_changed(user_id)
+                results.append((power_delta, record.power, None))
+                continue
+            if record is None:
+                results.append((None, None, 0))
+                continue
+            results.append((None, None, record.shorten_cooldown(cooldown_multiplier, now_ts)))
+        return results
+
+    async def pop_expired_events(
+        self,
+        now_ts: int,
+        limit: int,
+        partition: tuple[int, int] | None = None,
+    ) -> list[tuple[int, int, int | None]]:
+        expired = heapq.nsmallest(
+            limit,
+            (
+                (event[3], event_id)
+                for event_id, event in self._events.items()
+                if event[3] <= now_ts
+                and (partition is None or abs(event[0]) % partition[1] == partition[0])
+            ),
+        )
+        popped = []
+        for _end_ts, event_id in expired:
+            chat_id, _event_type, _start_ts, _end_ts, message_id = self._events.pop(event_id)
+            self._clicks.pop(event_id, None)
+            popped.append((event_id, chat_id, message_id))
+        return popped
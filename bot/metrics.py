@@ -0,0 +1,276 @@
+import bisect
+import functools
+import inspect
+import logging
+import threading
+import time
+from typing import Any, Callable
+
+from telegram.ext import Application
+
+from .settings import METRICS_LISTEN, METRICS_PATH, METRICS_PORT
+from .web import HttpServer, Request, Response
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LAG_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# Metrics are kept in plain dicts keyed by label values and rendered in the
+# Prometheus text format on request. Observations may come from the database
+# writer thread, so every metric guards its series with a lock.
+_registry: list["_Metric"] = []
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _label_text(self, values: tuple[Any, ...], extra: tuple[tuple[str, str], ...] = ()) -> str:
+        pairs = [*zip(self.labels, values), *extra]
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = ()) -> None:
+        super().__init__(name, help_text, labels)
+        self._values: dict[tuple[Any, ...], float] = {}
+
+    def inc(self, *labels: Any, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            lines.append(f"{self.name}{self._label_text(labels)} {_number(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> None:
+        super().__init__(name, help_text, labels)
+        self._buckets = buckets
+        self._series: dict[tuple[Any, ...], list] = {}
+
+    def observe(self, value: float, *labels: Any) -> None:
+        index = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self._buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        with self._lock:
+            snapshot = [
+                (labels, list(counts), total, count)
+                for labels, (counts, total, count) in self._series.items()
+            ]
+        for labels, counts, total, count in snapshot:
+            cumulative = 0
+            for bound, bucket in zip(self._buckets, counts):
+                cumulative += bucket
+                le = self._label_text(labels, (("le", _number(bound)),))
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            le = self._label_text(labels, (("le", "+Inf"),))
+            lines.append(f"{self.name}_bucket{le} {count}")
+            lines.append(f"{self.name}_sum{self._label_text(labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{self._label_text(labels)} {count}")
+        return lines
+
+
+class Gauge(_Metric):
+    # Read from a callback at scrape time; modules owning the value set it.
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str) -> None:
+        super().__init__(name, help_text)
+        self._read: Callable[[], float] | None = None
+
+    def set_function(self, read: Callable[[], float]) -> None:
+        self._read = read
+
+    def render(self) -> list[str]:
+        if self._read is None:
+            return []
+        try:
+            value = self._read()
+        except Exception:
+            logger.exception("Failed to read gauge %s", self.name)
+            return []
+        return [*super().render(), f"{self.name} {_number(value)}"]
+
+
+HANDLER_SECONDS = Histogram(
+    "vitya_handler_seconds", "Time spent in update handlers.", ("handler",)
+)
+HANDLER_ERRORS = Counter(
+    "vitya_handler_errors_total", "Update handlers that raised.", ("handler",)
+)
+STORAGE_SECONDS = Histogram(
+    "vitya_storage_seconds", "Time spent in storage calls, including queueing.", ("method",)
+)
+STORAGE_ERRORS = Counter(
+    "vitya_storage_errors_total", "Storage calls that raised.", ("method",)
+)
+DB_COMMIT_SECONDS = Histogram(
+    "vitya_db_commit_seconds", "Time the writer thread spends on one group commit."
+)
+DB_COMMIT_BATCH = Histogram(
+    "vitya_db_commit_batch_size", "Writes per group commit.", buckets=SIZE_BUCKETS
+)
+DB_WRITE_QUEUE = Gauge("vitya_db_write_queue", "Writes waiting for the writer thread.")
+SCHEDULER_LAG = Histogram(
+    "vitya_scheduler_lag_seconds",
+    "Delay between a scheduled callback's due time and its start.",
+    ("job",),
+    LAG_BUCKETS,
+)
+SCHEDULER_FAILURES = Counter(
+    "vitya_scheduler_failures_total", "Scheduled callbacks that raised.", ("job",)
+)
+OUTBOUND_QUEUE_SECONDS = Histogram(
+    "vitya_outbound_queue_seconds",
+    "Time from submitting a Bot API call to sending it.",
+    ("method",),
+    LAG_BUCKETS,
+)
+OUTBOUND_SECONDS = Histogram(
+    "vitya_outbound_seconds", "Bot API call duration.", ("method",)
+)
+OUTBOUND_ERRORS = Counter(
+    "vitya_outbound_errors_total", "Failed Bot API calls.", ("method", "reason")
+)
+OUTBOUND_QUEUE = Gauge("vitya_outbound_queue", "Bot API calls waiting in the outbox.")
+ACTIVE_EVENTS = Gauge("vitya_active_events", "Events currently loaded for clicks.")
+PENDING_UPDATES = Gauge("vitya_pending_updates", "Updates received but not yet handled.")
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def _timed_handler(callback: Callable[..., Any]) -> Callable[..., Any]:
+    name = callback.__name__
+
+    @functools.wraps(callback)
+    async def timed(update: object, context: Any) -> Any:
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, name)
+
+    return timed
+
+
+def instrument_handlers(application: Application) -> None:
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            handler.callback = _timed_handler(handler.callback)
+
+
+class InstrumentedStorage:
+    # Wraps a storage engine and times every coroutine method on it. The load
+    # test passes `timings` to also keep every raw duration per method.
+    def __init__(self, base: Any, timings: dict[str, list[float]] | None = None) -> None:
+        self._base = base
+        self._timings = timings
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._base, name)
+        if not inspect.iscoroutinefunction(attr):
+            return attr
+
+        async def timed(*args: Any, **kwargs: Any) -> Any:
+            started = time.perf_counter()
+            try:
+                return await attr(*args, **kwargs)
+            except Exception:
+                STORAGE_ERRORS.inc(name)
+                raise
+            finally:
+                elapsed = time.perf_counter() - started
+                STORAGE_SECONDS.observe(elapsed, name)
+                if self._timings is not None:
+                    self._timings.setdefault(name, []).append(elapsed)
+
+        setattr(self, name, timed)
+        return timed
+
+
+_server: HttpServer | None = None
+_port = METRICS_PORT
+
+
+def set_metrics_port(port: int) -> None:
+    global _port
+    _port = port
+
+
+async def _metrics_handler(request: Request) -> Response:
+    if request.method != "GET":
+        return Response(405)
+    return Response(200, render_metrics().encode(), "text/plain; version=0.0.4; charset=utf-8")
+
+
+async def start_metrics_server() -> None:
+    global _server
+    if not _port or _server is not None:
+        return
+    _server = HttpServer(
+        {METRICS_PATH: _metrics_handler},
+        max_connections=8,
+        max_body_bytes=0,
+        idle_timeout=30.0,
+    )
+    await _server.start(METRICS_LISTEN, _port)
+
+
+async def stop_metrics_server() -> None:
+    global _server
+    if _server is not None:
+        await _server.stop()
+        _server = None
@@ -1,5 +1,12 @@
 from dataclasses import dataclass
-import random
+
+from .settings import COOLDOWN_SECONDS
+
+UserRow = tuple[int, str | None, str | None, int, int, int, float, float, int]
+UserState = tuple[int, int, int, float, float, int]
+BoardRow = tuple[int, int, str | None, str | None]
+EventClick = tuple[int, str | None, str | None, bool, int | None]
+ClickResult = tuple[int | None, int | None, int | None]
 
 
 @dataclass(frozen=True)
@@ -10,12 +17,6 @@ class Outcome:
     power_max: int
     messages: tuple[str, ...]
 
-    def roll_power(self) -> int:
-        return random.randint(self.power_min, self.power_max)
-
-    def message(self) -> str:
-        return random.choice(self.messages)
-
 
 @dataclass(frozen=True)
 class EventSpec:
@@ -24,4 +25,108 @@ class EventSpec:
     description: str
     button_text: str
     power_multiplier: float = 1.0
-    cooldown_multiplier: float = 1.0
\ No newline at end of file
+    cooldown_multiplier: float = 1.0
+
+
+@dataclass(frozen=True)
+class BeatResult:
+    remaining_cooldown: int
+    ready_at: int
+    power_delta: int = 0
+    new_total: int = 0
+    power_multiplier: float = 1.0
+    cooldown_multiplier: float = 1.0
+
+
+class UserRecord:
+    __slots__ = (
+        "username",
+        "first_name",
+        "power",
+        "last_hit_ts",
+        "respect_points",
+        "power_multiplier",
+        "cooldown_multiplier",
+        "cooldown_seconds",
+    )
+
+    def __init__(
+        self,
+        username: str | None = None,
+        first_name: str | None = None,
+        power: int = 0,
+        last_hit_ts: int = 0,
+        respect_points: int = 0,
+        power_multiplier: float = 1.0,
+        cooldown_multiplier: float = 1.0,
+        cooldown_seconds: int = COOLDOWN_SECONDS,
+    ) -> None:
+        self.username = username
+        self.first_name = first_name
+        self.power = power
+        self.last_hit_ts = last_hit_ts
+        self.respect_points = respect_points
+        self.power_multiplier = power_multiplier
+        self.cooldown_multiplier = cooldown_multiplier
+        self.cooldown_seconds = cooldown_seconds
+
+    def state(self) -> UserState:
+        return (
+            self.power,
+            self.last_hit_ts,
+            self.respect_points,
+            self.power_multiplier,
+            self.cooldown_multiplier,
+            self.cooldown_seconds,
+        )
+
+    def row(self, user_id: int) -> UserRow:
+        return (user_id, self.username, self.first_name, *self.state())
+
+    def set_profile(self, username: str | None, first_name: str | None) -> None:
+        self.username = username
+        self.first_name = first_name
+
+    def beat(self, roll: int, now_ts: int) -> BeatResult:
+        remaining = self.last_hit_ts + self.cooldown_seconds - now_ts
+        if remaining > 0:
+            return BeatResult(remaining_cooldown=remaining, ready_at=now_ts + remaining)
+        power_multiplier = self.power_multiplier
+        cooldown_multiplier = self.cooldown_multiplier
+        power_delta = roll
+        if power_multiplier != 1.0:
+            power_delta = int(round(roll * power_multiplier))
+        self.power += power_delta
+        self.last_hit_ts = now_ts
+        self.cooldown_seconds = int(COOLDOWN_SECONDS * cooldown_multiplier)
+        self.respect_points += 1
+        self.power_multiplier = 1.0
+        self.cooldown_multiplier = 1.0
+        return BeatResult(
+            remaining_cooldown=0,
+            ready_at=now_ts + self.cooldown_seconds,
+            power_delta=power_delta,
+            new_total=self.power,
+            power_multiplier=power_multiplier,
+            cooldown_multiplier=cooldown_multiplier,
+        )
+
+    def buy_boost(self, boost: str, cost: int, multiplier: float) -> str:
+        current = self.power_multiplier if boost == "vodka" else self.cooldown_multiplier
+        if current != 1.0:
+            return "active"
+        if self.respect_points < cost:
+            return "poor"
+        self.respect_points -= cost
+        if boost == "vodka":
+            self.power_multiplier = multiplier
+        else:
+            self.cooldown_multiplier = multiplier
+        return "bought"
+
+    def shorten_cooldown(self, multiplier: float, now_ts: int) -> int:
+        remaining = max(self.cooldown_seconds - (now_ts - self.last_hit_ts), 0)
+        new_remaining = int(remaining * multiplier)
+        if remaining > 0:
+            self.last_hit_ts = now_ts - (self.cooldown_seconds - new_remaining)
+        return new_remaining
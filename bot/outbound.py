@@ -0,0 +1,256 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Hashable
+
+from telegram import Bot
+from telegram.error import RetryAfter
+
+from .metrics import OUTBOUND_ERRORS, OUTBOUND_QUEUE, OUTBOUND_QUEUE_SECONDS, OUTBOUND_SECONDS
+from .settings import (
+    OUTBOUND_GLOBAL_BURST,
+    OUTBOUND_GLOBAL_PER_SECOND,
+    OUTBOUND_GROUP_BURST,
+    OUTBOUND_GROUP_PER_MINUTE,
+    OUTBOUND_PRIVATE_BURST,
+    OUTBOUND_PRIVATE_PER_SECOND,
+    OUTBOUND_STOP_TIMEOUT_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_REPLY = 0
+PRIORITY_EVENT = 1
+PRIORITY_BACKGROUND = 2
+
+
+class _Bucket:
+    __slots__ = ("rate", "burst", "tokens", "refilled", "blocked_until")
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.refilled = time.monotonic()
+        self.blocked_until = 0.0
+
+    def ready_in(self, now: float) -> float:
+        self.tokens = min(float(self.burst), self.tokens + (now - self.refilled) * self.rate)
+        self.refilled = now
+        wait = (1.0 - self.tokens) / self.rate if self.tokens < 1.0 else 0.0
+        return max(wait, self.blocked_until - now)
+
+    def take(self) -> None:
+        self.tokens -= 1.0
+
+    def is_idle(self, now: float) -> bool:
+        return self.ready_in(now) == 0.0 and self.tokens >= self.burst
+
+
+@dataclass(order=True)
+class _Item:
+    priority: int
+    seq: int
+    method: Callable[..., Awaitable[Any]] = field(compare=False)
+    chat_id: int = field(compare=False)
+    kwargs: dict[str, Any] = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    coalesce_key: Hashable | None = field(compare=False, default=None)
+    queued_at: float = field(compare=False, default_factory=time.monotonic)
+
+
+def _retrieve(future: asyncio.Future) -> None:
+    if not future.cancelled():
+        future.exception()
+
+
+class Outbox:
+    # Every outbound Bot API call goes through one dispatcher task. A global
+    # token bucket and one bucket per chat keep us under Telegram's limits;
+    # among chats that have a token, the item with the best (priority, seq)
+    # is sent next. Items sharing a coalesce key collapse into the newest one.
+    def __init__(self) -> None:
+        self._queues: dict[int, list[_Item]] = {}
+        self._buckets: dict[int, _Bucket] = {}
+        self._coalesced: dict[Hashable, _Item] = {}
+        self._global = _Bucket(OUTBOUND_GLOBAL_PER_SECOND, OUTBOUND_GLOBAL_BURST)
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._sending: set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return sum(len(items) for items in self._queues.values())
+
+    def set_global_rate(self, rate: float, burst: int) -> None:
+        self._global = _Bucket(rate, burst)
+
+    def submit(
+        self,
+        method: Callable[..., Awaitable[Any]],
+        chat_id: int,
+        kwargs: dict[str, Any],
+        priority: int = PRIORITY_REPLY,
+        coalesce_key: Hashable | None = None,
+    ) -> asyncio.Future:
+        if coalesce_key is not None:
+            queued = self._coalesced.get(coalesce_key)
+            if queued is not None:
+                queued.method = method
+                queued.kwargs = kwargs
+                return queued.future
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_retrieve)
+        item = _Item(priority, next(self._seq), method, chat_id, kwargs, future, coalesce_key)
+        heapq.heappush(self._queues.setdefault(chat_id, []), item)
+        if coalesce_key is not None:
+            self._coalesced[coalesce_key] = item
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="outbox")
+        self._wakeup.set()
+        return future
+
+    async def stop(self) -> None:
+        deadline = time.monotonic() + OUTBOUND_STOP_TIMEOUT_SECONDS
+        while (self._queues or self._sending) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _bucket(self, chat_id: int) -> _Bucket:
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            if chat_id < 0:
+                bucket = _Bucket(OUTBOUND_GROUP_PER_MINUTE / 60, OUTBOUND_GROUP_BURST)
+            else:
+                bucket = _Bucket(OUTBOUND_PRIVATE_PER_SECOND, OUTBOUND_PRIVATE_BURST)
+            self._buckets[chat_id] = bucket
+        return bucket
+
+    def _prune_buckets(self, now: float) -> None:
+        for chat_id in [
+            chat_id
+            for chat_id, bucket in self._buckets.items()
+            if chat_id not in self._queues and bucket.is_idle(now)
+        ]:
+            del self._buckets[chat_id]
+
+    async def _run(self) -> None:
+        while True:
+            if not self._queues:
+                self._prune_buckets(time.monotonic())
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            now = time.monotonic()
+            wait = self._global.ready_in(now)
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            best: list[_Item] | None = None
+            best_chat = 0
+            wait = float("inf")
+            for chat_id, items in self._queues.items():
+                ready_in = self._bucket(chat_id).ready_in(now)
+                if ready_in > 0:
+                    wait = min(wait, ready_in)
+                elif best is None or items[0] < best[0]:
+                    best, best_chat = items, chat_id
+            if best is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            item = heapq.heappop(best)
+            if not best:
+                del self._queues[best_chat]
+            if item.coalesce_key is not None and self._coalesced.get(item.coalesce_key) is item:
+                del self._coalesced[item.coalesce_key]
+            self._global.take()
+            self._bucket(best_chat).take()
+            task = asyncio.create_task(self._deliver(item))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _deliver(self, item: _Item) -> None:
+        name = item.method.__name__
+        started = time.monotonic()
+        OUTBOUND_QUEUE_SECONDS.observe(started - item.queued_at, name)
+        try:
+            result = await item.method(**item.kwargs)
+        except RetryAfter as exc:
+            OUTBOUND_ERRORS.inc(name, "retry_after")
+            retry_after = float(exc.retry_after)
+            logger.warning("Flood limit hit in chat %s, retrying in %ss", item.chat_id, retry_after)
+            self._bucket(item.chat_id).blocked_until = time.monotonic() + retry_after
+            heapq.heappush(self._queues.setdefault(item.chat_id, []), item)
+            self._wakeup.set()
+            return
+        except Exception as exc:
+            OUTBOUND_ERRORS.inc(name, "error")
+            logger.warning("Outbound call to chat %s failed: %s", item.chat_id, exc)
+            if not item.future.done():
+                item.future.set_exception(exc)
+            return
+        finally:
+            OUTBOUND_SECONDS.observe(time.monotonic() - started, name)
+        if not item.future.done():
+            item.future.set_result(result)
+
+
+outbox = Outbox()
+OUTBOUND_QUEUE.set_function(lambda: len(outbox))
+
+
+def send_message(
+    bot: Bot,
+    chat_id: int,
+    text: str,
+    priority: int = PRIORITY_REPLY,
+    coalesce_key: Hashable | None = None,
+    **kwargs: Any,
+) -> asyncio.Future:
+    return outbox.submit(
+        bot.send_message,
+        chat_id,
+        {"chat_id": chat_id, "text": text, **kwargs},
+        priority,
+        coalesce_key,
+    )
+
+
+def edit_message_text(
+    bot: Bot,
+    chat_id: int,
+    message_id: int,
+    text: str,
+    priority: int = PRIORITY_REPLY,
+    coalesce_key: Hashable | None = None,
+    **kwargs: Any,
+) -> asyncio.Future:
+    return outbox.submit(
+        bot.edit_message_text,
+        chat_id,
+        {"chat_id": chat_id, "message_id": message_id, "text": text, **kwargs},
+        priority,
+        coalesce_key,
+    )
+
+
+def delete_message(bot: Bot, chat_id: int, message_id: int) -> asyncio.Future:
+    return outbox.submit(
+        bot.delete_message,
+        chat_id,
+        {"chat_id": chat_id, "message_id": message_id},
+        PRIORITY_BACKGROUND,
+    )
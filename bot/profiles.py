@@ -0,0 +1,32 @@
+from collections import OrderedDict
+
+from .leaderboards import record_profile
+from .ranks import index_user
+from .settings import PROFILE_CACHE_SIZE
+from .storage import get_storage
+
+_profiles: OrderedDict[int, int] = OrderedDict()
+
+
+def profile_changed(user_id: int, username: str | None, first_name: str | None) -> bool:
+    stored = _profiles.get(user_id)
+    if stored is None or stored != hash((username, first_name)):
+        return True
+    _profiles.move_to_end(user_id)
+    return False
+
+
+def remember_profile(user_id: int, username: str | None, first_name: str | None) -> None:
+    _profiles[user_id] = hash((username, first_name))
+    _profiles.move_to_end(user_id)
+    if len(_profiles) > PROFILE_CACHE_SIZE:
+        _profiles.popitem(last=False)
+
+
+async def sync_user(user_id: int, username: str | None, first_name: str | None) -> None:
+    if not profile_changed(user_id, username, first_name):
+        return
+    await get_storage().upsert_user(user_id, username, first_name)
+    remember_profile(user_id, username, first_name)
+    record_profile(user_id, username, first_name)
+    index_user(user_id)
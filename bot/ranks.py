@@ -0,0 +1,147 @@
+from collections import OrderedDict
+
+from .groups import group_members
+from .settings import RANK_GROUP_CACHE_SIZE, RANK_GROUP_INITIAL_SPAN, RANK_INITIAL_SPAN
+from .storage import get_storage
+
+
+class PowerIndex:
+    # Fenwick tree over integer power values: tree position i counts users
+    # whose power is `low + i - 1`, so rank and next-player lookups are O(log n).
+    def __init__(self, initial_span: int = RANK_INITIAL_SPAN) -> None:
+        self.powers: dict[int, int] = {}
+        self.low = -initial_span // 2
+        self.tree = [0] * (initial_span + 1)
+
+    def load(self, rows: list[tuple[int, int]]) -> None:
+        self.powers = {user_id: power for user_id, power in rows}
+        if self.powers:
+            self._reshape(min(self.powers.values()), max(self.powers.values()))
+        else:
+            self._rebuild()
+
+    def _reshape(self, low: int, high: int) -> None:
+        size = len(self.tree) - 1
+        while size < 2 * (high - low + 1):
+            size *= 2
+        self.low = low - (size - (high - low + 1)) // 2
+        self.tree = [0] * (size + 1)
+        self._rebuild()
+
+    def _rebuild(self) -> None:
+        size = len(self.tree) - 1
+        tree = [0] * (size + 1)
+        for power in self.powers.values():
+            tree[power - self.low + 1] += 1
+        for i in range(1, size + 1):
+            parent = i + (i & -i)
+            if parent <= size:
+                tree[parent] += tree[i]
+        self.tree = tree
+
+    def _ensure_range(self, power: int) -> None:
+        high = self.low + len(self.tree) - 2
+        if self.low <= power <= high:
+            return
+        self._reshape(min(self.low, power), max(high, power))
+
+    def _add(self, power: int, delta: int) -> None:
+        i = power - self.low + 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def count_at_most(self, power: int) -> int:
+        i = min(power - self.low + 1, len(self.tree) - 1)
+        total = 0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def kth_smallest(self, k: int) -> int:
+        pos = 0
+        step = 1 << (len(self.tree) - 1).bit_length()
+        while step:
+            nxt = pos + step
+            if nxt < len(self.tree) and self.tree[nxt] < k:
+                pos = nxt
+                k -= self.tree[nxt]
+            step >>= 1
+        return self.low + pos
+
+    def set_power(self, user_id: int, power: int) -> None:
+        old = self.powers.get(user_id)
+        if old == power:
+            return
+        self._ensure_range(power)
+        if old is not None:
+            self._add(old, -1)
+        self.powers[user_id] = power
+        self._add(power, 1)
+
+    def rank(self, user_id: int) -> tuple[int, int, int, int | None]:
+        power = self.powers.get(user_id, 0)
+        total = len(self.powers)
+        at_most = self.count_at_most(power)
+        above = total - at_most
+        next_power = self.kth_smallest(at_most + 1) if above else None
+        return power, above + 1, total, next_power
+
+
+power_index = PowerIndex()
+# Per-group indexes for the most recently ranked groups. Members come from the
+# database and powers from power_index; members without a user row (they only
+# ever sent plain text) are tracked but not ranked, like in the database join.
+_group_indexes: OrderedDict[int, PowerIndex] = OrderedDict()
+
+
+def _drop_group_index(group_id: int) -> None:
+    if _group_indexes.pop(group_id, None) is not None:
+        group_members.release(group_id, "rank")
+
+
+def _index_group_power(group_id: int, user_id: int) -> None:
+    power = power_index.powers.get(user_id)
+    if power is not None:
+        _group_indexes[group_id].set_power(user_id, power)
+
+
+async def load_power_index() -> None:
+    power_index.load(await get_storage().get_user_powers())
+    for group_id in list(_group_indexes):
+        _drop_group_index(group_id)
+
+
+def index_power(user_id: int, power: int) -> None:
+    power_index.set_power(user_id, power)
+    for group_id in group_members.groups_of(user_id):
+        index = _group_indexes.get(group_id)
+        if index is not None:
+            index.set_power(user_id, power)
+
+
+def index_user(user_id: int) -> None:
+    if user_id not in power_index.powers:
+        index_power(user_id, 0)
+
+
+def index_group_member(group_id: int, user_id: int) -> None:
+    group_members.add(group_id, user_id)
+    if group_id in _group_indexes:
+        _index_group_power(group_id, user_id)
+
+
+async def group_rank(group_id: int, user_id: int) -> tuple[int, int, int | None]:
+    if group_id not in _group_indexes:
+        member_ids = await get_storage().get_group_member_ids(group_id)
+        _group_indexes[group_id] = PowerIndex(RANK_GROUP_INITIAL_SPAN)
+        group_members.claim(group_id, "rank", member_ids)
+        for member_id in group_members.members(group_id):
+            _index_group_power(group_id, member_id)
+        while len(_group_indexes) > RANK_GROUP_CACHE_SIZE:
+            _drop_group_index(next(iter(_group_indexes)))
+    _group_indexes.move_to_end(group_id)
+    index_group_member(group_id, user_id)
+    _power, place, total, next_power = _group_indexes[group_id].rank(user_id)
+    return place, total, next_power
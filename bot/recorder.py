@@ -0,0 +1,279 @@
+import asyncio
+import gzip
+import hashlib
+import heapq
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from typing import Any, Iterable, Iterator
+
+from telegram import Update
+
+from .settings import (
+    BOOST_COSTS,
+    RECORD_ANONYMIZE,
+    RECORD_FILE_MAX_BYTES,
+    RECORD_KEEP_FILES,
+    TOKEN,
+)
+
+logger = logging.getLogger(__name__)
+
+RECORD_PREFIX = "updates-"
+RECORD_SUFFIX = ".jsonl.gz"
+_NAME_FIELDS = {"first_name", "last_name", "username", "title", "forward_sender_name"}
+_TEXT_FIELDS = {"text", "caption", "question", "explanation", "bio"}
+_COMMAND_FIELDS = {"text", "caption"}
+_ID_FIELDS = {"user_id", "chat_id", "user_ids", "chat_ids"}
+_ID_SUFFIXES = ("_user_id", "_chat_id")
+# Strings that describe the update rather than the people in it; every other
+# string is hashed and every float (coordinates, accuracy) is zeroed.
+_KEPT_FIELDS = {
+    "type", "data", "callback_data", "status", "chat_type", "language_code", "mime_type", "emoji",
+}
+
+
+def _key() -> bytes:
+    # Pseudonyms must agree across files and worker processes, and must not be
+    # reversible without the bot token.
+    return hashlib.blake2b((TOKEN or "").encode(), digest_size=32).digest()
+
+
+def _pseudonym(value: int, key: bytes) -> int:
+    digest = hashlib.blake2b(str(value).encode(), digest_size=6, key=key).digest()
+    pseudonym = int.from_bytes(digest, "big") % 10**12 + 1
+    return -pseudonym if value < 0 else pseudonym
+
+
+def _hashed(value: str, key: bytes) -> str:
+    return hashlib.blake2b(value.encode(), digest_size=6, key=key).hexdigest()
+
+
+def _entities_field(name: str) -> str:
+    return "entities" if name == "text" else f"{name}_entities"
+
+
+def _is_id_field(name: str) -> bool:
+    return name in _ID_FIELDS or name.endswith(_ID_SUFFIXES)
+
+
+def _is_int(value: Any) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _command(text: str) -> str:
+    # Arguments are free text, except the boost names /buy takes.
+    words = text.split()
+    return " ".join(words[:1] + [word for word in words[1:2] if word.lower() in BOOST_COSTS])
+
+
+def anonymize(data: Any, key: bytes) -> Any:
+    # Users and chats keep stable fake ids and names. Free text becomes "."
+    # so handlers still see a text message, and commands keep only the
+    # command itself. Phone numbers, addresses, file ids and anything else
+    # unknown are hashed.
+    if isinstance(data, list):
+        return [anonymize(item, key) for item in data]
+    if not isinstance(data, dict):
+        return data
+    is_entity = "is_bot" in data or "type" in data
+    result = {}
+    scrubbed = []
+    trimmed = []
+    for name, value in data.items():
+        if isinstance(value, bool):
+            pass
+        elif _is_int(value) and (_is_id_field(name) or (name == "id" and is_entity)):
+            value = _pseudonym(value, key)
+        elif isinstance(value, list) and _is_id_field(name):
+            value = [_pseudonym(item, key) if _is_int(item) else item for item in value]
+        elif isinstance(value, float):
+            value = 0.0
+        elif not isinstance(value, str):
+            value = anonymize(value, key)
+        elif name in _NAME_FIELDS:
+            value = f"{name}_{_hashed(value, key)}"
+        elif name in _TEXT_FIELDS:
+            if name in _COMMAND_FIELDS and value.lstrip().startswith("/"):
+                value = _command(value)
+                trimmed.append(name)
+            else:
+                value = "."
+                scrubbed.append(name)
+        elif name not in _KEPT_FIELDS:
+            value = _hashed(value, key)
+        result[name] = value
+    for name in scrubbed:
+        result.pop(_entities_field(name), None)
+    for name in trimmed:
+        entities = result.get(_entities_field(name))
+        if isinstance(entities, list):
+            size = len(result[name])
+            result[_entities_field(name)] = [
+                entity
+                for entity in entities
+                if isinstance(entity, dict)
+                and entity.get("offset", size) + entity.get("length", 0) <= size
+            ]
+    return result
+
+
+class UpdateRecorder:
+    # Incoming updates are timestamped on the event loop and written by a
+    # background thread as gzip'd JSON lines, one {"t": ..., "u": ...} object
+    # per update. A new file is started every RECORD_FILE_MAX_BYTES of JSON
+    # and only the newest RECORD_KEEP_FILES files of this process are kept.
+    def __init__(
+        self,
+        anonymize_updates: bool = RECORD_ANONYMIZE,
+        max_bytes: int = RECORD_FILE_MAX_BYTES,
+        keep_files: int = RECORD_KEEP_FILES,
+    ) -> None:
+        self._anonymize = anonymize_updates
+        self._max_bytes = max_bytes
+        self._keep_files = keep_files
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread: threading.Thread | None = None
+        self._directory = ""
+        self._prefix = RECORD_PREFIX
+        self._files = 0
+
+    def start(self, directory: str) -> None:
+        if self._thread is not None:
+            return
+        os.makedirs(directory, exist_ok=True)
+        self._directory = directory
+        self._prefix = f"{RECORD_PREFIX}{multiprocessing.current_process().name}-"
+        self._thread = threading.Thread(target=self._run, name="update-recorder", daemon=True)
+        self._thread.start()
+        logger.info("Recording updates to %s", directory)
+
+    async def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        await asyncio.get_running_loop().run_in_executor(None, self._thread.join)
+        self._thread = None
+
+    def record(self, update: Update) -> None:
+        if self._thread is not None:
+            self._queue.put((time.time(), update.to_dict()))
+
+    def _run(self) -> None:
+        key = _key()
+        output = None
+        written = 0
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    return
+                try:
+                    timestamp, data = item
+                    if self._anonymize:
+                        data = anonymize(data, key)
+                    line = json.dumps(
+                        {"t": round(timestamp, 3), "u": data},
+                        ensure_ascii=False,
+                        separators=(",", ":"),
+                    )
+                    encoded = (line + "\n").encode()
+                    if output is None or written >= self._max_bytes:
+                        if output is not None:
+                            output.close()
+                        output = self._open()
+                        written = 0
+                    output.write(encoded)
+                    written += len(encoded)
+                    if self._queue.empty():
+                        output.flush()
+                except Exception:
+                    logger.exception("Failed to record an update")
+        finally:
+            if output is not None:
+                output.close()
+
+    def _open(self) -> gzip.GzipFile:
+        self._files += 1
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.gmtime())
+        name = f"{self._prefix}{stamp}-{self._files:06d}{RECORD_SUFFIX}"
+        output = gzip.open(os.path.join(self._directory, name), "wb")
+        self._prune()
+        return output
+
+    def _prune(self) -> None:
+        names = sorted(
+            name
+            for name in os.listdir(self._directory)
+            if name.startswith(self._prefix) and name.endswith(RECORD_SUFFIX)
+        )
+        for name in names[:-self._keep_files]:
+            try:
+                os.remove(os.path.join(self._directory, name))
+            except OSError:
+                logger.warning("Could not remove old recording %s", name)
+
+
+class RecordingQueue(asyncio.Queue):
+    # Used as the application's update queue, so updates are recorded on
+    # arrival in every run mode, before they wait for a handler.
+    def __init__(self, recorder: UpdateRecorder) -> None:
+        super().__init__()
+        self._recorder = recorder
+
+    def put_nowait(self, item: Any) -> None:
+        if isinstance(item, Update):
+            self._recorder.record(item)
+        super().put_nowait(item)
+
+
+recorder = UpdateRecorder()
+
+
+def recording_files(paths: Iterable[str]) -> list[str]:
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(
+                os.path.join(path, name)
+                for name in sorted(os.listdir(path))
+                if name.startswith(RECORD_PREFIX) and name.endswith(RECORD_SUFFIX)
+            )
+        else:
+            files.append(path)
+    return files
+
+
+def _read_file(path: str) -> Iterator[tuple[float, dict[str, Any]]]:
+    # A file that was being written when the bot died ends mid-stream; its
+    # readable part is still replayed.
+    with gzip.open(path, "rt", encoding="utf-8") as recording:
+        try:
+            for line in recording:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    logger.warning("Skipping a truncated line in %s", path)
+                    continue
+                yield entry["t"], entry["u"]
+        except EOFError:
+            logger.warning("%s ends early, it was probably still being written", path)
+
+
+def read_recordings(paths: Iterable[str]) -> Iterator[tuple[float, dict[str, Any]]]:
+    # Files of one process follow each other in time; files of different
+    # worker processes overlap and are merged by timestamp.
+    by_process: dict[str, list[str]] = {}
+    for path in recording_files(paths):
+        name = os.path.basename(path)
+        process = name[len(RECORD_PREFIX):].rsplit("-", 3)[0]
+        by_process.setdefault(process, []).append(path)
+    streams = [
+        (entry for path in sorted(files) for entry in _read_file(path))
+        for files in by_process.values()
+    ]
+    return heapq.merge(*streams, key=lambda entry: entry[0])
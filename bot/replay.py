@@ -0,0 +1,85 @@
+import argparse
+import asyncio
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from contextlib import closing
+from functools import partial
+
+from .loadtest import (
+    FakeBotApi,
+    add_harness_arguments,
+    check_gates,
+    format_report,
+    run_harness,
+    running_bot,
+)
+
+# Replays recorded updates (see recorder.py) through the real handlers, with
+# their original spacing divided by --speed. Only the arrival times are
+# compressed: cooldowns and event timers still run on the wall clock.
+
+
+def copy_database(source: str, target: str) -> None:
+    # The backup API gives a consistent copy even while the bot is writing.
+    with closing(sqlite3.connect(f"file:{source}?mode=ro", uri=True)) as origin:
+        with closing(sqlite3.connect(target)) as copy:
+            origin.backup(copy)
+
+
+async def _replay(args: argparse.Namespace, api: FakeBotApi) -> list[str]:
+    async with running_bot(api, args.outbound_rate) as harness:
+        from .recorder import read_recordings
+
+        probe = harness.probe
+        probe.start()
+        first = None
+        for timestamp, data in read_recordings(args.paths):
+            if args.limit and probe.sent >= args.limit:
+                break
+            if first is None:
+                first = timestamp
+            if args.speed > 0:
+                delay = probe.began + (timestamp - first) / args.speed - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            elif probe.sent % 100 == 0:
+                await asyncio.sleep(0)
+            probe.submit(harness.application, data)
+        await probe.drain(args.drain_timeout)
+    offered = f"at {args.speed:g}x" if args.speed > 0 else "as fast as possible"
+    print(format_report(harness, api, offered))
+    return check_gates(probe, args)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="bot.py replay",
+        description="Replay recorded updates against a copy of the database.",
+    )
+    parser.add_argument("paths", nargs="+", help="recording files or directories")
+    parser.add_argument("--db", help="SQLite database to copy before replaying")
+    parser.add_argument(
+        "--speed", type=float, default=10.0, help="time compression, 0 for no pauses"
+    )
+    parser.add_argument("--limit", type=int, default=0, help="stop after this many updates")
+    add_harness_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.db and args.storage != "sqlite":
+        parser.error("--db needs --storage sqlite")
+
+    scratch = tempfile.mkdtemp(prefix="vitya-replay-")
+    try:
+        db_path = None
+        if args.db:
+            db_path = os.path.join(scratch, "replay.sqlite")
+            copy_database(args.db, db_path)
+        run_harness(parser, args, partial(_replay, args), db_path)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import random
+from typing import Sequence
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .data import EVENT_SPECS, OUTCOMES
+from .models import EventSpec, Outcome
+from .settings import RNG_SEED, SAMPLER_BATCH_SIZE
+
+
+def build_alias_table(weights: Sequence[float]) -> tuple[list[float], list[int]]:
+    # Vose's variant of Walker's alias method: column i is kept with
+    # probability prob[i] and otherwise replaced by alias[i].
+    count = len(weights)
+    total = float(sum(weights))
+    scaled = [weight * count / total for weight in weights]
+    prob = [1.0] * count
+    alias = list(range(count))
+    small = [index for index, value in enumerate(scaled) if value < 1.0]
+    large = [index for index, value in enumerate(scaled) if value >= 1.0]
+    while small and large:
+        low = small.pop()
+        high = large.pop()
+        prob[low] = scaled[low]
+        alias[low] = high
+        scaled[high] -= 1.0 - scaled[low]
+        (small if scaled[high] < 1.0 else large).append(high)
+    return prob, alias
+
+
+class Sampler:
+    # Every random draw the game makes comes from here. Outcome picks and
+    # uniforms are drawn a batch at a time (with NumPy when it is installed)
+    # and handed out one by one, so a roll costs two list pops. The same seed
+    # on the same backend always yields the same sequence of rolls.
+    def __init__(
+        self,
+        outcomes: Sequence[Outcome],
+        events: Sequence[EventSpec],
+        seed: int | None = None,
+        batch_size: int = SAMPLER_BATCH_SIZE,
+    ) -> None:
+        self._outcomes = tuple(outcomes)
+        self._events = tuple(events)
+        self._prob, self._alias = build_alias_table([outcome.weight for outcome in outcomes])
+        self._batch_size = batch_size
+        if numpy is not None:
+            self._prob_array = numpy.asarray(self._prob)
+            self._alias_array = numpy.asarray(self._alias)
+        self.seed(seed)
+
+    def seed(self, seed: int | None) -> None:
+        self._rng = random.Random(seed)
+        self._np_rng = numpy.random.default_rng(seed) if numpy is not None else None
+        self._picks: list[int] = []
+        self._uniforms: list[float] = []
+
+    def _refill_picks(self) -> None:
+        size = self._batch_size
+        columns_count = len(self._prob)
+        if self._np_rng is not None:
+            columns = self._np_rng.integers(0, columns_count, size)
+            coins = self._np_rng.random(size)
+            keep = coins < self._prob_array[columns]
+            self._picks = numpy.where(keep, columns, self._alias_array[columns]).tolist()
+            return
+        rand = self._rng.random
+        prob = self._prob
+        alias = self._alias
+        picks = []
+        for _ in range(size):
+            column = int(rand() * columns_count)
+            picks.append(column if rand() < prob[column] else alias[column])
+        self._picks = picks
+
+    def _refill_uniforms(self) -> None:
+        if self._np_rng is not None:
+            self._uniforms = self._np_rng.random(self._batch_size).tolist()
+            return
+        rand = self._rng.random
+        self._uniforms = [rand() for _ in range(self._batch_size)]
+
+    def _uniform(self) -> float:
+        if not self._uniforms:
+            self._refill_uniforms()
+        return self._uniforms.pop()
+
+    def outcome(self) -> Outcome:
+        if not self._picks:
+            self._refill_picks()
+        return self._outcomes[self._picks.pop()]
+
+    def roll(self) -> tuple[Outcome, int]:
+        outcome = self.outcome()
+        span = outcome.power_max - outcome.power_min + 1
+        return outcome, outcome.power_min + int(self._uniform() * span)
+
+    def message(self, outcome: Outcome) -> str:
+        return outcome.messages[int(self._uniform() * len(outcome.messages))]
+
+    def event(self) -> EventSpec:
+        return self._events[int(self._uniform() * len(self._events))]
+
+
+sampler = Sampler(OUTCOMES, EVENT_SPECS, RNG_SEED)
+
+
+def seed_process(index: int) -> None:
+    # Worker processes get distinct but reproducible streams; without a
+    # configured seed each process is seeded from the OS.
+    if RNG_SEED is not None:
+        sampler.seed(RNG_SEED + index)
@@ -0,0 +1,143 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Any, Awaitable, Callable, Hashable, Iterable
+
+from .metrics import SCHEDULER_FAILURES, SCHEDULER_LAG
+
+logger = logging.getLogger(__name__)
+
+Callback = Callable[..., Awaitable[None]]
+
+
+class EventScheduler:
+    # One asyncio task drives every timed callback from a min-heap keyed on the
+    # due timestamp. Rescheduling a key pushes a new heap entry and bumps the
+    # key's sequence number; stale entries are skipped when they surface.
+    # With max_rate set, due callbacks are released through a token bucket so
+    # a backlog of overdue entries drains in bursts of at most `burst`.
+    def __init__(self, max_rate: float | None = None, burst: int = 1) -> None:
+        self._max_rate = max_rate
+        self._burst = burst
+        self._tokens = float(burst)
+        self._refilled = time.monotonic()
+        self._heap: list[tuple[float, int, Hashable]] = []
+        self._entries: dict[Hashable, tuple[int, Callback, tuple[Any, ...]]] = {}
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._running: set[asyncio.Task] = set()
+
+    def set_rate(self, max_rate: float | None, burst: int) -> None:
+        self._max_rate = max_rate
+        self._burst = burst
+        self._tokens = min(self._tokens, float(burst))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def has(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def schedule(self, key: Hashable, when: float, callback: Callback, *args: Any) -> None:
+        seq = next(self._seq)
+        self._entries[key] = (seq, callback, args)
+        heapq.heappush(self._heap, (when, seq, key))
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._compact()
+        if self._heap[0][1] == seq:
+            self._wakeup.set()
+
+    def schedule_many(
+        self,
+        items: Iterable[tuple[Hashable, float, Callback, tuple[Any, ...]]],
+    ) -> int:
+        count = 0
+        for key, when, callback, args in items:
+            seq = next(self._seq)
+            self._entries[key] = (seq, callback, args)
+            self._heap.append((when, seq, key))
+            count += 1
+        self._compact()
+        self._wakeup.set()
+        return count
+
+    def _compact(self) -> None:
+        live = {seq for seq, _callback, _args in self._entries.values()}
+        self._heap = [item for item in self._heap if item[1] in live]
+        heapq.heapify(self._heap)
+
+    def cancel(self, key: Hashable) -> None:
+        self._entries.pop(key, None)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="event-scheduler")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            when, seq, key = self._heap[0]
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != seq:
+                heapq.heappop(self._heap)
+                continue
+            delay = when - time.time()
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            wait = self._take_token()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            heapq.heappop(self._heap)
+            del self._entries[key]
+            _seq, callback, args = entry
+            task = asyncio.create_task(self._call(key, when, callback, args))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    def _take_token(self) -> float:
+        if self._max_rate is None:
+            return 0.0
+        now = time.monotonic()
+        self._tokens = min(float(self._burst), self._tokens + (now - self._refilled) * self._max_rate)
+        self._refilled = now
+        if self._tokens < 1.0:
+            return (1.0 - self._tokens) / self._max_rate
+        self._tokens -= 1.0
+        return 0.0
+
+    async def _call(
+        self,
+        key: Hashable,
+        when: float,
+        callback: Callback,
+        args: tuple[Any, ...],
+    ) -> None:
+        job = callback.__name__
+        SCHEDULER_LAG.observe(max(0.0, time.time() - when), job)
+        try:
+            await callback(*args)
+        except Exception:
+            SCHEDULER_FAILURES.inc(job)
+            logger.exception("Scheduled callback %s failed", key)
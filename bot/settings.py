@@ -3,14 +3,86 @@ import os
 COOLDOWN_SECONDS = 24 * 60 * 60
 EVENT_INTERVAL_SECONDS = 12 * 60 * 60
 EVENT_DURATION_SECONDS = 5 * 60
+EVENT_RESTORE_CHUNK_SIZE = 5000
+EVENT_MAX_FIRES_PER_SECOND = float(os.getenv("VITYA_EVENT_MAX_FIRES_PER_SECOND", "5"))
+EVENT_FIRE_BURST = 10
+EVENT_SWEEP_SECONDS = 30
+EVENT_SWEEP_BATCH = 500
+EVENT_CLICK_FLUSH_SECONDS = 2.0
+EVENT_CLICK_MAX_ATTEMPTS = 3
+EVENT_SUMMARY_MAX_LINES = 40
+RNG_SEED = int(os.environ["VITYA_RNG_SEED"]) if os.getenv("VITYA_RNG_SEED") else None
+SAMPLER_BATCH_SIZE = 4096
+STORAGE_ENGINE = os.getenv("VITYA_STORAGE", "sqlite")
 DB_PATH = os.getenv("VITYA_DB_PATH", "vityaalkogolik.sqlite")
+DB_READER_THREADS = int(os.getenv("VITYA_DB_READERS", "4"))
+DB_BUSY_TIMEOUT_SECONDS = 30.0
+WRITE_BEHIND = os.getenv("VITYA_WRITE_BEHIND", "0") == "1"
+WRITE_BEHIND_FLUSH_SECONDS = float(os.getenv("VITYA_WRITE_BEHIND_FLUSH_MS", "500")) / 1000
+WRITE_BEHIND_FLUSH_CHANGES = int(os.getenv("VITYA_WRITE_BEHIND_FLUSH_CHANGES", "1000"))
+WRITE_BEHIND_CACHE_SIZE = int(os.getenv("VITYA_WRITE_BEHIND_CACHE_SIZE", "200000"))
+DB_GROUP_COMMIT_SECONDS = float(os.getenv("VITYA_DB_GROUP_COMMIT_MS", "3")) / 1000
+DB_GROUP_COMMIT_MAX_BATCH = 500
+DB_MMAP_SIZE = 256 * 1024 * 1024
+DB_CACHE_SIZE_KIB = 64 * 1024
+MEMBERSHIP_CACHE_SIZE = 200_000
+MEMBERSHIP_FLUSH_SECONDS = 5
+PROFILE_CACHE_SIZE = 200_000
+COOLDOWN_CACHE_SIZE = 200_000
+EARLY_REPLY_BURST = 2
+EARLY_REPLY_REFILL_SECONDS = 30
+LEADERBOARD_SIZE = 10
+LEADERBOARD_CANDIDATES = 50
+LEADERBOARD_GROUP_CACHE_SIZE = 10_000
+RANK_INITIAL_SPAN = 4096
+RANK_GROUP_INITIAL_SPAN = 256
+RANK_GROUP_CACHE_SIZE = 1_000
+LEADERBOARD_EDIT_WINDOW_SECONDS = int(os.getenv("VITYA_LEADERBOARD_EDIT_WINDOW", "300"))
+LEADERBOARD_POSTS_CACHE_SIZE = 20_000
+OUTBOUND_GLOBAL_PER_SECOND = 30.0
+OUTBOUND_GLOBAL_BURST = 30
+OUTBOUND_GROUP_PER_MINUTE = 20.0
+OUTBOUND_GROUP_BURST = 5
+OUTBOUND_PRIVATE_PER_SECOND = 1.0
+OUTBOUND_PRIVATE_BURST = 3
+OUTBOUND_STOP_TIMEOUT_SECONDS = 5.0
 TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+BOT_API_URL = os.getenv("VITYA_BOT_API_URL", "https://api.telegram.org/bot")
+UPDATE_CONCURRENCY = int(os.getenv("VITYA_CONCURRENT_UPDATES", "1"))
+UPDATE_MAX_ADMITTED = 10_000
+WORKER_PROCESSES = int(os.getenv("VITYA_WORKERS", "1"))
+WORKER_INBOX_SIZE = 1000
+WORKER_MAX_BACKLOG = 200
+WORKER_CACHE_REFRESH_SECONDS = 60
+WORKER_CACHE_REFRESH_MAX_ROWS = 50_000
+WORKER_STOP_TIMEOUT_SECONDS = 30.0
+WEBHOOK_MODE = os.getenv("VITYA_MODE", "polling") == "webhook"
+WEBHOOK_URL = os.getenv("VITYA_WEBHOOK_URL")
+WEBHOOK_LISTEN = os.getenv("VITYA_WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("VITYA_WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("VITYA_WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = os.getenv("VITYA_WEBHOOK_SECRET")
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("VITYA_WEBHOOK_MAX_CONNECTIONS", "40"))
+WEBHOOK_MAX_PENDING_UPDATES = int(os.getenv("VITYA_WEBHOOK_MAX_PENDING", "1000"))
+WEBHOOK_MAX_BODY_BYTES = 1024 * 1024
+WEBHOOK_IDLE_TIMEOUT_SECONDS = 60.0
+HEALTH_PATH = "/healthz"
+RECORD_DIR = os.getenv("VITYA_RECORD_DIR") or None
+RECORD_ANONYMIZE = os.getenv("VITYA_RECORD_ANONYMIZE", "0") == "1"
+RECORD_FILE_MAX_BYTES = int(os.getenv("VITYA_RECORD_FILE_MB", "64")) * 1024 * 1024
+RECORD_KEEP_FILES = int(os.getenv("VITYA_RECORD_KEEP_FILES", "48"))
+METRICS_LISTEN = os.getenv("VITYA_METRICS_LISTEN", "127.0.0.1")
+METRICS_PORT = int(os.getenv("VITYA_METRICS_PORT", "0"))
+METRICS_PATH = "/metrics"
 
 BOOST_COSTS = {
     "vodka": 5,
     "time": 5,
 }
+VODKA_BOOST_POWER_MULTIPLIER = 2.0
+TIME_BOOST_COOLDOWN_MULTIPLIER = 0.5
 
 BEAT_ALIASES = {"beat", "hit", "удар", "бей", "ударь", "ударить"}
 TOP_ALIASES = {"top", "leaderboard", "топ", "лидерборд"}
 GLOBAL_ALIASES = {"global", "all", "общий", "общийтоп", "globaltop"}
+RANK_ALIASES = {"rank", "место"}
@@ -0,0 +1,310 @@
+import argparse
+import time
+from dataclasses import dataclass, field
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .data import EVENT_SPECS, OUTCOMES
+from .sampler import build_alias_table
+from .settings import (
+    BOOST_COSTS,
+    COOLDOWN_SECONDS,
+    EVENT_INTERVAL_SECONDS,
+    LEADERBOARD_SIZE,
+    TIME_BOOST_COOLDOWN_MULTIPLIER,
+    VODKA_BOOST_POWER_MULTIPLIER,
+)
+
+DAY_SECONDS = 24 * 60 * 60
+BOOST_POLICIES = ("none", "vodka", "time", "both")
+
+# Plays the game rules from models.py, handlers.py and clicks.py over whole
+# arrays of players at once, one time step at a time. Players check in at
+# random a few times a day and beat whenever they are off cooldown; events
+# fire per chat every EVENT_INTERVAL_SECONDS and a share of the chat clicks.
+
+
+@dataclass(frozen=True)
+class SimulationConfig:
+    players: int = 100_000
+    days: int = 90
+    chats: int = 1_000
+    checks_per_day: float = 3.0
+    event_participation: float = 0.3
+    boost_policy: str = "both"
+    step_seconds: int = 3600
+    seed: int | None = None
+
+
+@dataclass
+class SimulationResult:
+    config: SimulationConfig
+    elapsed: float
+    power: "numpy.ndarray"
+    respect: "numpy.ndarray"
+    beats: "numpy.ndarray"
+    event_clicks: "numpy.ndarray"
+    boosts: dict[str, int]
+    top_churn: list[int] = field(default_factory=list)
+    leader_changes: list[int] = field(default_factory=list)
+    ever_top: int = 0
+
+
+def expected_deltas(multiplier: float) -> tuple[float, float]:
+    # Exact mean and standard deviation of int(round(roll * multiplier)).
+    total = sum(outcome.weight for outcome in OUTCOMES)
+    mean = 0.0
+    square = 0.0
+    for outcome in OUTCOMES:
+        values = range(outcome.power_min, outcome.power_max + 1)
+        share = outcome.weight / total / len(values)
+        for roll in values:
+            delta = int(round(roll * multiplier))
+            mean += share * delta
+            square += share * delta * delta
+    return mean, max(square - mean * mean, 0.0) ** 0.5
+
+
+class _Roller:
+    def __init__(self, rng: "numpy.random.Generator") -> None:
+        prob, alias = build_alias_table([outcome.weight for outcome in OUTCOMES])
+        self._rng = rng
+        self._prob = numpy.asarray(prob)
+        self._alias = numpy.asarray(alias)
+        self._power_min = numpy.array([outcome.power_min for outcome in OUTCOMES])
+        self._span = numpy.array(
+            [outcome.power_max - outcome.power_min + 1 for outcome in OUTCOMES]
+        )
+
+    def roll(self, size: int) -> "numpy.ndarray":
+        columns = self._rng.integers(0, len(self._prob), size)
+        keep = self._rng.random(size) < self._prob[columns]
+        picks = numpy.where(keep, columns, self._alias[columns])
+        offsets = (self._rng.random(size) * self._span[picks]).astype(numpy.int64)
+        return self._power_min[picks] + offsets
+
+
+def _chat_leaders(power: "numpy.ndarray", chat_of: "numpy.ndarray") -> "numpy.ndarray":
+    order = numpy.lexsort((-power, chat_of))
+    first = numpy.ones(len(order), dtype=bool)
+    first[1:] = chat_of[order][1:] != chat_of[order][:-1]
+    return order[first]
+
+
+def _buy(
+    wants: "numpy.ndarray",
+    respect: "numpy.ndarray",
+    pending: "numpy.ndarray",
+    cost: int,
+    multiplier: float,
+) -> "numpy.ndarray":
+    buyers = wants & (respect >= cost) & (pending == 1.0)
+    respect[buyers] -= cost
+    pending[buyers] = multiplier
+    return buyers
+
+
+def run_simulation(config: SimulationConfig) -> SimulationResult:
+    if numpy is None:
+        raise RuntimeError("The simulator needs NumPy: pip install numpy")
+    if config.boost_policy not in BOOST_POLICIES:
+        raise ValueError(f"Unknown boost policy: {config.boost_policy}")
+    started = time.perf_counter()
+    rng = numpy.random.default_rng(config.seed)
+    roller = _Roller(rng)
+    count = config.players
+    step = config.step_seconds
+    steps_per_day = max(1, DAY_SECONDS // step)
+    interval_steps = max(1, EVENT_INTERVAL_SECONDS // step)
+    check_chance = min(1.0, config.checks_per_day / steps_per_day)
+
+    power = numpy.zeros(count, dtype=numpy.int64)
+    respect = numpy.zeros(count, dtype=numpy.int64)
+    last_hit = numpy.full(count, -COOLDOWN_SECONDS, dtype=numpy.int64)
+    cooldown = numpy.full(count, COOLDOWN_SECONDS, dtype=numpy.int64)
+    power_multiplier = numpy.ones(count)
+    cooldown_multiplier = numpy.ones(count)
+    beats = numpy.zeros(count, dtype=numpy.int64)
+    event_clicks = numpy.zeros(count, dtype=numpy.int64)
+    chat_of = numpy.arange(count) % config.chats
+    chat_phase = rng.integers(0, interval_steps, config.chats)
+    spec_multiplier = numpy.array([spec.power_multiplier for spec in EVENT_SPECS])
+    spec_cooldown = numpy.array([spec.cooldown_multiplier for spec in EVENT_SPECS])
+    spec_is_time = numpy.array([spec.event_type == "time" for spec in EVENT_SPECS])
+    boosts = {"vodka": 0, "time": 0}
+    buy_vodka = config.boost_policy in ("vodka", "both")
+    buy_time = config.boost_policy in ("time", "both")
+    # Under "both" each player alternates, so one boost does not use up all
+    # the respect the other one needs.
+    wants_time = numpy.full(count, config.boost_policy == "time")
+
+    result = SimulationResult(
+        config, 0.0, power, respect, beats, event_clicks, boosts
+    )
+    top = numpy.empty(0, dtype=numpy.int64)
+    ever_top = numpy.zeros(count, dtype=bool)
+    leaders = _chat_leaders(power, chat_of)
+
+    for tick in range(config.days * steps_per_day):
+        now = tick * step
+
+        firing = (tick - chat_phase) % interval_steps == 0
+        if firing.any():
+            chat_spec = rng.integers(0, len(EVENT_SPECS), config.chats)
+            clicked = firing[chat_of] & (rng.random(count) < config.event_participation)
+            spec = chat_spec[chat_of]
+            hitters = numpy.flatnonzero(clicked & ~spec_is_time[spec])
+            deltas = numpy.rint(roller.roll(len(hitters)) * spec_multiplier[spec[hitters]])
+            power[hitters] += deltas.astype(numpy.int64)
+            respect[hitters] += 1
+            rewinders = numpy.flatnonzero(clicked & spec_is_time[spec])
+            remaining = numpy.maximum(cooldown[rewinders] - (now - last_hit[rewinders]), 0)
+            shortened = (remaining * spec_cooldown[spec[rewinders]]).astype(numpy.int64)
+            last_hit[rewinders] = numpy.where(
+                remaining > 0,
+                now - (cooldown[rewinders] - shortened),
+                last_hit[rewinders],
+            )
+            event_clicks[clicked] += 1
+
+        ready = (rng.random(count) < check_chance) & (now >= last_hit + cooldown)
+        # Both turns come from the preference at the start of the tick, so a
+        # player who just bought vodka waits for the next beat to buy time.
+        vodka_turn = ready & ~wants_time
+        time_turn = ready & wants_time
+        if buy_vodka:
+            buyers = _buy(
+                vodka_turn, respect, power_multiplier, BOOST_COSTS["vodka"],
+                VODKA_BOOST_POWER_MULTIPLIER,
+            )
+            boosts["vodka"] += int(buyers.sum())
+            wants_time[buyers] = buy_time
+        if buy_time:
+            buyers = _buy(
+                time_turn, respect, cooldown_multiplier, BOOST_COSTS["time"],
+                TIME_BOOST_COOLDOWN_MULTIPLIER,
+            )
+            boosts["time"] += int(buyers.sum())
+            wants_time[buyers] = not buy_vodka
+        hitters = numpy.flatnonzero(ready)
+        deltas = numpy.rint(roller.roll(len(hitters)) * power_multiplier[hitters])
+        power[hitters] += deltas.astype(numpy.int64)
+        last_hit[hitters] = now
+        cooldown[hitters] = (COOLDOWN_SECONDS * cooldown_multiplier[hitters]).astype(numpy.int64)
+        respect[hitters] += 1
+        beats[hitters] += 1
+        power_multiplier[hitters] = 1.0
+        cooldown_multiplier[hitters] = 1.0
+
+        if (tick + 1) % steps_per_day == 0:
+            size = min(LEADERBOARD_SIZE, count)
+            today = numpy.argpartition(-power, size - 1)[:size]
+            if len(top):
+                result.top_churn.append(size - int(numpy.isin(today, top).sum()))
+            top = today
+            ever_top[today] = True
+            today_leaders = _chat_leaders(power, chat_of)
+            result.leader_changes.append(int((today_leaders != leaders).sum()))
+            leaders = today_leaders
+
+    result.ever_top = int(ever_top.sum())
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+def _percentiles(values: "numpy.ndarray") -> str:
+    points = (1, 10, 50, 90, 99)
+    marks = numpy.percentile(values, points)
+    parts = [f"p{point}={mark:.0f}" for point, mark in zip(points, marks)]
+    return (
+        f"mean={values.mean():.1f} sd={values.std():.1f} "
+        + " ".join(parts)
+        + f" min={values.min()} max={values.max()}"
+    )
+
+
+def format_report(result: SimulationResult) -> str:
+    config = result.config
+    player_days = config.players * config.days
+    lines = [
+        f"{config.players} players x {config.days} days in {config.chats} chats, "
+        f"{config.checks_per_day:g} check-ins/day, {config.event_participation:.0%} "
+        f"event participation, boosts: {config.boost_policy}",
+        f"simulated {player_days} player-days in {result.elapsed:.2f}s",
+        "",
+        "expected power per action:",
+    ]
+    mean, deviation = expected_deltas(1.0)
+    lines.append(f"  beat            {mean:+.2f} (sd {deviation:.2f})")
+    mean, deviation = expected_deltas(VODKA_BOOST_POWER_MULTIPLIER)
+    lines.append(f"  beat with vodka {mean:+.2f} (sd {deviation:.2f})")
+    for spec in EVENT_SPECS:
+        if spec.event_type == "time":
+            continue
+        mean, deviation = expected_deltas(spec.power_multiplier)
+        lines.append(f"  event {spec.event_type:<9} {mean:+.2f} (sd {deviation:.2f})")
+    lines += [
+        "",
+        f"power:    {_percentiles(result.power)}",
+        f"respect:  {_percentiles(result.respect)}",
+        f"negative power: {(result.power < 0).mean():.1%} of players",
+        f"beats per player-day: {result.beats.sum() / player_days:.3f}",
+        f"event clicks per player-day: {result.event_clicks.sum() / player_days:.3f}",
+        f"boosts per player-day: vodka {result.boosts['vodka'] / player_days:.3f}, "
+        f"time {result.boosts['time'] / player_days:.3f}",
+        "",
+    ]
+    if result.top_churn:
+        churn = numpy.asarray(result.top_churn)
+        lines.append(
+            f"global top {LEADERBOARD_SIZE}: {churn.mean():.2f} new entries/day "
+            f"(last 7 days {churn[-7:].mean():.2f}), {result.ever_top} players ever in it"
+        )
+    if result.leader_changes:
+        changes = numpy.asarray(result.leader_changes) / config.chats
+        lines.append(
+            f"chat leader changed in {changes.mean():.1%} of chats per day "
+            f"(last 7 days {changes[-7:].mean():.1%})"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: list[str] | None = None) -> None:
+    defaults = SimulationConfig()
+    parser = argparse.ArgumentParser(
+        prog="bot.py simulate",
+        description="Simulate long-term power and respect distributions.",
+    )
+    parser.add_argument("--players", type=int, default=defaults.players)
+    parser.add_argument("--days", type=int, default=defaults.days)
+    parser.add_argument("--chats", type=int, default=defaults.chats)
+    parser.add_argument("--checks-per-day", type=float, default=defaults.checks_per_day)
+    parser.add_argument(
+        "--event-participation", type=float, default=defaults.event_participation
+    )
+    parser.add_argument("--boosts", choices=BOOST_POLICIES, default=defaults.boost_policy)
+    parser.add_argument("--step-seconds", type=int, default=defaults.step_seconds)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    args = parser.parse_args(argv)
+    config = SimulationConfig(
+        players=args.players,
+        days=args.days,
+        chats=min(args.chats, args.players),
+        checks_per_day=args.checks_per_day,
+        event_participation=args.event_participation,
+        boost_policy=args.boosts,
+        step_seconds=args.step_seconds,
+        seed=args.seed,
+    )
+    try:
+        result = run_simulation(config)
+    except RuntimeError as exc:
+        parser.exit(1, f"{exc}\n")
+    print(format_report(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+from typing import AsyncIterator, Protocol
+
+from .db import SqliteStorage
+from .memstore import MemoryStorage
+from .models import BeatResult, BoardRow, ClickResult, EventClick, UserRow, UserState
+from .settings import STORAGE_ENGINE
+
+
+class Storage(Protocol):
+    # Everything the bot keeps between restarts goes through this interface.
+    # initialize() runs before the event loop starts; start() and close() run
+    # inside it, from post_init and post_shutdown.
+    def initialize(self) -> None: ...
+
+    async def start(self) -> None: ...
+
+    async def close(self) -> None: ...
+
+    # Users
+    async def upsert_user(
+        self,
+        user_id: int,
+        username: str | None,
+        first_name: str | None,
+    ) -> None: ...
+
+    async def get_user_state(self, user_id: int) -> UserState: ...
+
+    async def get_user_row(self, user_id: int) -> UserRow | None: ...
+
+    async def save_user_rows(self, rows: list[UserRow]) -> None: ...
+
+    async def perform_beat(
+        self,
+        user_id: int,
+        username: str | None,
+        first_name: str | None,
+        group_id: int | None,
+        roll: int,
+        now_ts: int,
+        store_profile: bool = True,
+    ) -> BeatResult: ...
+
+    async def buy_boost(self, user_id: int, boost: str, cost: int, multiplier: float) -> str: ...
+
+    # Group membership and boards
+    async def insert_group_members(self, members: list[tuple[int, int]]) -> None: ...
+
+    async def get_group_memberships(self, limit: int) -> list[tuple[int, int]]: ...
+
+    async def get_group_board(
+        self,
+        group_id: int,
+        limit: int,
+    ) -> tuple[list[BoardRow], set[int]]: ...
+
+    async def get_global_leaderboard(self, limit: int = 10) -> list[BoardRow]: ...
+
+    async def get_user_powers(self) -> list[tuple[int, int]]: ...
+
+    async def get_user_changes(self, since: int, limit: int) -> tuple[int, list[BoardRow]]: ...
+
+    async def get_group_member_ids(self, group_id: int) -> list[int]: ...
+
+    # Event schedules
+    def iter_chat_event_schedules(
+        self,
+        chunk_size: int,
+    ) -> AsyncIterator[list[tuple[int, int]]]: ...
+
+    async def get_next_event_ts(self, chat_id: int) -> int | None: ...
+
+    async def ensure_chat_event_row(self, chat_id: int, next_event_ts: int) -> int: ...
+
+    # Events and clicks
+    async def start_event(
+        self,
+        chat_id: int,
+        event_type: str,
+        start_ts: int,
+        end_ts: int,
+        next_event_ts: int,
+    ) -> int: ...
+
+    async def set_event_message(self, event_id: int, message_id: int) -> bool: ...
+
+    async def get_event_with_clicks(
+        self,
+        event_id: int,
+    ) -> tuple[int, str, int, set[int]] | None: ...
+
+    async def record_event_clicks(self, event_id: int, user_ids: list[int]) -> None: ...
+
+    async def apply_event_clicks(
+        self,
+        event_id: int,
+        clicks: list[EventClick],
+        cooldown_multiplier: float,
+        now_ts: int,
+    ) -> list[ClickResult]: ...
+
+    async def pop_expired_events(
+        self,
+        now_ts: int,
+        limit: int,
+        partition: tuple[int, int] | None = None,
+    ) -> list[tuple[int, int, int | None]]: ...
+
+
+_storage: Storage = SqliteStorage()
+
+
+def create_storage() -> Storage:
+    if STORAGE_ENGINE == "sqlite":
+        return SqliteStorage()
+    if STORAGE_ENGINE == "memory":
+        return MemoryStorage()
+    raise RuntimeError(f"Unknown storage engine: {STORAGE_ENGINE}")
+
+
+def get_storage() -> Storage:
+    return _storage
+
+
+def set_storage(storage: Storage) -> None:
+    global _storage
+    _storage = storage
@@ -0,0 +1,254 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any
+
+from .leaderboards import change_seq, mark_durable
+from .membership import note_group_member
+from .models import BeatResult, ClickResult, EventClick, UserRecord, UserRow, UserState
+from .settings import (
+    WRITE_BEHIND_CACHE_SIZE,
+    WRITE_BEHIND_FLUSH_CHANGES,
+    WRITE_BEHIND_FLUSH_SECONDS,
+)
+from .storage import Storage
+
+logger = logging.getLogger(__name__)
+
+
+class UserStore:
+    # Hot user rows live in memory. Writes only mark a row dirty; a background
+    # task saves all dirty rows in one transaction every flush interval, or
+    # sooner once enough rows are dirty. Dirty rows and rows being saved are
+    # never evicted, so the database never holds a newer row than memory.
+    # Rows are saved in the order they first changed. Users without a row are
+    # cached as missing until something writes them.
+    def __init__(
+        self,
+        base: Storage,
+        capacity: int,
+        flush_seconds: float,
+        flush_changes: int,
+    ) -> None:
+        self._base = base
+        self._capacity = capacity
+        self._flush_seconds = flush_seconds
+        self._flush_changes = flush_changes
+        self._records: OrderedDict[int, UserRecord] = OrderedDict()
+        self._loading: dict[int, asyncio.Task] = {}
+        self._dirty: dict[int, None] = {}
+        self._saving: dict[int, None] = {}
+        self._missing: set[int] = set()
+        self._flush_lock = asyncio.Lock()
+        self._flush_needed = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    @property
+    def dirty(self) -> int:
+        return len(self._dirty)
+
+    def start(self) -> None:
+        mark_durable(change_seq())
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="user-store-flush")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_needed.wait(), self._flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_needed.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Failed to save %d dirty users", len(self._dirty))
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            batch, self._dirty = self._dirty, {}
+            rows = [self._records[user_id].row(user_id) for user_id in batch]
+            seq = change_seq()
+            self._saving = batch
+            try:
+                await self._base.save_user_rows(rows)
+            except Exception:
+                self._dirty = {**batch, **self._dirty}
+                raise
+            finally:
+                self._saving = {}
+            mark_durable(seq)
+            self._evict()
+
+    async def _load(self, user_id: int) -> None:
+        try:
+            row = await self._base.get_user_row(user_id)
+        finally:
+            del self._loading[user_id]
+        if user_id in self._records:
+            return
+        if row is None:
+            self._records[user_id] = UserRecord()
+            self._missing.add(user_id)
+        else:
+            self._records[user_id] = UserRecord(*row[1:])
+        self._evict()
+
+    async def get(self, user_id: int) -> UserRecord:
+        # Callers must not await between this returning and their last write to
+        # the record; that keeps every read-modify-write atomic on the loop.
+        while True:
+            record = self._records.get(user_id)
+            if record is not None:
+                self._records.move_to_end(user_id)
+                return record
+            task = self._loading.get(user_id)
+            if task is None:
+                task = self._loading[user_id] = asyncio.create_task(self._load(user_id))
+            await asyncio.shield(task)
+
+    async def get_many(self, user_ids: list[int]) -> dict[int, UserRecord]:
+        while True:
+            missing = [user_id for user_id in user_ids if user_id not in self._records]
+            if not missing:
+                return {user_id: self._records[user_id] for user_id in user_ids}
+            await asyncio.gather(*(self.get(user_id) for user_id in missing))
+
+    def exists(self, user_id: int) -> bool:
+        return user_id not in self._missing
+
+    def mark(self, user_id: int) -> None:
+        self._missing.discard(user_id)
+        self._dirty[user_id] = None
+        if len(self._dirty) >= self._flush_changes:
+            self._flush_needed.set()
+
+    def _evict(self) -> None:
+        excess = len(self._records) - self._capacity
+        if excess <= 0:
+            return
+        victims = []
+        for user_id in self._records:
+            if user_id not in self._dirty and user_id not in self._saving:
+                victims.append(user_id)
+                if len(victims) == excess:
+                    break
+        for user_id in victims:
+            del self._records[user_id]
+            self._missing.discard(user_id)
+        if len(victims) < excess:
+            self._flush_needed.set()
+
+
+class WriteBehindStorage:
+    # Wraps another engine: user operations are served by a UserStore in
+    # front of it, everything else is passed straight through.
+    def __init__(self, base: Storage) -> None:
+        self._base = base
+        self._store = UserStore(
+            base,
+            WRITE_BEHIND_CACHE_SIZE,
+            WRITE_BEHIND_FLUSH_SECONDS,
+            WRITE_BEHIND_FLUSH_CHANGES,
+        )
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._base, name)
+
+    async def start(self) -> None:
+        await self._base.start()
+        self._store.start()
+
+    async def close(self) -> None:
+        await self._store.stop()
+        await self._base.close()
+
+    async def upsert_user(self, user_id: int, username: str | None, first_name: str | None) -> None:
+        record = await self._store.get(user_id)
+        record.set_profile(username, first_name)
+        self._store.mark(user_id)
+
+    async def get_user_state(self, user_id: int) -> UserState:
+        return (await self._store.get(user_id)).state()
+
+    async def get_user_row(self, user_id: int) -> UserRow | None:
+        record = await self._store.get(user_id)
+        return record.row(user_id) if self._store.exists(user_id) else None
+
+    async def perform_beat(
+        self,
+        user_id: int,
+        username: str | None,
+        first_name: str | None,
+        group_id: int | None,
+        roll: int,
+        now_ts: int,
+        store_profile: bool = True,
+    ) -> BeatResult:
+        record = await self._store.get(user_id)
+        if group_id is not None:
+            note_group_member(group_id, user_id)
+        if store_profile or not self._store.exists(user_id):
+            record.set_profile(username, first_name)
+            self._store.mark(user_id)
+        result = record.beat(roll, now_ts)
+        if result.remaining_cooldown == 0:
+            self._store.mark(user_id)
+        return result
+
+    async def buy_boost(self, user_id: int, boost: str, cost: int, multiplier: float) -> str:
+        record = await self._store.get(user_id)
+        if not self._store.exists(user_id):
+            return "poor"
+        status = record.buy_boost(boost, cost, multiplier)
+        if status == "bought":
+            self._store.mark(user_id)
+        return status
+
+    async def apply_event_clicks(
+        self,
+        event_id: int,
+        clicks: list[EventClick],
+        cooldown_multiplier: float,
+        now_ts: int,
+    ) -> list[ClickResult]:
+        user_ids = [click[0] for click in clicks]
+        await self._base.record_event_clicks(event_id, user_ids)
+        records = await self._store.get_many(user_ids)
+        results: list[ClickResult] = []
+        for user_id, username, first_name, store_profile, power_delta in clicks:
+            record = records[user_id]
+            if store_profile:
+                record.set_profile(username, first_name)
+                self._store.mark(user_id)
+            elif not self._store.exists(user_id):
+                # No row and no profile to store: nothing is written, as in
+                # the other engines.
+                if power_delta is None:
+                    results.append((None, None, 0))
+                else:
+                    results.append((power_delta, power_delta, None))
+                continue
+            if power_delta is not None:
+                record.power += power_delta
+                record.respect_points += 1
+                results.append((power_delta, record.power, None))
+            else:
+                results.append((None, None, record.shorten_cooldown(cooldown_multiplier, now_ts)))
+            self._store.mark(user_id)
+        return results
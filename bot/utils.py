@@ -1,7 +1,8 @@
-import random
-
-from .data import EVENT_SPECS, OUTCOMES
+from .data import EVENT_SPECS
 from .models import EventSpec, Outcome
+from .sampler import sampler
+
+EVENT_SPECS_BY_TYPE = {spec.event_type: spec for spec in EVENT_SPECS}
 
 
 def get_user_display(username: str | None, first_name: str | None, user_id: int) -> str:
@@ -19,20 +20,19 @@ def format_cooldown(seconds_left: int) -> str:
 
 
 def roll_outcome() -> tuple[Outcome, int]:
-    outcome = random.choices(OUTCOMES, weights=[o.weight for o in OUTCOMES], k=1)[0]
-    power = outcome.roll_power()
-    return outcome, power
+    return sampler.roll()
+
+
+def outcome_message(outcome: Outcome) -> str:
+    return sampler.message(outcome)
 
 
 def get_event_spec(event_type: str) -> EventSpec:
-    for spec in EVENT_SPECS:
-        if spec.event_type == event_type:
-            return spec
-    return EVENT_SPECS[0]
+    return EVENT_SPECS_BY_TYPE.get(event_type, EVENT_SPECS[0])
 
 
 def select_random_event() -> EventSpec:
-    return random.choice(EVENT_SPECS)
+    return sampler.event()
 
 
 def extract_command(text: str) -> str | None:
@@ -43,3 +43,8 @@ def extract_command(text: str) -> str | None:
     if "@" in command:
         command = command.split("@", 1)[0]
     return command.lower()
+
+
+def partition_of(key: int, partitions: int) -> int:
+    # Must match the `abs(chat_id) % count` filter used in SQL.
+    return abs(key) % partitions
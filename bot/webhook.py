@@ -0,0 +1,136 @@
+import asyncio
+import hmac
+import json
+import logging
+import secrets
+from typing import Callable
+
+from telegram import Bot, Update
+from telegram.ext import Application
+
+from .concurrency import KeyedUpdateProcessor
+from .lifecycle import running, stop_event
+from .settings import (
+    HEALTH_PATH,
+    WEBHOOK_IDLE_TIMEOUT_SECONDS,
+    WEBHOOK_LISTEN,
+    WEBHOOK_MAX_BODY_BYTES,
+    WEBHOOK_MAX_CONNECTIONS,
+    WEBHOOK_MAX_PENDING_UPDATES,
+    WEBHOOK_PATH,
+    WEBHOOK_PORT,
+    WEBHOOK_SECRET,
+    WEBHOOK_URL,
+)
+from .web import HttpServer, Request, Response
+
+logger = logging.getLogger(__name__)
+
+
+def update_backlog(application: Application) -> int:
+    backlog = application.update_queue.qsize()
+    processor = application.update_processor
+    if isinstance(processor, KeyedUpdateProcessor):
+        backlog += processor.pending
+    return backlog
+
+
+def _webhook_secret() -> str:
+    # Without a secret anyone who finds the endpoint can forge updates. When
+    # we register the webhook ourselves a random one is enough; a webhook
+    # registered elsewhere has to share it through VITYA_WEBHOOK_SECRET.
+    if WEBHOOK_SECRET:
+        return WEBHOOK_SECRET
+    if WEBHOOK_URL:
+        return secrets.token_urlsafe(32)
+    raise RuntimeError("Webhook mode needs VITYA_WEBHOOK_SECRET or VITYA_WEBHOOK_URL")
+
+
+def _webhook_handler(
+    bot: Bot,
+    update_queue: asyncio.Queue,
+    backlog: Callable[[], int],
+    secret: str,
+):
+    async def handle(request: Request) -> Response:
+        if request.method != "POST":
+            return Response(405)
+        token = request.headers.get("x-telegram-bot-api-secret-token", "")
+        if not hmac.compare_digest(token.encode(), secret.encode()):
+            return Response(403)
+        # Telegram redelivers on any non-2xx answer, so a full queue is pushed
+        # back to it instead of being buffered here without bound.
+        if backlog() >= WEBHOOK_MAX_PENDING_UPDATES:
+            return Response(503, headers={"Retry-After": "1"})
+        # Anything that is not a well-formed update gets a 400 rather than a
+        # 500: Telegram would otherwise redeliver it forever.
+        try:
+            payload = json.loads(request.body)
+        except ValueError:
+            return Response(400)
+        update_id = payload.get("update_id") if isinstance(payload, dict) else None
+        if not isinstance(update_id, int) or isinstance(update_id, bool):
+            return Response(400)
+        try:
+            update = Update.de_json(payload, bot)
+        except Exception as exc:
+            logger.warning("Rejected malformed update %s: %r", update_id, exc)
+            return Response(400)
+        if update is None:
+            return Response(400)
+        update_queue.put_nowait(update)
+        return Response(200)
+
+    return handle
+
+
+def _health_handler(backlog: Callable[[], int], healthy: Callable[[], bool], server: HttpServer):
+    async def handle(request: Request) -> Response:
+        ok = healthy()
+        body = {"ok": ok, "pending_updates": backlog(), "connections": server.connections}
+        return Response(200 if ok else 503, json.dumps(body).encode(), "application/json")
+
+    return handle
+
+
+async def start_webhook_server(
+    bot: Bot,
+    update_queue: asyncio.Queue,
+    backlog: Callable[[], int],
+    healthy: Callable[[], bool],
+) -> HttpServer:
+    secret = _webhook_secret()
+    routes = {}
+    server = HttpServer(
+        routes,
+        max_connections=WEBHOOK_MAX_CONNECTIONS,
+        max_body_bytes=WEBHOOK_MAX_BODY_BYTES,
+        idle_timeout=WEBHOOK_IDLE_TIMEOUT_SECONDS,
+    )
+    routes[WEBHOOK_PATH] = _webhook_handler(bot, update_queue, backlog, secret)
+    routes[HEALTH_PATH] = _health_handler(backlog, healthy, server)
+    await server.start(WEBHOOK_LISTEN, WEBHOOK_PORT)
+    if WEBHOOK_URL:
+        await bot.set_webhook(
+            url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=secret,
+            max_connections=min(WEBHOOK_MAX_CONNECTIONS, 100),
+            allowed_updates=Update.ALL_TYPES,
+        )
+        logger.info("Webhook registered at %s", WEBHOOK_URL)
+    return server
+
+
+async def run_webhook(application: Application) -> None:
+    stopping = stop_event()
+    async with running(application):
+        server = await start_webhook_server(
+            application.bot,
+            application.update_queue,
+            lambda: update_backlog(application),
+            lambda: application.running,
+        )
+        try:
+            await stopping.wait()
+        finally:
+            await server.stop()
@@ -0,0 +1,205 @@
+import asyncio
+import logging
+import multiprocessing
+import queue
+import signal
+import time
+from typing import Any, Callable
+
+from telegram import Bot, Update
+from telegram.ext import Application, ContextTypes, Updater
+
+from .cooldowns import set_shared_cooldowns
+from .events import scheduler, set_partition
+from .leaderboards import invalidate_all, record_power
+from .lifecycle import configure_logging, running, stop_event
+from .metrics import InstrumentedStorage, set_metrics_port
+from .outbound import outbox
+from .ranks import index_power, load_power_index
+from .sampler import seed_process
+from .settings import (
+    BOT_API_URL,
+    EVENT_FIRE_BURST,
+    EVENT_MAX_FIRES_PER_SECOND,
+    METRICS_PORT,
+    OUTBOUND_GLOBAL_BURST,
+    OUTBOUND_GLOBAL_PER_SECOND,
+    TOKEN,
+    WEBHOOK_MODE,
+    WORKER_CACHE_REFRESH_MAX_ROWS,
+    WORKER_CACHE_REFRESH_SECONDS,
+    WORKER_INBOX_SIZE,
+    WORKER_MAX_BACKLOG,
+    WORKER_STOP_TIMEOUT_SECONDS,
+)
+from .storage import create_storage, get_storage, set_storage
+from .utils import partition_of
+from .webhook import start_webhook_server, update_backlog
+
+logger = logging.getLogger(__name__)
+
+# A front process receives updates (polling or webhook) and hands each one to
+# the worker that owns its chat, so every chat's updates, events and outbound
+# buckets live in exactly one process. User rows are shared through SQLite.
+# Every write that depends on a user's current state (beats, event clicks,
+# boost purchases) is a single guarded write transaction in db.py, so one
+# user acting in chats owned by different workers cannot lose an update.
+# Cooldown deadlines cached in cooldowns.py are confirmed against the
+# database before a beat is refused.
+
+
+def _update_key(update: Update) -> int:
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    if update.effective_user is not None:
+        return update.effective_user.id
+    return 0
+
+
+_synced_seq: int | None = None
+
+
+async def refresh_shared_caches(context: ContextTypes.DEFAULT_TYPE | None = None) -> None:
+    # Other workers change powers and names behind our back. Every
+    # WORKER_CACHE_REFRESH_SECONDS the users changed since the last refresh are
+    # applied to leaderboards and ranks like local changes; everything is
+    # reloaded only on the first run or after more than
+    # WORKER_CACHE_REFRESH_MAX_ROWS changes.
+    global _synced_seq
+    if _synced_seq is None:
+        latest, rows = await get_storage().get_user_changes(0, 0)
+    else:
+        latest, rows = await get_storage().get_user_changes(
+            _synced_seq, WORKER_CACHE_REFRESH_MAX_ROWS
+        )
+    if _synced_seq is None or len(rows) >= WORKER_CACHE_REFRESH_MAX_ROWS:
+        invalidate_all()
+        await load_power_index()
+    else:
+        for power, user_id, username, first_name in rows:
+            record_power(user_id, power, username, first_name)
+            index_power(user_id, power)
+    _synced_seq = latest
+
+
+async def _pump(application: Application, inbox: Any) -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        data = await loop.run_in_executor(None, inbox.get)
+        if data is None:
+            return
+        while update_backlog(application) >= WORKER_MAX_BACKLOG:
+            await asyncio.sleep(0.01)
+        update = Update.de_json(data, application.bot)
+        if update is not None:
+            application.update_queue.put_nowait(update)
+
+
+async def _run_worker(application: Application, inbox: Any) -> None:
+    async with running(application):
+        await _pump(application, inbox)
+
+
+def _worker_main(
+    index: int,
+    count: int,
+    inbox: Any,
+    build: Callable[[], Application],
+) -> None:
+    # The front process owns shutdown and tells us to stop through the inbox.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    configure_logging(f"worker-{index}")
+    set_storage(InstrumentedStorage(create_storage()))
+    get_storage().initialize()
+    set_partition(index, count)
+    set_shared_cooldowns(True)
+    if METRICS_PORT:
+        set_metrics_port(METRICS_PORT + index)
+    seed_process(index)
+    outbox.set_global_rate(
+        OUTBOUND_GLOBAL_PER_SECOND / count,
+        max(1, OUTBOUND_GLOBAL_BURST // count),
+    )
+    scheduler.set_rate(EVENT_MAX_FIRES_PER_SECOND / count, max(1, EVENT_FIRE_BURST // count))
+    application = build()
+    application.job_queue.run_repeating(
+        refresh_shared_caches,
+        WORKER_CACHE_REFRESH_SECONDS,
+        first=0,
+        name="refresh_shared_caches",
+    )
+    asyncio.run(_run_worker(application, inbox))
+
+
+async def _dispatch(update_queue: asyncio.Queue, inboxes: list[Any]) -> None:
+    while True:
+        update = await update_queue.get()
+        inbox = inboxes[partition_of(_update_key(update), len(inboxes))]
+        data = update.to_dict()
+        while True:
+            try:
+                inbox.put_nowait(data)
+                break
+            except queue.Full:
+                await asyncio.sleep(0.01)
+
+
+def _stop_workers(workers: list[multiprocessing.Process], inboxes: list[Any]) -> None:
+    deadline = time.monotonic() + WORKER_STOP_TIMEOUT_SECONDS
+    for worker, inbox in zip(workers, inboxes):
+        try:
+            inbox.put(None, timeout=max(0.0, deadline - time.monotonic()))
+        except queue.Full:
+            logger.warning("Worker %s did not drain its inbox, terminating", worker.name)
+            worker.terminate()
+    for worker in workers:
+        worker.join(max(0.0, deadline - time.monotonic()))
+        if worker.is_alive():
+            logger.warning("Worker %s did not stop in time, terminating", worker.name)
+            worker.terminate()
+            worker.join()
+
+
+async def run_workers(count: int, build: Callable[[], Application]) -> None:
+    context = multiprocessing.get_context("spawn")
+    inboxes = [context.Queue(WORKER_INBOX_SIZE) for _ in range(count)]
+    workers = [
+        context.Process(
+            target=_worker_main,
+            args=(index, count, inboxes[index], build),
+            name=f"worker-{index}",
+        )
+        for index in range(count)
+    ]
+    for worker in workers:
+        worker.start()
+    logger.info("Started %d worker processes", count)
+
+    stopping = stop_event()
+    update_queue: asyncio.Queue = asyncio.Queue()
+    dispatcher = asyncio.create_task(_dispatch(update_queue, inboxes), name="dispatch-updates")
+    bot = Bot(TOKEN, base_url=BOT_API_URL)
+    try:
+        async with bot:
+            if WEBHOOK_MODE:
+                server = await start_webhook_server(
+                    bot,
+                    update_queue,
+                    update_queue.qsize,
+                    lambda: all(worker.is_alive() for worker in workers),
+                )
+                await stopping.wait()
+                await server.stop()
+            else:
+                updater = Updater(bot, update_queue)
+                async with updater:
+                    await updater.start_polling(allowed_updates=Update.ALL_TYPES)
+                    await stopping.wait()
+                    await updater.stop()
+        deadline = time.monotonic() + WORKER_STOP_TIMEOUT_SECONDS
+        while not update_queue.empty() and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+    finally:
+        dispatcher.cancel()
+        await asyncio.get_running_loop().run_in_executor(None, _stop_workers, workers, inboxes)
@@ -0,0 +1,42 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from bot import events, storage
+from bot.memstore import MemoryStorage
+from bot.scheduler import EventScheduler
+
+CHAT_ID = -100
+
+
+async def _announce(memory, deleted):
+    async def queued_send(bot, **kwargs):
+        # The sweep runs while the announcement waits behind replies.
+        await events.sweep_expired_events()
+        return SimpleNamespace(message_id=7)
+
+    events.send_message = queued_send
+    events.delete_message = lambda bot, chat_id, message_id: deleted.append((chat_id, message_id))
+    await events.trigger_event(CHAT_ID)
+    return await memory.pop_expired_events(2**40, 10)
+
+
+@pytest.mark.parametrize("duration, swept", [(0, True), (300, False)])
+def test_announcement_delivered_after_the_sweep_is_deleted(monkeypatch, duration, swept):
+    memory = MemoryStorage()
+    monkeypatch.setattr(storage, "_storage", memory)
+    monkeypatch.setattr(events, "scheduler", EventScheduler())
+    monkeypatch.setattr(events, "EVENT_DURATION_SECONDS", duration)
+    monkeypatch.setattr(events, "send_message", events.send_message)
+    monkeypatch.setattr(events, "delete_message", events.delete_message)
+    deleted = []
+    remaining = asyncio.run(_announce(memory, deleted))
+    if swept:
+        assert deleted == [(CHAT_ID, 7)]
+        assert remaining == []
+    else:
+        assert deleted == []
+        assert [(chat_id, message_id) for _event_id, chat_id, message_id in remaining] == [
+            (CHAT_ID, 7)
+        ]
@@ -0,0 +1,35 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _loadtest(*args):
+    # A separate process, because the harness configures the bot through
+    # environment variables that are read when bot.settings is imported.
+    env = {name: value for name, value in os.environ.items() if not name.startswith("VITYA_")}
+    return subprocess.run(
+        [
+            sys.executable, "bot.py", "loadtest",
+            "--duration", "3", "--rate", "100", "--users", "2000", "--chats", "200",
+            "--throttle", "0.02", "--seed", "1", *args,
+        ],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+
+
+def test_loadtest_gates_pass():
+    result = _loadtest("--max-p99-ms", "1000", "--min-throughput", "50")
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert "0 errors" in result.stdout
+
+
+def test_loadtest_gates_fail():
+    result = _loadtest("--min-throughput", "1000000")
+    assert result.returncode == 1
+    assert "FAIL: throughput" in result.stderr
@@ -0,0 +1,84 @@
+import asyncio
+import random
+from collections import OrderedDict
+
+import pytest
+
+from bot import leaderboards, membership, ranks, storage
+from bot.groups import GroupRegistry
+from bot.memstore import MemoryStorage
+from bot.ranks import PowerIndex
+
+USERS = 80
+GROUPS = (-1, -2)
+
+
+def _expected(powers, user_id):
+    power = powers.get(user_id, 0)
+    higher = [value for value in powers.values() if value > power]
+    return 1 + len(higher), len(powers), min(higher) if higher else None
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_power_index_matches_brute_force(seed):
+    rng = random.Random(seed)
+    index = PowerIndex(initial_span=8)
+    powers = {user_id: rng.randint(-20, 20) for user_id in range(50)}
+    index.load(list(powers.items()))
+    for _step in range(3000):
+        user_id = rng.randrange(USERS)
+        powers[user_id] = rng.choice([rng.randint(-3000, 3000), rng.randint(-10, 10)])
+        index.set_power(user_id, powers[user_id])
+        probe = rng.choice(list(powers))
+        _power, place, total, next_power = index.rank(probe)
+        assert (place, total, next_power) == _expected(powers, probe)
+
+
+async def _play_group_ranks(seed):
+    rng = random.Random(seed)
+    powers = {}
+    members = {group_id: set() for group_id in GROUPS}
+    memory = storage.get_storage()
+    await ranks.load_power_index()
+    for step in range(2000):
+        user_id = rng.randint(1, USERS)
+        group_id = rng.choice(GROUPS)
+        op = rng.random()
+        if op < 0.4:
+            result = await memory.perform_beat(user_id, None, None, group_id, rng.randint(-5, 9), 0)
+            members[group_id].add(user_id)
+            powers[user_id] = result.new_total
+            ranks.index_group_member(group_id, user_id)
+            ranks.index_power(user_id, result.new_total)
+        elif op < 0.55:
+            # Plain text from a user who never got a row: a member, but unranked.
+            membership.note_group_member(group_id, user_id)
+            members[group_id].add(user_id)
+            await membership.flush_group_members()
+        elif op < 0.6 and step % 7 == 0:
+            await leaderboards.group_leaderboard_text(group_id, "top")
+        else:
+            await memory.upsert_user(user_id, None, None)
+            powers.setdefault(user_id, 0)
+            ranks.index_user(user_id)
+            membership.note_group_member(group_id, user_id)
+            await membership.flush_chat_members(group_id)
+            members[group_id].add(user_id)
+            place, total, next_power = await ranks.group_rank(group_id, user_id)
+            ranked = {member: powers[member] for member in members[group_id] if member in powers}
+            assert (place, total, next_power) == _expected(ranked, user_id), step
+
+
+@pytest.mark.parametrize("seed", [1, 2])
+def test_group_rank_matches_brute_force(monkeypatch, seed):
+    monkeypatch.setattr(storage, "_storage", MemoryStorage())
+    monkeypatch.setattr(membership, "_seen", OrderedDict())
+    monkeypatch.setattr(membership, "_pending", {})
+    registry = GroupRegistry()
+    monkeypatch.setattr(ranks, "group_members", registry)
+    monkeypatch.setattr(leaderboards, "group_members", registry)
+    monkeypatch.setattr(ranks, "_group_indexes", OrderedDict())
+    monkeypatch.setattr(leaderboards, "_group_boards", OrderedDict())
+    monkeypatch.setattr(ranks, "RANK_GROUP_CACHE_SIZE", 1)
+    monkeypatch.setattr(leaderboards, "LEADERBOARD_GROUP_CACHE_SIZE", 1)
+    asyncio.run(_play_group_ranks(seed))
@@ -0,0 +1,98 @@
+import json
+
+from bot.recorder import anonymize
+
+KEY = b"k" * 32
+
+
+def test_anonymize_scrubs_personal_fields():
+    message = {
+        "message_id": 1,
+        "date": 1,
+        "chat": {"id": -100, "type": "supergroup", "title": "Friends"},
+        "from": {"id": 42, "is_bot": False, "first_name": "Ann", "language_code": "ru"},
+        "caption": "our flat",
+        "caption_entities": [{"type": "bold", "offset": 0, "length": 3}],
+        "contact": {"phone_number": "+79990001122", "first_name": "Bob", "user_id": 7},
+        "venue": {
+            "location": {"latitude": 55.75, "longitude": 37.61},
+            "title": "Home",
+            "address": "Tverskaya 1",
+        },
+        "forward_sender_name": "Carl",
+        "poll": {
+            "id": "p1",
+            "question": "Who drinks?",
+            "options": [{"text": "Dima", "voter_count": 1}],
+            "type": "regular",
+        },
+    }
+    update = {"update_id": 5, "message": message}
+    result = anonymize(update, KEY)
+    dumped = json.dumps(result, ensure_ascii=False)
+    for secret in ("Friends", "Ann", "our flat", "+7999", "Bob", "55.75", "37.61", "Home",
+                   "Tverskaya", "Carl", "Who drinks", "Dima", '"id": 42', '"user_id": 7'):
+        assert secret not in dumped, secret
+    anonymized = result["message"]
+    assert "caption_entities" not in anonymized
+    assert anonymized["chat"]["type"] == "supergroup"
+    assert anonymized["from"]["language_code"] == "ru"
+    assert anonymize(update, KEY) == result
+
+
+def test_anonymize_keeps_commands_and_callback_data():
+    update = {
+        "update_id": 6,
+        "message": {
+            "message_id": 2,
+            "chat": {"id": 1, "type": "private"},
+            "text": "/beat@vitya_bot",
+            "entities": [{"type": "bot_command", "offset": 0, "length": 15}],
+        },
+        "callback_query": {"id": "9", "data": "event:3", "chat_instance": "abc"},
+    }
+    result = anonymize(update, KEY)
+    assert result["message"]["text"] == "/beat@vitya_bot"
+    assert result["message"]["entities"] == update["message"]["entities"]
+    assert result["callback_query"]["data"] == "event:3"
+    assert result["callback_query"]["chat_instance"] != "abc"
+
+
+def test_anonymize_replaces_every_id_field():
+    update = {
+        "update_id": 7,
+        "message": {
+            "message_id": 3,
+            "chat": {"id": -1001, "type": "supergroup"},
+            "sender_chat": {"id": -1002, "type": "channel", "title": "News"},
+            "migrate_to_chat_id": -1003,
+            "migrate_from_chat_id": -1004,
+            "users_shared": {"request_id": 1, "user_ids": [501, 502]},
+            "chat_shared": {"request_id": 2, "chat_id": -1005},
+        },
+        "chat_member": {"chat": {"id": -1001, "type": "supergroup"}, "from_user_id": 503},
+    }
+    result = anonymize(update, KEY)
+    dumped = json.dumps(result)
+    for secret in ("1001", "1002", "1003", "1004", "1005", "501", "502", "503"):
+        assert secret not in dumped, secret
+    message = result["message"]
+    assert message["chat"]["id"] == result["chat_member"]["chat"]["id"]
+    assert message["migrate_from_chat_id"] < 0
+    assert len(message["users_shared"]["user_ids"]) == 2
+    assert (result["update_id"], message["message_id"]) == (7, 3)
+
+
+def test_anonymize_keeps_only_the_command():
+    def message(text, entities):
+        update = {"update_id": 8, "message": {"message_id": 4, "text": text, "entities": entities}}
+        return anonymize(update, KEY)["message"]
+
+    command = {"type": "bot_command", "offset": 0, "length": 5}
+    mention = {"type": "mention", "offset": 11, "length": 6}
+    result = message("/beat Vasya @vasya hard", [command, mention])
+    assert result["text"] == "/beat"
+    assert result["entities"] == [command]
+    buy = {"type": "bot_command", "offset": 0, "length": 4}
+    assert message("/buy VODKA please", [buy])["text"] == "/buy VODKA"
+    assert message("/buy my secret", [buy])["text"] == "/buy"
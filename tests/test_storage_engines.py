@@ -0,0 +1,181 @@
+import asyncio
+import random
+import threading
+from collections import OrderedDict
+
+import pytest
+
+from bot import db, membership, storage
+from bot.memstore import MemoryStorage
+from bot.storage import SqliteStorage
+from bot.userstate import WriteBehindStorage
+
+USERS = 60
+GROUPS = (-1, -2, -3)
+STEPS = 1500
+
+
+def _board(rows):
+    return sorted(rows, key=lambda row: (-row[0], row[1]))
+
+
+async def _collect(storage, events):
+    rows = [await storage.get_user_row(user_id) for user_id in range(1, USERS + 1)]
+    states = [await storage.get_user_state(user_id) for user_id in range(1, USERS + 2)]
+    boards = []
+    for group_id in GROUPS:
+        rows_limited, member_ids = await storage.get_group_board(group_id, 5)
+        full, _member_ids = await storage.get_group_board(group_id, USERS)
+        boards.append(
+            (
+                [row[0] for row in rows_limited],
+                _board(full),
+                member_ids,
+                sorted(await storage.get_group_member_ids(group_id)),
+            )
+        )
+    schedules = []
+    async for chunk in storage.iter_chat_event_schedules(2):
+        schedules.extend(chunk)
+    return {
+        "rows": rows,
+        "states": states,
+        "boards": boards,
+        "global": [row[0] for row in await storage.get_global_leaderboard(7)],
+        "global_full": _board(await storage.get_global_leaderboard(USERS)),
+        "powers": sorted(await storage.get_user_powers()),
+        "changes": sorted((await storage.get_user_changes(0, USERS))[1]),
+        "memberships": sorted(await storage.get_group_memberships(10_000)),
+        "schedules": sorted(schedules),
+        "next": [await storage.get_next_event_ts(group_id) for group_id in GROUPS],
+        "events": [await storage.get_event_with_clicks(event_id) for event_id in events],
+    }
+
+
+async def _nothing():
+    pass
+
+
+async def _play(storage, seed, settle=_nothing):
+    # The same random sequence of storage calls, with every result recorded.
+    # settle() runs before each call; write-behind uses it to reach the
+    # database, which its pass-through reads and leaderboards depend on.
+    storage.initialize()
+    await storage.start()
+    rng = random.Random(seed)
+    now = 1_000_000
+    results = []
+    events = []
+    try:
+        for group_id in GROUPS:
+            results.append(await storage.ensure_chat_event_row(group_id, now + 600))
+        # Change numbers are per engine (write-behind saves several changes to
+        # a user as one), so the feed is compared as the users changed since
+        # an earlier step.
+        cursors = []
+        for step in range(STEPS):
+            await settle()
+            cursors.append((await storage.get_user_changes(0, 0))[0])
+            now += rng.randint(0, 20_000)
+            user_id = rng.randint(1, USERS)
+            group_id = rng.choice(GROUPS)
+            op = rng.random()
+            if op < 0.35:
+                result = await storage.perform_beat(
+                    user_id,
+                    f"user{user_id}",
+                    rng.choice([None, "Name"]),
+                    group_id if rng.random() < 0.7 else None,
+                    rng.randint(-5, 12),
+                    now,
+                    rng.random() < 0.3,
+                )
+                results.append(result)
+            elif op < 0.45:
+                boost = rng.choice(["vodka", "time"])
+                multiplier = 2.0 if boost == "vodka" else 0.5
+                results.append(await storage.buy_boost(user_id, boost, 3, multiplier))
+            elif op < 0.5:
+                results.append(await storage.upsert_user(user_id, f"nick{step}", None))
+            elif op < 0.55:
+                members = [(group_id, rng.randint(1, USERS)) for _ in range(3)]
+                results.append(await storage.insert_group_members(members))
+            elif op < 0.6:
+                event_type = rng.choice(["vodka", "time"])
+                event_id = await storage.start_event(
+                    group_id, event_type, now, now + 3600 + step, now + 7200
+                )
+                events.append((event_id, event_type))
+                results.append(event_id)
+                results.append(await storage.set_event_message(event_id, step))
+            elif op < 0.8 and events:
+                event_id, event_type = rng.choice(events[-4:])
+                clicks = [
+                    (
+                        clicker,
+                        f"user{clicker}",
+                        None,
+                        rng.random() < 0.5,
+                        None if event_type == "time" else rng.randint(1, 9),
+                    )
+                    for clicker in rng.sample(range(1, USERS + 1), 4)
+                ]
+                multiplier = 0.5 if event_type == "time" else 1.0
+                results.append(await storage.apply_event_clicks(event_id, clicks, multiplier, now))
+            elif op < 0.85 and events:
+                event_id, _event_type = rng.choice(events)
+                clickers = rng.sample(range(1, USERS + 1), 3)
+                results.append(await storage.record_event_clicks(event_id, clickers))
+            elif op < 0.9:
+                results.append(await storage.pop_expired_events(now, 3))
+            elif op < 0.93:
+                results.append(await storage.get_user_state(user_id))
+            elif op < 0.97:
+                since = rng.choice(cursors)
+                results.append(sorted((await storage.get_user_changes(since, USERS))[1]))
+            else:
+                results.append(await storage.get_next_event_ts(group_id))
+        await settle()
+        final = await _collect(storage, [event_id for event_id, _event_type in events])
+    finally:
+        await storage.close()
+    return results, final
+
+
+def _use_database(monkeypatch, path):
+    # Reader threads keep a connection per thread; a fresh threading.local
+    # makes them open the new database.
+    monkeypatch.setattr(db, "DB_PATH", str(path))
+    monkeypatch.setattr(db, "_local", threading.local())
+
+
+async def _play_write_behind(seed):
+    write_behind = WriteBehindStorage(SqliteStorage())
+    storage.set_storage(write_behind)
+
+    async def settle():
+        await write_behind._store.flush()
+        await membership.flush_group_members()
+
+    return await _play(write_behind, seed, settle)
+
+
+@pytest.mark.parametrize("engine", ["memory", "write-behind"])
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_engines_agree(tmp_path, monkeypatch, engine, seed):
+    monkeypatch.setattr(db, "DB_GROUP_COMMIT_SECONDS", 0.0)
+    monkeypatch.setattr(storage, "_storage", storage.get_storage())
+    monkeypatch.setattr(membership, "_seen", OrderedDict())
+    monkeypatch.setattr(membership, "_pending", {})
+    _use_database(monkeypatch, tmp_path / "sqlite.sqlite")
+    sqlite_results, sqlite_final = asyncio.run(_play(SqliteStorage(), seed))
+    if engine == "memory":
+        engine_results, engine_final = asyncio.run(_play(MemoryStorage(), seed))
+    else:
+        _use_database(monkeypatch, tmp_path / "write-behind.sqlite")
+        engine_results, engine_final = asyncio.run(_play_write_behind(seed))
+    for step, (expected, actual) in enumerate(zip(sqlite_results, engine_results)):
+        assert actual == expected, f"call {step} differs"
+    assert len(engine_results) == len(sqlite_results)
+    for name, expected in sqlite_final.items():
+        assert engine_final[name] == expected, name
@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+from telegram import Bot
+
+from bot.web import Request
+from bot.webhook import _webhook_handler
+
+SECRET = "s3cret"
+HEADERS = {"x-telegram-bot-api-secret-token": SECRET}
+MESSAGE = b'{"message_id":1,"date":1,"chat":{"id":1,"type":"private"},"text":"/beat"}'
+
+
+async def _post(body, headers=HEADERS):
+    updates = asyncio.Queue()
+    handle = _webhook_handler(Bot("1:abc"), updates, lambda: 0, SECRET)
+    response = await handle(Request("POST", "/telegram", headers, body))
+    return response.status, updates.qsize()
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        b"{bad",
+        b"[]",
+        b"1",
+        b'{"message":{}}',
+        b'{"update_id":"x"}',
+        b'{"update_id":true}',
+        b'{"update_id":2,"message":5}',
+        b'{"update_id":3,"message":{"message_id":"z"}}',
+    ],
+)
+def test_malformed_updates_are_rejected(body):
+    assert asyncio.run(_post(body)) == (400, 0)
+
+
+def test_valid_update_is_queued():
+    assert asyncio.run(_post(b'{"update_id":5,"message":' + MESSAGE + b"}")) == (200, 1)
+
+
+def test_wrong_secret_is_refused():
+    assert asyncio.run(_post(b'{"update_id":5}', {})) == (403, 0)
@@ -0,0 +1,54 @@
+import asyncio
+import threading
+
+from bot import db, leaderboards, ranks, storage, workers
+from bot.storage import SqliteStorage
+
+
+async def _refresh_after_foreign_beats(counts):
+    sqlite = storage.get_storage()
+    sqlite.initialize()
+    await sqlite.start()
+    try:
+        for user_id in range(1, 6):
+            await sqlite.perform_beat(user_id, f"user{user_id}", None, -1, user_id, 10**9)
+        await workers.refresh_shared_caches()
+        assert counts == {"reloads": 1, "boards": 0}
+        assert "user5: 5" in await leaderboards.global_leaderboard_text("top")
+        assert counts["boards"] == 1
+
+        # Another worker beats and renames users; only those rows come back.
+        await sqlite.perform_beat(2, "renamed", None, -1, 100, 2 * 10**9)
+        await sqlite.upsert_user(4, "user4b", None)
+        await workers.refresh_shared_caches()
+        assert counts == {"reloads": 1, "boards": 1}
+        text = await leaderboards.global_leaderboard_text("top")
+        assert text.splitlines()[1] == "1. renamed: 102"
+        assert "user4b: 4" in text
+        assert counts["boards"] == 1
+        assert ranks.power_index.rank(5)[1:3] == (2, 5)
+    finally:
+        await sqlite.close()
+
+
+def test_refresh_applies_only_changed_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "bot.sqlite"))
+    monkeypatch.setattr(db, "_local", threading.local())
+    monkeypatch.setattr(db, "DB_GROUP_COMMIT_SECONDS", 0.0)
+    monkeypatch.setattr(storage, "_storage", SqliteStorage())
+    monkeypatch.setattr(workers, "_synced_seq", None)
+    counts = {"reloads": 0, "boards": 0}
+    load_power_index = workers.load_power_index
+    get_global_leaderboard = SqliteStorage.get_global_leaderboard
+
+    async def counted_load():
+        counts["reloads"] += 1
+        await load_power_index()
+
+    async def counted_board(limit=10):
+        counts["boards"] += 1
+        return await get_global_leaderboard(limit)
+
+    monkeypatch.setattr(workers, "load_power_index", counted_load)
+    monkeypatch.setattr(SqliteStorage, "get_global_leaderboard", staticmethod(counted_board))
+    asyncio.run(_refresh_after_foreign_beats(counts))